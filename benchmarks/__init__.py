@@ -0,0 +1,14 @@
+"""
+Offline benchmarks of wanish. The corpus directory keeps saved pages in different languages, encodings,
+sizes and layouts, images of the pages are served by the local stand-in of imageserver.
+"""
+import os
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+
+def corpus_paths():
+    """
+    :return: sorted paths of the html pages of the corpus
+    """
+    return sorted(os.path.join(CORPUS_DIR, name) for name in os.listdir(CORPUS_DIR) if name.endswith('.html'))
@@ -0,0 +1,225 @@
+"""
+Generates pathological documents of a given size and measures how the stages scale with it.
+
+Usage:
+    python -m benchmarks.adversarial [--kinds nesting,links] [--steps 4] [--repeat 3] [--json] [--write DIR]
+
+For every kind of documents the runtime of the pipeline and of its stages is fitted against the size of the
+document on a log-log scale. The slope is the exponent of the growth: about 1 is linear, about 2 is quadratic.
+"""
+import argparse
+from collections import OrderedDict
+import json
+import math
+import os
+import random
+
+from benchmarks.imageserver import ImageServer
+from benchmarks.pipeline import STAGES, STAGE_PIPELINE, timed_run
+
+WORDS = ("market government city people river company research science water energy policy school student "
+         "health doctor family history music travel weather season report minister court law data network "
+         "software player team match goal economy price growth bank tax election vote").split()
+
+SUPERLINEAR_SLOPE = 1.3  # slopes above it are reported as super-linear
+MIN_FITTED_MS = 0.05  # stages faster than it at the largest size are not fitted, their timings are noise
+
+
+def sentence(rnd):
+    words = [rnd.choice(WORDS) for _ in range(rnd.randint(6, 16))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def paragraphs(rnd, qty, sentences_qty=4):
+    return ''.join('<p>%s</p>\n' % ' '.join(sentence(rnd) for _ in range(sentences_qty)) for _ in range(qty))
+
+
+def page(title, body):
+    return ('<html><head><meta charset="utf-8"><title>%s</title></head>\n<body>\n<h1>%s</h1>\n%s</body></html>'
+            % (title, title, body))
+
+
+def deep_nesting(size, rnd):
+    """
+    Divs nested size levels deep with paragraphs on every level, every div is serialized to check for blocks.
+    """
+    body = paragraphs(rnd, 3)
+    for level in range(size):
+        body = '<div class="level-%d"><p>%s</p>%s</div>' % (level, sentence(rnd), body)
+    return page('Deep nesting', body)
+
+
+def many_sentences(size, rnd):
+    """
+    One article of size sentences, ranked pairwise by the summarizer.
+    """
+    body = paragraphs(rnd, max(size // 5, 1), 5)
+    return page('Many sentences', '<div class="article">%s</div>' % body)
+
+
+def attribute_heavy(size, rnd):
+    """
+    size paragraphs and spans with twenty attributes each, attributes are stripped from the article one per pass.
+    """
+    attributes = ' '.join('data-attr-%d="value %d"' % (i, i) for i in range(18))
+    body = ''.join('<p class="text" id="p%d" %s>%s <span style="color: red" %s>%s</span></p>\n'
+                   % (i, attributes, sentence(rnd), attributes, sentence(rnd)) for i in range(size))
+    return page('Attribute heavy', '<div class="article">%s</div>' % body)
+
+
+def link_farm(size, rnd):
+    """
+    Article paragraphs surrounded by blocks of links, link density is calculated per block.
+    """
+    links = ''.join('<div class="links"><p>%s</p></div>\n' % ' '.join(
+        '<a href="/link/%d/%d">%s %s</a>' % (i, j, rnd.choice(WORDS), rnd.choice(WORDS)) for j in range(10))
+        for i in range(size))
+    return page('Link farm', '<div class="article">%s</div>%s' % (paragraphs(rnd, 10), links))
+
+
+def huge_table(size, rnd):
+    """
+    Table of size rows next to the article
+    """
+    rows = ''.join('<tr><td>%d</td><td>%s</td><td>%s</td></tr>\n' % (i, sentence(rnd), rnd.choice(WORDS))
+                   for i in range(size))
+    return page('Huge table', '<div class="article">%s</div><table>%s</table>' % (paragraphs(rnd, 10), rows))
+
+
+def undimensioned_images(size, rnd):
+    """
+    size images without dimensions in the article, every one is downloaded to get its dimensions
+    """
+    images = ''.join('<p>%s</p><img src="/img/%dx%d/picture-%d.jpg">\n'
+                     % (sentence(rnd), rnd.choice([320, 640, 800]), rnd.choice([240, 360, 480]), i)
+                     for i in range(size))
+    return page('Undimensioned images', '<div class="article">%s%s</div>' % (paragraphs(rnd, 5), images))
+
+
+# generators by kind with the smallest size of a document
+GENERATORS = OrderedDict([
+    ('nesting', (deep_nesting, 25)),
+    ('sentences', (many_sentences, 100)),
+    ('attributes', (attribute_heavy, 50)),
+    ('links', (link_farm, 50)),
+    ('table', (huge_table, 200)),
+    ('images', (undimensioned_images, 5)),
+])
+
+
+def generate(kind, size, seed=0):
+    """
+    :param kind: kind of the document, a key of GENERATORS
+    :param size: size of the document in units of its kind
+    :param seed: seed of the random text
+    :return: html of the document, bytes
+    """
+    generator = GENERATORS[kind][0]
+    return generator(size, random.Random(seed)).encode('utf-8')
+
+
+def fit_slope(sizes, seconds):
+    """
+    Least squares slope of log(seconds) against log(sizes)
+
+    :param sizes: sizes of documents
+    :param seconds: runtimes
+    :return: slope, None if it can not be fitted
+    """
+    points = [(math.log(size), math.log(value)) for size, value in zip(sizes, seconds) if value > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, y in points) / len(points)
+    mean_y = sum(y for x, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, y in points)
+    if variance == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def scale(kind, steps=4, repeat=3, server=None):
+    """
+    Times the pipeline and its stages on documents of the kind doubling in size
+
+    :param kind: kind of documents, a key of GENERATORS
+    :param steps: quantity of sizes
+    :param repeat: quantity of runs per size, the fastest one is taken
+    :param server: running ImageServer for the images of the documents
+    :return: dict of sizes, milliseconds by stage and slopes by stage
+    """
+    base = GENERATORS[kind][1]
+    sizes = [base * 2 ** step for step in range(steps)]
+    url = '%s/%s.html' % (server.url if server is not None else 'http://127.0.0.1', kind)
+
+    # caches and lazily created objects are warmed up on the smallest document
+    timed_run(generate(kind, sizes[0]), url)
+
+    timings = OrderedDict((stage, []) for stage in (STAGE_PIPELINE,) + STAGES)
+    for size in sizes:
+        document = generate(kind, size)
+        best = OrderedDict((stage, None) for stage in timings)
+        for _ in range(repeat):
+            elapsed, stages = timed_run(document, url)
+            run = OrderedDict([(STAGE_PIPELINE, elapsed)])
+            run.update(stages)
+            for stage, seconds in run.items():
+                best[stage] = seconds if best[stage] is None else min(best[stage], seconds)
+        for stage, seconds in best.items():
+            timings[stage].append(seconds)
+
+    slopes = OrderedDict()
+    for stage, seconds in timings.items():
+        slopes[stage] = fit_slope(sizes, seconds) if seconds[-1] * 1000 >= MIN_FITTED_MS else None
+
+    return OrderedDict([
+        ('sizes', sizes),
+        ('ms', OrderedDict((stage, [value * 1000 for value in seconds]) for stage, seconds in timings.items())),
+        ('slopes', slopes),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--kinds', default=','.join(GENERATORS), help='comma separated kinds of documents')
+    parser.add_argument('--steps', type=int, default=4, help='quantity of sizes, each next one is doubled')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per size, the fastest one is taken')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    parser.add_argument('--write', help='directory to save the generated documents to instead of timing them')
+    args = parser.parse_args()
+
+    kinds = [kind.strip() for kind in args.kinds.split(',') if kind.strip()]
+    for kind in kinds:
+        if kind not in GENERATORS:
+            parser.error('unknown kind %s, known are %s' % (kind, ', '.join(GENERATORS)))
+
+    if args.write:
+        if not os.path.isdir(args.write):
+            os.makedirs(args.write)
+        for kind in kinds:
+            base = GENERATORS[kind][1]
+            for step in range(args.steps):
+                size = base * 2 ** step
+                with open(os.path.join(args.write, '%s_%d.html' % (kind, size)), 'wb') as f:
+                    f.write(generate(kind, size))
+        return
+
+    with ImageServer() as server:
+        results = OrderedDict((kind, scale(kind, args.steps, args.repeat, server)) for kind in kinds)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for kind, data in results.items():
+        print('%s, sizes %s' % (kind, ', '.join(str(size) for size in data['sizes'])))
+        for stage, slope in data['slopes'].items():
+            timings = ' '.join('%9.2f' % value for value in data['ms'][stage])
+            if slope is None:
+                print('  %-16s %s  %6s' % (stage, timings, '-'))
+            else:
+                mark = '  super-linear' if slope > SUPERLINEAR_SLOPE else ''
+                print('  %-16s %s  %6.2f%s' % (stage, timings, slope, mark))
+
+
+if __name__ == '__main__':
+    main()
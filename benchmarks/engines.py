@@ -0,0 +1,112 @@
+"""
+Compares summarization engines: time of ranking and overlap of their summaries with TextRank ones.
+
+Usage:
+    python -m benchmarks.engines [page.html ...] [--repeat 3] [--json]
+
+The corpus of the benchmarks is used if no pages are given.
+"""
+import argparse
+import json
+import time
+
+from lxml import etree
+
+from wanish import lang_identifier
+from wanish.core import DEFAULT_CONFIG, parse_document
+from wanish.summarizer import ENGINES, LANG_CODES, TEXTRANK_ENGINE, get_sentences
+
+from benchmarks import corpus_paths
+
+SUMMARY_LENGTHS = (1, 3, 5)
+
+
+def load_sentences(path):
+    """
+    Extracts sentences of the article from a saved html page the same way the pipeline does.
+
+    :param path: path to the html file
+    :return: list of Sentence, snowball language name
+    """
+    with open(path, 'rb') as f:
+        source_html = parse_document(f.read())[0]
+
+    clean_html = DEFAULT_CONFIG.article_extractor.get_clean_html(source_html)[0]
+    if not clean_html:
+        return [], 'english'
+
+    sentences = get_sentences(etree.XML(clean_html))
+    lang_code = lang_identifier.classify(''.join(' ' + sentence.text for sentence in sentences))[0]
+    return sentences, LANG_CODES.get(lang_code, 'english')
+
+
+def top(scores, n):
+    """
+    :param scores: dict of scores by sentence index
+    :param n: quantity of sentences
+    :return: set of indexes of n top scored sentences
+    """
+    return set(sorted(scores, key=lambda i: (-scores[i], i))[:n])
+
+
+def benchmark(paths, repeat=3):
+    """
+    :param paths: html files to use
+    :param repeat: quantity of timing repeats, the best time is taken
+    :return: dict of results by engine name
+    """
+    documents = [load_sentences(path) for path in paths]
+    documents = [(sentences, language) for sentences, language in documents if sentences]
+
+    results = {}
+    for name, engine in sorted(ENGINES.items()):
+        seconds = 0.0
+        overlaps = dict((n, 0.0) for n in SUMMARY_LENGTHS)
+
+        for sentences, language in documents:
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                scores = engine.score(sentences, language)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            seconds += best
+
+            reference = TEXTRANK_ENGINE.score(sentences, language)
+            for n in SUMMARY_LENGTHS:
+                expected = top(reference, n)
+                overlaps[n] += len(top(scores, n) & expected) / float(max(len(expected), 1))
+
+        qty = float(max(len(documents), 1))
+        results[name] = {
+            'documents': len(documents),
+            'sentences': sum(len(sentences) for sentences, _ in documents),
+            'ms_per_document': seconds / qty * 1000,
+            'overlap_with_textrank': dict(('top%d' % n, overlaps[n] / qty) for n in SUMMARY_LENGTHS),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('paths', nargs='*', help='saved html pages, the corpus by default')
+    parser.add_argument('--repeat', type=int, default=3, help='timing repeats per document')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = benchmark(args.paths or corpus_paths(), args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+
+    print('%-10s %10s %8s %8s %8s' % ('engine', 'ms/doc', 'top1', 'top3', 'top5'))
+    for name, data in sorted(results.items(), key=lambda x: x[1]['ms_per_document']):
+        overlap = data['overlap_with_textrank']
+        print('%-10s %10.2f %8.2f %8.2f %8.2f' % (
+            name, data['ms_per_document'], overlap['top1'], overlap['top3'], overlap['top5']
+        ))
+
+
+if __name__ == '__main__':
+    main()
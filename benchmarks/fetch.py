@@ -0,0 +1,99 @@
+"""
+Measures tail latency and failures of page fetches by fetch policies against a local stand-in injecting slow
+and failing responses.
+
+Usage:
+    python -m benchmarks.fetch [--requests 400] [--slow 0.05] [--slow-delay 1.0] [--failing 0.1] [--concurrency 8]
+
+Pages of the corpus are served by the stand-in: a share of the responses is delayed by --slow-delay seconds, another
+share fails with 503, the rest are answered after a few milliseconds. Every policy fetches the same pages.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import time
+
+from requests.exceptions import RequestException
+
+from wanish.fetch import FetchPolicy
+from wanish.stats import COUNTER_FETCH_RETRIES, COUNTER_HEDGED, StatsRecorder
+
+from benchmarks import corpus_paths
+from benchmarks.imageserver import ImageServer
+from benchmarks.pipeline import summarize
+
+BASE_DELAY = 0.005  # sec, delay of a normal response
+
+
+def run(policy, urls, concurrency):
+    """
+    :param policy: FetchPolicy
+    :param urls: urls to fetch
+    :param concurrency: quantity of threads fetching the urls
+    :return: list of seconds of the fetches, quantity of failed fetches, of retries and of hedged fetches
+    """
+    def fetch(url):
+        recorder = StatsRecorder()
+        started = time.perf_counter()
+        try:
+            failed = policy.fetch(url, recorder=recorder).status_code != 200
+        except RequestException:
+            failed = True
+        return time.perf_counter() - started, failed, recorder.counters
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        fetches = list(executor.map(fetch, urls))
+
+    return ([seconds for seconds, _, _ in fetches],
+            sum(failed for _, failed, _ in fetches),
+            sum(counters.get(COUNTER_FETCH_RETRIES, 0) for _, _, counters in fetches),
+            sum(counters.get(COUNTER_HEDGED, 0) for _, _, counters in fetches))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--requests', type=int, default=400, help='fetches by every policy')
+    parser.add_argument('--slow', type=float, default=0.05, help='share of slow responses')
+    parser.add_argument('--slow-delay', type=float, default=1.0, help='seconds of a slow response')
+    parser.add_argument('--failing', type=float, default=0.1, help='share of responses failing with 503')
+    parser.add_argument('--concurrency', type=int, default=8, help='threads fetching pages')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    pages = {}
+    for path in corpus_paths():
+        with open(path, 'rb') as f:
+            pages['/' + os.path.basename(path)] = f.read()
+
+    rnd = random.Random(args.seed)
+
+    def delay(path):
+        return args.slow_delay if rnd.random() < args.slow else BASE_DELAY
+
+    def status(path):
+        return 503 if rnd.random() < args.failing else 200
+
+    policies = (
+        ('single request', FetchPolicy(retries=0)),
+        ('retries', FetchPolicy(backoff=0.01)),
+        ('retries, hedged p95', FetchPolicy(backoff=0.01, hedge=True, hedge_delay=0.05)),
+    )
+
+    with ImageServer(delay=delay, pages=pages, status=status) as server:
+        paths = sorted(pages)
+        urls = [server.url + paths[i % len(paths)] for i in range(args.requests)]
+
+        print('%-22s %9s %9s %9s %9s %7s %8s %7s %9s' % (
+            'policy', 'p50, ms', 'p95, ms', 'p99, ms', 'max, ms', 'failed', 'retries', 'hedged', 'requests'))
+        for name, policy in policies:
+            served = server.requests_served
+            seconds, failed, retries, hedged = run(policy, urls, args.concurrency)
+            summary = summarize(seconds)
+            print('%-22s %9.1f %9.1f %9.1f %9.1f %7d %8d %7d %9d' % (
+                name, summary['p50'], summary['p95'], summary['p99'], summary['max'], failed, retries, hedged,
+                server.requests_served - served))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Local HTTP stand-in serving images of the benchmark pages, and the pages themselves if they are given.
+
+Images are generated on request: width and height are taken from the path (/img/800x450/photo.jpg), other
+images are small thumbnails. Only the headers of the formats are served, it is all wanish reads of an image.
+A delay may be injected for every response or per request with the delay query parameter (seconds), a status
+code with the status parameter. The delay and the status of the server may be callables of the path, to inject
+slow or failing responses at random.
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import re
+import socketserver
+import struct
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+DIMENSIONS_RE = re.compile(r'(\d+)x(\d+)')
+
+DEFAULT_DIMENSIONS = (150, 150)  # px, dimensions of images without them in the path
+
+
+def png_header(width, height):
+    ihdr = b'IHDR' + struct.pack('>ii', width, height) + b'\x08\x02\x00\x00\x00'
+    return b'\211PNG\r\n\032\n' + struct.pack('>i', 13) + ihdr
+
+
+def gif_header(width, height):
+    return b'GIF89a' + struct.pack('<HH', width, height) + b'\x00\x00\x00'
+
+
+def jpeg_header(width, height):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    sof0 = b'\xff\xc0' + struct.pack('>HBHHB', 17, 8, height, width, 3) + b'\x01\x22\x00\x02\x11\x01\x03\x11\x01'
+    return b'\xff\xd8' + app0 + sof0 + b'\xff\xd9'
+
+
+IMAGE_FORMATS = {
+    '.png': ('image/png', png_header),
+    '.gif': ('image/gif', gif_header),
+    '.jpg': ('image/jpeg', jpeg_header),
+    '.jpeg': ('image/jpeg', jpeg_header),
+}
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        delay = self.server.delay(url.path) if callable(self.server.delay) else self.server.delay
+        delay = float(query.get('delay', [delay])[0])
+        if delay > 0:
+            time.sleep(delay)
+
+        with self.server.lock:
+            self.server.requests_served += 1
+
+        status = self.server.status(url.path) if callable(self.server.status) else self.server.status
+        status = int(query.get('status', [status])[0])
+        page = self.server.pages.get(url.path)
+        image_format = IMAGE_FORMATS.get(url.path[url.path.rfind('.'):].lower())
+        if status != 200 or (page is None and image_format is None):
+            self.send_error(status if status != 200 else 404)
+            return
+
+        if page is not None:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+            return
+
+        dimensions = DIMENSIONS_RE.search(url.path)
+        width, height = (int(dimensions.group(1)), int(dimensions.group(2))) if dimensions else DEFAULT_DIMENSIONS
+        content_type, make_header = image_format
+        body = make_header(width, height)
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            BaseHTTPRequestHandler.handle(self)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client dropped the request, e.g. a hedged one lost the race
+
+
+class ImageServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    Image server on a free local port, running in a background thread. May be used as a context manager.
+    """
+    daemon_threads = True
+    request_queue_size = 128  # connections waiting to be accepted, concurrent clients are not refused
+
+    def __init__(self, delay=0.0, host='127.0.0.1', port=0, pages=None, status=200):
+        """
+        :param delay: seconds to wait before every response, or a callable of the path returning them
+        :param host: host to listen on
+        :param port: port to listen on, a free one by default
+        :param pages: dict of html pages by path, bytes
+        :param status: status of every response, or a callable of the path returning it
+        """
+        HTTPServer.__init__(self, (host, port), ImageRequestHandler)
+        self.delay = delay
+        self.status = status
+        self.pages = pages or {}
+        self.lock = threading.Lock()
+        self.requests_served = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        :return: base url of the server without the trailing slash
+        """
+        return 'http://%s:%s' % self.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='wanish-image-server')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,195 @@
+"""
+Measures throughput and latency of the extraction pipeline and of its stages on saved pages.
+
+Usage:
+    python -m benchmarks.pipeline [page.html ...] [--repeat 5] [--json] [--output run.json] [--compare base.json]
+
+The corpus of the benchmarks is used if no pages are given. Images of the pages are served by a local stand-in,
+so the benchmark needs no network.
+"""
+import argparse
+from collections import OrderedDict
+import json
+import os
+import platform
+import time
+
+from wanish.core import DEFAULT_CONFIG, extract
+from wanish.metrics import ExtractionMetrics, MetricsRegistry
+from wanish.stats import (STAGE_CLEAN_HTML, STAGE_ENCODING, STAGE_HTML_CLEANER, STAGE_IMAGE, STAGE_LANGID,
+                          STAGE_PARSING, STAGE_PLAIN_TEXT, STAGE_TITLE)
+
+from benchmarks import corpus_paths
+from benchmarks.imageserver import ImageServer
+
+STAGE_PIPELINE = 'pipeline'  # core.extract() as a whole
+
+STAGES = (STAGE_ENCODING, STAGE_PARSING, STAGE_HTML_CLEANER, STAGE_CLEAN_HTML, STAGE_TITLE, STAGE_IMAGE,
+          STAGE_PLAIN_TEXT, STAGE_LANGID)
+
+PERCENTILES = (50, 95, 99)
+
+
+def timed_run(document, url, config=DEFAULT_CONFIG):
+    """
+    Performs the document by core.extract() with the stats enabled. Dimensions of images cached by the config
+    are dropped beforehand, so every run probes the images of the page.
+
+    :param document: raw html of the page
+    :param url: url of the page
+    :param config: ExtractorConfig
+    :return: seconds of the whole run, OrderedDict of seconds by stage
+    """
+    if config.image_cache is not None:
+        config.image_cache.clear()
+    config = config._replace(stats=True)
+
+    started = time.perf_counter()
+    result = extract(document, config, url=url)
+    elapsed = time.perf_counter() - started
+
+    return elapsed, OrderedDict((stage, result.stats.timings.get(stage, 0.0)) for stage in STAGES)
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile
+
+    :param values: sorted list of values
+    :param q: percentile, 0..100
+    :return: value
+    """
+    if not values:
+        return 0.0
+    rank = max(int(round(q / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(seconds):
+    """
+    :param seconds: list of timings in seconds
+    :return: dict of the statistics in milliseconds
+    """
+    values = sorted(seconds)
+    summary = OrderedDict(('p%d' % q, percentile(values, q) * 1000) for q in PERCENTILES)
+    summary['mean'] = sum(values) / max(len(values), 1) * 1000
+    summary['max'] = values[-1] * 1000 if values else 0.0
+    return summary
+
+
+def benchmark(paths, repeat=5, warmup=1, config=DEFAULT_CONFIG):
+    """
+    :param paths: html files to use
+    :param repeat: quantity of timed runs of every page
+    :param warmup: quantity of untimed runs of every page
+    :param config: ExtractorConfig
+    :return: dict of results
+    """
+    documents = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            documents.append((os.path.basename(path), f.read()))
+
+    pipeline = []
+    stages = OrderedDict((stage, []) for stage in STAGES)
+    per_document = OrderedDict()
+
+    with ImageServer() as server:
+        for run in range(warmup + repeat):
+            for name, document in documents:
+                url = '%s/%s' % (server.url, name)
+
+                elapsed, timings = timed_run(document, url, config)
+                if run < warmup:
+                    continue
+
+                pipeline.append(elapsed)
+                per_document.setdefault(name, []).append(elapsed)
+                for stage, seconds in timings.items():
+                    stages[stage].append(seconds)
+
+    total_seconds = sum(pipeline)
+    total_bytes = sum(len(document) for name, document in documents) * repeat
+
+    pipeline_summary = summarize(pipeline)
+    pipeline_summary['documents_per_second'] = len(pipeline) / total_seconds if total_seconds else 0.0
+    pipeline_summary['megabytes_per_second'] = total_bytes / 1048576.0 / total_seconds if total_seconds else 0.0
+
+    return OrderedDict([
+        ('environment', OrderedDict([
+            ('python', platform.python_version()),
+            ('implementation', platform.python_implementation()),
+            ('platform', platform.platform()),
+            ('repeat', repeat),
+            ('warmup', warmup),
+        ])),
+        ('documents', OrderedDict((name, len(document)) for name, document in documents)),
+        (STAGE_PIPELINE, pipeline_summary),
+        ('stages', OrderedDict((stage, summarize(seconds)) for stage, seconds in stages.items())),
+        ('per_document_p50', OrderedDict((name, percentile(sorted(seconds), 50) * 1000)
+                                         for name, seconds in per_document.items())),
+    ])
+
+
+def compare(results, baseline):
+    """
+    :param results: results of benchmark()
+    :param baseline: results of a previous run
+    :return: list of (stage, baseline p50, current p50, ratio)
+    """
+    rows = []
+    current = [(STAGE_PIPELINE, results[STAGE_PIPELINE])] + list(results['stages'].items())
+    previous = dict([(STAGE_PIPELINE, baseline.get(STAGE_PIPELINE, {}))] + list(baseline.get('stages', {}).items()))
+    for stage, data in current:
+        if 'p50' not in previous.get(stage, {}):
+            continue
+        before = previous[stage]['p50']
+        rows.append((stage, before, data['p50'], data['p50'] / before if before else float('inf')))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('paths', nargs='*', help='saved html pages, the corpus by default')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs of every page')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed runs of every page')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    parser.add_argument('--output', help='file to write machine-readable results to')
+    parser.add_argument('--compare', help='results of a previous run to compare with')
+    parser.add_argument('--metrics', help='file to write metrics of the runs to in the Prometheus text format')
+    args = parser.parse_args()
+
+    config = DEFAULT_CONFIG
+    registry = MetricsRegistry()
+    if args.metrics:
+        config = config._replace(stats_hook=ExtractionMetrics(registry))
+
+    results = benchmark(args.paths or corpus_paths(), args.repeat, args.warmup, config)
+
+    if args.metrics:
+        registry.write(args.metrics)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        pipeline = results[STAGE_PIPELINE]
+        print('%d documents, %.1f documents/s, %.2f MB/s' % (
+            len(results['documents']), pipeline['documents_per_second'], pipeline['megabytes_per_second']))
+        print('%-16s %9s %9s %9s %9s' % ('stage, ms', 'p50', 'p95', 'p99', 'mean'))
+        for stage, data in [(STAGE_PIPELINE, pipeline)] + list(results['stages'].items()):
+            print('%-16s %9.2f %9.2f %9.2f %9.2f' % (stage, data['p50'], data['p95'], data['p99'], data['mean']))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('\n%-16s %12s %12s %8s' % ('p50, ms', 'baseline', 'current', 'ratio'))
+        for stage, before, after, ratio in compare(results, baseline):
+            print('%-16s %12.2f %12.2f %8.2f' % (stage, before, after, ratio))
+
+
+if __name__ == '__main__':
+    main()
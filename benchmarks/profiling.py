@@ -0,0 +1,47 @@
+"""
+Profiles saved pages and keeps the slowest and the most memory-hungry ones as cases to reproduce.
+
+Usage:
+    python -m benchmarks.profiling [page.html ...] [--top 5] [--no-memory] [--output DIR]
+
+The corpus of the benchmarks is used if no pages are given, images of the pages are served by a local stand-in.
+The report of the hottest functions is printed, the kept pages with their profiles are written to DIR:
+    python -c "import pstats; pstats.Stats('DIR/slowest_01_page.pstats').sort_stats('tottime').print_stats(20)"
+"""
+import argparse
+import os
+
+from wanish.profiling import DEFAULT_TOP, DocumentProfiler
+
+from benchmarks import corpus_paths
+from benchmarks.imageserver import ImageServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('paths', nargs='*', help='saved html pages, the corpus by default')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='pages to keep by each criterion')
+    parser.add_argument('--no-memory', action='store_true', help='do not trace memory allocations')
+    parser.add_argument('--sample-every', type=int, default=1, help='profile every n-th page')
+    parser.add_argument('--output', help='directory to write the kept pages, their profiles and the report to')
+    args = parser.parse_args()
+
+    profiler = DocumentProfiler(top=args.top, memory=not args.no_memory, sample_every=args.sample_every)
+
+    with ImageServer() as server:
+        for path in args.paths or corpus_paths():
+            name = os.path.basename(path)
+            with open(path, 'rb') as f:
+                document = f.read()
+            try:
+                profiler.extract(document, url='%s/%s' % (server.url, name), name=name)
+            except Exception as e:
+                print('%s: %s' % (name, e))
+
+    if args.output:
+        profiler.save(args.output)
+    print(profiler.report(), end='')
+
+
+if __name__ == '__main__':
+    main()
@@ -36,7 +36,6 @@ setup(
         "cssselect",
         "numpy",
         "snowballstemmer",
-        "networkx",
         "segtok",
         lxml_requirement
     ],
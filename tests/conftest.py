@@ -0,0 +1,64 @@
+"""
+Fixtures shared by the tests
+"""
+import pytest
+
+from benchmarks import corpus_paths
+
+
+class Response(object):
+    """
+    Response of StaticPolicy, its body is read
+    """
+
+    def __init__(self, content, url, status_code=200, headers=None):
+        self.content = content
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.encoding = None
+
+
+class StaticPolicy(object):
+    """
+    Fetch policy answering every request by the same response, the config accepts any object with fetch()
+    """
+
+    def __init__(self):
+        self.response = None
+        self.requests = []  # (url, headers) of every request
+
+    def respond(self, content, url, status_code=200, headers=None):
+        """
+        Sets the response to the next requests
+
+        :param content: body of the response
+        :param url: url of the response, the final one if the request was redirected
+        :param status_code: HTTP status of the response
+        :param headers: headers of the response
+        """
+        self.response = Response(content, url, status_code, headers)
+
+    def fetch(self, url, headers=None, deadline=None, recorder=None):
+        self.requests.append((url, headers))
+        return self.response
+
+
+def read_corpus_page(name):
+    """
+    :param name: file name of a page of the benchmark corpus
+    :return: raw html of the page
+    """
+    path = [path for path in corpus_paths() if path.endswith(name)][0]
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def corpus_page():
+    return read_corpus_page
+
+
+@pytest.fixture
+def static_policy():
+    return StaticPolicy()
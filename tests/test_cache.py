@@ -0,0 +1,126 @@
+"""
+Caches of extraction results
+"""
+import os
+import time
+
+from wanish import core
+from wanish.cache import DiskStore, HttpCache, MemoryResultCache
+from wanish.core import ExtractorConfig, extract, extract_url
+from wanish.dedup import SimHashIndex
+
+PAGE_URL = 'http://example.com/news/tram.html'
+
+
+def test_http_cache_replays_result_of_not_modified_page(tmpdir, corpus_page, static_policy):
+    static_policy.respond(corpus_page('en_news_small.html'), PAGE_URL, headers={'ETag': '"v1"'})
+    config = ExtractorConfig(http_cache=str(tmpdir), fetch_policy=static_policy)
+
+    first = extract_url(PAGE_URL, config)
+    assert len(config.http_cache) == 1
+
+    static_policy.respond(b'', PAGE_URL, status_code=304)
+    second = extract_url(PAGE_URL, config)
+    assert static_policy.requests[-1][1]['If-None-Match'] == '"v1"'
+    assert second.title == first.title and second.description == first.description
+
+
+def test_http_cache_skips_near_duplicates(tmpdir, corpus_page, static_policy):
+    document = corpus_page('en_news_small.html')
+    near_duplicates = SimHashIndex()
+    signature = extract(document, ExtractorConfig(), url=PAGE_URL).simhash
+    near_duplicates.add('http://example.org/wire/tram.html', signature)
+
+    static_policy.respond(document.replace(b'rel="canonical"', b'rel="x"'), PAGE_URL, headers={'ETag': '"v1"'})
+    config = ExtractorConfig(http_cache=str(tmpdir), fetch_policy=static_policy, near_duplicates=near_duplicates)
+
+    result = extract_url(PAGE_URL, config)
+    assert result.near_duplicate_of == 'http://example.org/wire/tram.html'
+    assert len(config.http_cache) == 0
+
+
+def test_result_cache_keeps_results_by_document(corpus_page):
+    document = corpus_page('en_news_small.html')
+    config = ExtractorConfig(result_cache=MemoryResultCache(max_entries=2))
+
+    first = extract(document, config, url=PAGE_URL)
+    second = extract(document, config, url=PAGE_URL)
+    assert len(config.result_cache) == 1
+    assert second._replace(stats=None) == first._replace(stats=None)
+
+
+def test_result_cache_is_shared_by_copies_at_other_urls(corpus_page):
+    document = corpus_page('en_news_small.html')
+    mirror_url = 'http://mirror.example.org/news/2017/tram.html'
+    config = ExtractorConfig(result_cache=MemoryResultCache(), stats=True)
+
+    extract(document, config, url=PAGE_URL)
+    mirrored = extract(document, config, url=mirror_url)
+    assert mirrored.stats.counters[core.COUNTER_RESULT_CACHE_HIT] == 1
+    assert len(config.result_cache) == 1
+
+    # the relative image is resolved against the url of the copy
+    fresh = extract(document, ExtractorConfig(), url=mirror_url)
+    assert mirrored.image_url == 'http://mirror.example.org/img/1200x675/tram-depot.jpg'
+    assert mirrored._replace(stats=None) == fresh
+
+
+def test_disk_store_evicts_least_recently_used(tmpdir):
+    store = HttpCache(str(tmpdir), max_bytes=1000)
+    for i in range(3):
+        store.put('http://example.com/%d' % i, None, None, {'text': 'x' * 200})
+    assert len(store) == 3
+    entry_size = store.size // 3
+
+    store.touch('http://example.com/0')
+    store.put('http://example.com/3', None, None, {'text': 'x' * 200})
+    store.put('http://example.com/4', None, None, {'text': 'x' * 200})
+
+    # 1 and 2 were used the longest time ago
+    assert store.size <= 1000
+    assert store.get('http://example.com/1') is None
+    assert store.get('http://example.com/2') is None
+    for i in (0, 3, 4):
+        assert store.get('http://example.com/%d' % i) is not None
+    assert store.size == 3 * entry_size
+    assert len(os.listdir(str(tmpdir))) == 3
+
+
+def test_disk_store_drops_expired_entries(tmpdir):
+    store = HttpCache(str(tmpdir), max_age=60)
+    store.put(PAGE_URL, '"v1"', None, {})
+    assert store.get(PAGE_URL) is not None
+
+    path = os.path.join(str(tmpdir), HttpCache.key_of(PAGE_URL) + '.json')
+    expired = time.time() - 120
+    os.utime(path, (expired, expired))
+    assert store.get(PAGE_URL) is None
+    assert len(store) == 0
+
+
+def test_disk_store_is_reopened_in_lru_order(tmpdir):
+    store = HttpCache(str(tmpdir))
+    for i in range(3):
+        store.put('http://example.com/%d' % i, None, None, {'text': 'x' * 200})
+        path = os.path.join(str(tmpdir), HttpCache.key_of('http://example.com/%d' % i) + '.json')
+        os.utime(path, (1000 + i, 1000 + i))
+    size = store.size
+
+    reopened = DiskStore(str(tmpdir), max_bytes=size - 1, max_age=None)
+    assert len(reopened) == 2
+    assert not os.path.exists(os.path.join(str(tmpdir), HttpCache.key_of('http://example.com/0') + '.json'))
+
+
+def test_document_is_decoded_once(corpus_page, monkeypatch):
+    decoded = []
+    decode_document = core.decode_document
+
+    def counting_decode_document(document, encoding=None):
+        decoded.append(document)
+        return decode_document(document, encoding)
+
+    monkeypatch.setattr(core, 'decode_document', counting_decode_document)
+    result = extract(corpus_page('ru_news_cp1251.html'), ExtractorConfig(result_cache=True, stats=True), url=PAGE_URL)
+
+    assert result.charset == 'windows-1251'
+    assert len(decoded) == 1
@@ -0,0 +1,45 @@
+"""
+Assembling of the article in the zero-copy and in the copy mode
+"""
+import os
+
+from lxml.html import tostring
+import pytest
+
+from wanish.cleaner import ArticleExtractor
+from wanish.core import ExtractorConfig, extract, parse_document
+
+from benchmarks import corpus_paths
+from benchmarks.imageserver import ImageServer
+
+PARAGRAPH = ('<p>The city council approved the extension of the tram line to the northern districts on Monday, '
+             'after a long debate about its cost, its route, and the years of construction ahead of us.</p>')
+
+# the images are sanitized out of the article, the image of the page is among them
+GALLERY_PAGE = ('<html><head><title>Tram line extension approved</title></head><body><div id="content">'
+                '<h1>Tram line extension approved</h1><div class="gallery"><img src="/img/1200x700/a.jpg">'
+                '<img src="/img/100x100/b.jpg"><img src="/img/100x100/c.jpg"></div>%s</div></body></html>'
+                ) % (PARAGRAPH * 6)
+
+
+@pytest.mark.parametrize('name', [os.path.basename(path) for path in corpus_paths()] + ['gallery'])
+def test_moved_article_leaves_the_same_tree_as_copied_one(name, corpus_page):
+    document = GALLERY_PAGE if name == 'gallery' else corpus_page(name)
+
+    performed = []
+    for copy_article in (True, False):
+        source_html = parse_document(document, 'http://example.com/news/page.html')[0]
+        clean_html, _ = ArticleExtractor(copy_article=copy_article).get_clean_html(source_html=source_html)
+        performed.append((clean_html, tostring(source_html)))
+
+    assert performed[0] == performed[1]
+
+
+def test_image_sanitized_out_of_moved_article_is_selected():
+    with ImageServer() as server:
+        url = server.url + '/news/page.html'
+        moved = extract(GALLERY_PAGE, ExtractorConfig(), url=url)
+        copied = extract(GALLERY_PAGE, ExtractorConfig(copy_article=True), url=url)
+
+    assert moved.image_url == copied.image_url == server.url + '/img/1200x700/a.jpg'
+    assert moved.clean_html == copied.clean_html
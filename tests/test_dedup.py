@@ -0,0 +1,169 @@
+"""
+Indexes of performed pages and near-duplicate texts
+"""
+import random
+
+import pytest
+
+from wanish import dedup
+from wanish.core import ExtractorConfig, extract_url
+from wanish.dedup import BloomDedupIndex, BloomFilter, MemoryDedupIndex, SimHashIndex, hamming_distance, \
+    normalize_url, simhash
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+def text_of(rnd, words=400):
+    vocabulary = ['word%d' % i for i in range(2000)]
+    return ' '.join(rnd.choice(vocabulary) for _ in range(words))
+
+
+def test_normalize_url():
+    assert normalize_url('HTTP://www.Example.com:80/a?utm_source=x&b=2&a=1#top') == 'http://example.com/a?a=1&b=2'
+    assert normalize_url('https://example.com:8443') == 'https://example.com:8443/'
+    assert normalize_url('ftp://example.com/a') is None
+    assert normalize_url('/relative') is None
+    assert normalize_url(None) is None
+
+
+def test_memory_index_expires_and_evicts(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedup, 'time', clock)
+    index = MemoryDedupIndex(ttl=60, max_entries=2)
+
+    index.add(['http://example.com/a'], {'title': 'A'})
+    clock.now += 30
+    index.add(['http://example.com/b', 'http://example.com/c'], {'title': 'B'})
+    assert index.get('http://example.com/a') is None  # evicted
+    assert index.get('http://example.com/b') == {'title': 'B'}
+
+    clock.now += 61
+    assert index.get('http://example.com/c') is None  # expired
+    assert len(index) == 1
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(10000, 0.01)
+    for i in range(10000):
+        bloom.add('http://example.com/%d' % i)
+
+    assert all('http://example.com/%d' % i in bloom for i in range(10000))
+    false_positives = sum('http://example.org/%d' % i in bloom for i in range(10000))
+    assert false_positives < 200
+
+
+def test_bloom_index_rotates_generations_by_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedup, 'time', clock)
+    index = BloomDedupIndex(ttl=60, capacity=100)
+
+    index.add(['http://example.com/a'])
+    assert index.get('http://example.com/a') == {}
+
+    # the generation of the url becomes the previous one, it is still known
+    clock.now += 61
+    assert index.get('http://example.com/a') == {}
+    index.add(['http://example.com/b'])
+
+    # the generation of the url is dropped
+    clock.now += 61
+    assert index.get('http://example.com/a') is None
+    assert index.get('http://example.com/b') == {}
+
+    # both generations expired
+    clock.now += 121
+    assert index.get('http://example.com/b') is None
+    assert len(index) == 0
+
+
+def test_bloom_index_rotates_full_generations(monkeypatch):
+    monkeypatch.setattr(dedup, 'time', Clock())
+    index = BloomDedupIndex(ttl=60, capacity=10)
+
+    first = ['http://example.com/first/%d' % i for i in range(10)]
+    second = ['http://example.com/second/%d' % i for i in range(10)]
+    index.add(first)
+    index.add(second[:5])  # the first generation is full, it becomes the previous one
+    assert all(index.get(url) == {} for url in first + second[:5])
+
+    # the second generation is full, the first one is dropped
+    index.add(second[5:])
+    index.add(['http://example.com/third'])
+    assert index.get('http://example.com/third') == {}
+    assert all(index.get(url) == {} for url in second)
+    assert sum(index.get(url) is not None for url in first) <= 1  # false positives only
+
+
+def test_simhash_of_near_texts_is_near():
+    rnd = random.Random(0)
+    text = text_of(rnd)
+    words = text.split()
+    edited = ' '.join(words[:200] + ['edited'] + words[200:])
+
+    assert simhash(text) == simhash(text.upper())
+    assert hamming_distance(simhash(text), simhash(edited)) <= 3
+    assert hamming_distance(simhash(text), simhash(text_of(rnd))) > 3
+    assert simhash('two words') is None
+    assert simhash('three words here') is not None
+
+
+def test_simhash_index_finds_signatures_within_the_distance():
+    rnd = random.Random(1)
+    index = SimHashIndex(max_distance=3)
+    signature = rnd.getrandbits(64)
+    index.add('base', signature)
+
+    # bits flipped at random positions, a near signature shares at least one band whatever the positions
+    for distance in range(8):
+        for _ in range(50):
+            near = signature
+            for bit in rnd.sample(range(64), distance):
+                near ^= 1 << bit
+            assert index.nearest(near) == (('base', distance) if distance <= 3 else None)
+
+
+def test_simhash_index_orders_removes_and_evicts():
+    index = SimHashIndex(max_distance=3, max_signatures=2)
+    index.add('a', 0b1111)
+    index.add('b', 0b0001)
+    assert index.query(0) == [('b', 1)]  # 'a' differs in 4 bits
+    assert index.nearest(0b0111) == ('a', 1)
+
+    index.add('a', 0b0011)  # replaced signature
+    assert index.query(0) == [('b', 1), ('a', 2)]
+
+    index.remove('b')
+    assert 'b' not in index and index.query(0) == [('a', 2)]
+    index.add('c', 0)
+    index.add('d', 0xff << 56)  # the oldest key is evicted
+    assert len(index) == 2 and 'a' not in index
+    assert index.query(0b0011) == [('c', 2)]
+
+    index.clear()
+    assert len(index) == 0 and index.nearest(0) is None
+
+
+@pytest.mark.parametrize('max_distance', [-1, 32])
+def test_simhash_index_rejects_distance_beyond_bands(max_distance):
+    with pytest.raises(ValueError):
+        SimHashIndex(max_distance=max_distance)
+
+
+def test_redirecting_url_is_not_fetched_again(corpus_page, static_policy):
+    static_policy.respond(corpus_page('en_news_small.html'),
+                          'https://example.com/news/2016/05/city-approves-tram-extension')
+    config = ExtractorConfig(dedup=True, fetch_policy=static_policy)
+
+    first = extract_url('http://short.example/t1', config)
+    assert first.error_msg is None and first.duplicate_of is None
+
+    second = extract_url('http://short.example/t1?utm_source=feed', config)
+    assert [url for url, _ in static_policy.requests] == ['http://short.example/t1']
+    assert second.duplicate_of == 'http://short.example/t1'
+    assert second.title == first.title
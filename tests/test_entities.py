@@ -0,0 +1,83 @@
+"""
+Single pass replacement of entities against the original sequential replacements
+"""
+import random
+
+import pytest
+
+from wanish.cleaner import ESCAPED_ENTITIES, clean_entities
+from wanish.entities import Replacer
+from wanish.title import normalize_entities
+
+# original normalization of titles
+TITLE_ENTITIES = {
+    '—': '-',
+    '–': '-',
+    '&mdash;': '-',
+    '&ndash;': '-',
+    ' ': ' ',
+    '«': '"',
+    '»': '"',
+    '&quot;': '"',
+    '\xa0': ' ',
+}
+
+# pieces of texts: entities, their prefixes and overlaps, and plain text
+FRAGMENTS = ['&', ';', '#', 'amp;', '&amp;', '&amp;lt;', '&lt;', 'lt;', '&&nbsp;;', '&#8211;#8212;', '&#82',
+             '&nbsp', 'nbsp;', '&quot', '&mdash;&ndash;', ' ', '\xa0', 'a', 'Text ', '\n', '—', '«', '»']
+for seq in ESCAPED_ENTITIES.values():
+    for variant in seq:
+        FRAGMENTS.extend([variant, variant[:-1], variant[1:]])
+FRAGMENTS.extend(key for key in TITLE_ENTITIES)
+
+
+def sequential_clean_entities(text):
+    for key, seq in ESCAPED_ENTITIES.items():
+        for val in seq:
+            text = text.replace(val, key)
+    return text
+
+
+def sequential_normalize_entities(text):
+    for c in TITLE_ENTITIES:
+        if c in text:
+            text = text.replace(c, TITLE_ENTITIES[c])
+    return text
+
+
+def random_texts(qty=20000, seed=1):
+    rnd = random.Random(seed)
+    for _ in range(qty):
+        yield ''.join(rnd.choice(FRAGMENTS) for _ in range(rnd.randint(0, 12)))
+
+
+def test_clean_entities_matches_sequential_replacement():
+    replacer = Replacer.from_variants(ESCAPED_ENTITIES)
+    for text in random_texts():
+        expected = sequential_clean_entities(text)
+        assert replacer(text) == expected, text
+        assert clean_entities(text) == expected, text
+
+
+def test_normalize_entities_matches_sequential_replacement():
+    for text in random_texts(seed=2):
+        assert normalize_entities(text) == sequential_normalize_entities(text), text
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('', ''),
+    ('no entities', 'no entities'),
+    ('&amp;', '&'),
+    ('&amp;lt;', '<'),
+    ('&amp;amp;lt;', '&amp;lt;'),
+    ('&amp;l&amp;lt;t;', '&l<t;'),
+    ('&&amp;;', '&&;'),
+])
+def test_longer_keys_take_precedence(text, expected):
+    replacer = Replacer({'&amp;': '&', '&amp;lt;': '<'})
+    assert replacer(text) == expected
+
+
+def test_replacements_are_not_replaced_again():
+    replacer = Replacer({'&amp;': '&', '&lt;': '<'})
+    assert replacer('&amp;lt;') == '&lt;'
@@ -0,0 +1,44 @@
+"""
+Selection of the image of an article
+"""
+from wanish.core import ExtractorConfig, extract
+from wanish.images import DimensionsCache, image_executor
+from wanish.stats import COUNTER_IMAGE_CACHE_HITS, COUNTER_IMAGES_PROBED
+
+from benchmarks.imageserver import ImageServer
+
+
+def test_image_is_selected_in_the_shared_executor_by_default():
+    assert ExtractorConfig().image_executor is image_executor
+    assert ExtractorConfig(image_executor=True).image_executor is image_executor
+    assert ExtractorConfig(image_executor=None).image_executor is None
+
+
+def test_dimensions_are_downloaded_on_every_page_by_default(corpus_page):
+    document = corpus_page('de_magazine_nocharset.html')
+    with ImageServer() as server:
+        url = server.url + '/page.html'
+        first = extract(document, ExtractorConfig(stats=True), url=url)
+        second = extract(document, ExtractorConfig(stats=True), url=url)
+
+    assert first.image_url is not None and second.image_url == first.image_url
+    assert first.stats.counters[COUNTER_IMAGES_PROBED] > 0
+    assert second.stats.counters == first.stats.counters
+    assert COUNTER_IMAGE_CACHE_HITS not in second.stats.counters
+
+
+def test_dimensions_cache_downloads_images_once(corpus_page):
+    document = corpus_page('de_magazine_nocharset.html')
+    cache = DimensionsCache()
+    config = ExtractorConfig(stats=True, image_cache=cache)
+    with ImageServer() as server:
+        url = server.url + '/page.html'
+        first = extract(document, config, url=url)
+        served = server.requests_served
+        second = extract(document, config, url=url)
+        assert server.requests_served == served
+
+    assert second.image_url == first.image_url
+    assert len(cache) == first.stats.counters[COUNTER_IMAGES_PROBED]
+    assert second.stats.counters[COUNTER_IMAGE_CACHE_HITS] == len(cache)
+    assert COUNTER_IMAGES_PROBED not in second.stats.counters
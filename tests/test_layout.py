@@ -0,0 +1,42 @@
+"""
+Layouts of sites learned on performed pages
+"""
+from lxml.html import document_fromstring
+
+from wanish.core import ExtractorConfig, extract
+from wanish.layout import Layout, LayoutStore
+
+PARAGRAPH = ('<p>The city council approved the extension of the tram line to the northern districts on Monday, '
+             'after a long debate about its cost, its route and the years of construction ahead.</p>')
+
+
+def page(body):
+    return '<html><head><title>Tram line extension approved</title></head><body>%s</body></html>' % body
+
+
+def test_layout_of_nested_article_is_learned():
+    url = 'http://example.com/news/1'
+    config = ExtractorConfig(layouts=True)
+    result = extract(page('<div id="main"><div class="story">%s</div></div>' % (PARAGRAPH * 6)), config, url=url)
+
+    assert result.error_msg is None
+    assert config.layouts.get('example.com').article_path == ('html', 'body', 'div#main')
+
+
+def test_layout_of_article_in_body_is_not_learned():
+    url = 'http://example.com/news/1'
+    config = ExtractorConfig(layouts=True)
+    result = extract(page('<div class="story">%s</div>' % (PARAGRAPH * 6)), config, url=url)
+
+    assert result.error_msg is None
+    assert config.layouts.get('example.com') is None
+
+
+def test_body_does_not_replace_learned_layout():
+    store = LayoutStore()
+    html = document_fromstring(page('<div class="story">%s</div>' % PARAGRAPH))
+    store.learn('example.com', html.find('body/div'))
+    store.learn('example.com', html.find('body'))
+    store.learn('example.com', html)
+
+    assert store.get('example.com') == Layout(('html', 'body', 'div.story'), None)
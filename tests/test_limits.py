@@ -0,0 +1,70 @@
+"""
+DOM size guardrails
+"""
+from lxml import etree
+from lxml.html import fromstring
+import pytest
+
+from wanish.limits import DocumentTooLarge, DomLimits, POLICY_REJECT, limit_tree
+
+
+def depth_of(elem):
+    depth = 1
+    while elem.getparent() is not None:
+        elem = elem.getparent()
+        depth += 1
+    return depth
+
+
+def test_unlimited_tree_is_kept():
+    root = fromstring('<html><body><div><p>text</p></div></body></html>')
+    assert not limit_tree(root, DomLimits())
+    assert etree.tostring(root) == b'<html><body><div><p>text</p></div></body></html>'
+
+
+def test_sibling_subtrees_nested_too_deep():
+    # html > body > div > div > div > p: every block is nested one level too deep for the limit
+    block = '<div class="b%d"><div><div><p>deep %d</p></div></div>tail %d</div>'
+    root = fromstring('<html><body>%s</body></html>' % ''.join(block % (i, i, i) for i in range(5)))
+
+    assert limit_tree(root, DomLimits(max_depth=4))
+
+    assert max(depth_of(elem) for elem in root.iter()) == 4
+    assert not root.findall('.//p')
+    for i in range(5):
+        blocks = root.find_class('b%d' % i)
+        assert len(blocks) == 1
+        assert len(blocks[0]) == 1  # the second level is kept, the third is dropped
+        assert blocks[0].text_content() == 'tail %d' % i
+
+
+def test_tail_of_dropped_subtree_is_counted_once():
+    root = fromstring('<html><body><div><div><b>x</b>1234</div>5678</div></body></html>')
+
+    # the text is 'x' of the dropped element, 4 bytes of its tail, 4 bytes of the tail of its parent
+    assert limit_tree(root, DomLimits(max_depth=4, max_text_bytes=8))
+    assert root.text_content() == '12345678'
+
+
+def test_nodes_beyond_the_limit_are_cut():
+    root = fromstring('<html><body>%s</body></html>' % ''.join('<p>%d</p>' % i for i in range(10)))
+
+    assert limit_tree(root, DomLimits(max_nodes=5))
+    assert len(list(root.iter())) == 5
+    assert [p.text for p in root.iter('p')] == ['0', '1', '2']
+
+
+def test_text_beyond_the_limit_is_cut():
+    root = fromstring('<html><body><p>abcdef</p><p>ghijkl</p><p>mnopqr</p></body></html>')
+
+    assert limit_tree(root, DomLimits(max_text_bytes=9))
+    assert [p.text for p in root.iter('p')] == ['abcdef', 'ghi']
+
+
+def test_reject_policy():
+    root = fromstring('<html><body><div><div><p>deep</p></div></div></body></html>')
+
+    with pytest.raises(DocumentTooLarge):
+        limit_tree(root, DomLimits(max_depth=4, policy=POLICY_REJECT))
+    with pytest.raises(DocumentTooLarge):
+        limit_tree(root, DomLimits(max_nodes=3, policy=POLICY_REJECT))
@@ -0,0 +1,18 @@
+"""
+Profiling of documents
+"""
+from wanish.core import ExtractorConfig
+from wanish.profiling import DocumentProfiler
+
+from benchmarks.imageserver import ImageServer
+
+
+def test_image_selection_is_profiled_with_an_executor(corpus_page):
+    document = corpus_page('de_magazine_nocharset.html')
+
+    profiler = DocumentProfiler(memory=False)
+    with ImageServer() as server:
+        result = profiler.extract(document, ExtractorConfig(), url=server.url + '/page.html')
+
+    assert result.image_url is not None
+    assert 'wanish.images' in set(function.module for function in profiler.hot_functions(limit=1000))
@@ -0,0 +1,125 @@
+"""
+Rankings of the summarizer against the original networkx TextRank and the exact ranking of long texts
+"""
+from itertools import combinations
+import os
+import random
+
+from lxml import etree
+import numpy as np
+import pytest
+
+from wanish import lang_identifier
+from wanish.core import DEFAULT_CONFIG, DEFAULT_SUMMARY_SENTENCES_QTY, parse_document
+from wanish.summarizer import (LANG_CODES, LONG_TEXT_SENTENCES, SCORE_DIGITS, Sentence, get_sentences,
+                               get_stem_function, graph_ranks, rank, rank_sentences, sentence_stems)
+
+from benchmarks import corpus_paths
+
+
+def corpus_sentences():
+    """
+    :return: list of (file name, sentences of the article, text to detect the language by) of the corpus pages
+    """
+    pages = []
+    for path in corpus_paths():
+        with open(path, 'rb') as f:
+            source_html = parse_document(f.read())[0]
+        clean_html, _ = DEFAULT_CONFIG.article_extractor.get_clean_html(source_html=source_html)
+        sentences = get_sentences(etree.XML(clean_html))
+        pages.append((path, sentences, ''.join(' ' + sentence.text for sentence in sentences)))
+    return pages
+
+
+def networkx_scores(sentences, language):
+    """
+    Scores of the sentences by the original implementation: networkx PageRank of the similarity graph
+
+    :return: dict of scores by sentence index
+    """
+    nx = pytest.importorskip('networkx')
+
+    def similarity(s1, s2):
+        if not len(s1) or not len(s2):
+            return 0.0
+        return len(s1.intersection(s2)) / (1.0 * (len(s1) + len(s2)))
+
+    stem = get_stem_function(language)
+    words = [sentence_stems(sentence.text, stem) for sentence in sentences]
+    scores = [(i, j, similarity(words[i], words[j])) for i, j in combinations(range(len(words)), 2)]
+
+    g = nx.Graph()
+    g.add_weighted_edges_from(score for score in scores if score[2])
+    return nx.pagerank(g)
+
+
+CORPUS = corpus_sentences()
+
+
+@pytest.mark.parametrize('path, sentences, lang_text', CORPUS, ids=[os.path.basename(page[0]) for page in CORPUS])
+def test_rank_matches_networkx(path, sentences, lang_text):
+    ranking, lang_code = rank(sentences, lang_text)
+    old = networkx_scores(sentences, LANG_CODES.get(lang_identifier.classify(lang_text)[0], 'english'))
+
+    assert sorted(i for i, _, _ in ranking) == sorted(old)
+    for i, score, _ in ranking:
+        assert score == pytest.approx(old[i], rel=1e-6)
+
+    # sentences tied up to float noise are taken in their order in the text
+    assert [i for i, _, _ in ranking] == sorted(old, key=lambda i: (-round(old[i], SCORE_DIGITS), i))
+
+    # summaries of the original implementation, sorted stably by score
+    summary = sorted(old, key=lambda i: old[i], reverse=True)[:5]
+    assert set(i for i, _, _ in ranking[:5]) == set(summary)
+
+
+def test_rank_keeps_order_of_duplicated_sentences():
+    texts = ['The tram line goes north.', 'The council approved the tram line.', 'The tram line goes north.',
+             'Works start in spring.', 'The council approved the tram line.']
+    sentences = [Sentence(text, 0, i) for i, text in enumerate(texts)]
+    ranking, _ = rank(sentences, ' '.join(texts))
+
+    order = [i for i, _, _ in ranking]
+    assert order.index(0) < order.index(2)
+    assert order.index(1) < order.index(4)
+
+
+def generated_words(qty, seed):
+    """
+    :return: list of sets of stems of generated sentences, words follow the Zipf law like in real texts
+    """
+    rnd = random.Random(seed)
+    vocabulary = ['w%d' % i for i in range(3000)]
+    weights = [1.0 / (i + 1) for i in range(len(vocabulary))]
+    return [set(rnd.choices(vocabulary, weights, k=rnd.randint(5, 20))) for _ in range(qty)]
+
+
+def top(ranks, k):
+    return set(sorted(ranks, key=lambda i: -ranks[i])[:k])
+
+
+def test_short_texts_are_ranked_exactly():
+    words = generated_words(LONG_TEXT_SENTENCES, 0)
+    assert rank_sentences(words) == graph_ranks(words, range(len(words)))
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_chunked_ranking_error_is_bounded(seed):
+    words = generated_words(2 * LONG_TEXT_SENTENCES, seed)
+    exact = graph_ranks(words, range(len(words)))
+    chunked = rank_sentences(words)
+
+    indexes = sorted(exact)
+    assert sorted(chunked) == indexes
+    exact_ranks = np.array([exact[i] for i in indexes])
+    chunked_ranks = np.array([chunked[i] for i in indexes])
+
+    # the summary is made of the same sentences
+    assert top(exact, DEFAULT_SUMMARY_SENTENCES_QTY) == top(chunked, DEFAULT_SUMMARY_SENTENCES_QTY)
+
+    # order of all the sentences, distance of the rank distributions and overlap of the tops
+    correlation = np.corrcoef(exact_ranks.argsort().argsort(), chunked_ranks.argsort().argsort())[0, 1]
+    assert correlation >= 0.99
+    assert np.abs(exact_ranks / exact_ranks.sum() - chunked_ranks / chunked_ranks.sum()).sum() <= 0.03
+    assert len(top(exact, 20) & top(chunked, 20)) >= 18
+    assert len(top(exact, 100) & top(chunked, 100)) >= 80
@@ -1,51 +1,17 @@
-from lxml import etree
-from lxml.etree import strip_elements
-import requests
-from requests.exceptions import ConnectionError, Timeout
-from lxml.html import fromstring
-
-from wanish.cleaner import html_cleaner, ArticleExtractor, clean_entities, describe
-from wanish.encoding import get_encodings
-from wanish.images import get_image_url
-from wanish.title import shorten_title
-
-import chardet
-
 # Initialization of lang analyzer. Takes some time.
 from wanish.langid import LanguageIdentifier, model
 lang_identifier = LanguageIdentifier.from_modelstring(model)
 
-from wanish.summarizer import get_plain_text
-
-# Template of the resulting article
-ARTICLE_TEMPLATE = """<!DOCTYPE html>
-<html lang="%(language)s">
-<head>
-    <meta charset="utf-8">
-    <meta http-equiv="X-UA-Compatible" content="IE=edge">
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <title>Wanish cleaner</title>
-    %(description_node)s
-</head>
-<body>
-
-<article itemscope itemtype="http://schema.org/Article">
-    <meta itemprop="inLanguage" content="%(language)s">
-    %(image_url_node)s
-    <h1 itemprop="headline">%(title)s</h1>
-    <div itemprop="articleBody">
-        %(image_url_img)s
-        %(clean_html)s
-    </div>
-</article>
-
-</body>
-</html>"""
+from wanish.core import ARTICLE_TEMPLATE, ArticleResult, ExtractorConfig, extract, extract_url
 
 
 class Wanish(object):
 
-    def __init__(self, url=None, positive_keywords=None, negative_keywords=None, summary_sentences_qty=5, headers=None):
+    def __init__(self, url=None, positive_keywords=None, negative_keywords=None, summary_sentences_qty=5, headers=None,
+                 time_budget=None, max_nodes=None, max_depth=None, max_text_bytes=None, oversize_policy='truncate',
+                 summarizer=None, layouts=None, boilerplate=None, stats=False, stats_hook=None,
+                 http_cache=None, result_cache=None, dedup=None, near_duplicates=None, image_executor=True,
+                 image_cache=None, fetch_policy=None, copy_article=False):
         """
         Initialization of the class. If url is set, it gets performed.
 
@@ -54,11 +20,60 @@ class Wanish(object):
         :param negative_keywords: list of keywords, which are unlikely to be seen in classes or ids of tags
         :param summary_sentences_qty: maximum quantity of summary sentences
         :param headers: custom headers for GET request to obtain web page of the article
+        :param time_budget: seconds to perform a document, optional stages are skipped after it is spent
+        :param max_nodes: maximum quantity of elements in the parsed document
+        :param max_depth: maximum nesting depth of elements in the parsed document
+        :param max_text_bytes: maximum size of text in the parsed document, in utf-8 bytes
+        :param oversize_policy: 'truncate' or 'reject' documents beyond the limits
+        :param summarizer: summarization engine name ('textrank', 'centroid', 'lead') or summarizer.EnginePolicy
+        :param layouts: layout.LayoutStore shared between instances or True for an own store, None to find
+                        the article on every page afresh
+        :param boilerplate: boilerplate.BoilerplateStore shared between instances or True for an own store,
+                            None to keep blocks repeating across the pages of a site
+        :param stats: True to record timings of the stages and counters of every performed document
+        :param stats_hook: callable to pass every core.ArticleResult with its stats to, enables the stats
+        :param http_cache: cache.HttpCache shared between instances or its directory to request pages
+                           conditionally and to take results of not modified pages from, None to fetch pages in full
+        :param result_cache: cache.MemoryResultCache or cache.DiskResultCache shared between instances or True for
+                             an own cache, to perform identical documents once; None to perform every document
+        :param dedup: dedup index shared between instances or True for an own in-memory one, pages of the urls
+                      performed before are not performed again; None to perform every page
+        :param near_duplicates: dedup.SimHashIndex shared between instances or True for an own one, the image and
+                                summary of articles with near-duplicate texts are skipped; None to perform every
+                                article in full
+        :param image_executor: concurrent.futures.Executor to select the image in while the summary is computed,
+                               True (default) for the shared one, None to select the image before the summary
+        :param image_cache: images.DimensionsCache shared between instances or True for the shared one, images
+                            repeating across pages are downloaded once; None to download them on every page
+        :param fetch_policy: fetch.FetchPolicy of the timeouts, retries and hedged requests of pages
+        :param copy_article: True to assemble the article of deep copies of the nodes instead of moving them
         """
         # TODO: customizable redirects limit?
 
-        self._article_extractor = ArticleExtractor(positive_keywords=positive_keywords,
-                                                   negative_keywords=negative_keywords)
+        self._config = ExtractorConfig(positive_keywords=positive_keywords,
+                                       negative_keywords=negative_keywords,
+                                       summary_sentences_qty=summary_sentences_qty,
+                                       headers=headers,
+                                       time_budget=time_budget,
+                                       max_nodes=max_nodes,
+                                       max_depth=max_depth,
+                                       max_text_bytes=max_text_bytes,
+                                       oversize_policy=oversize_policy,
+                                       summarizer=summarizer,
+                                       layouts=layouts,
+                                       boilerplate=boilerplate,
+                                       stats=stats,
+                                       stats_hook=stats_hook,
+                                       http_cache=http_cache,
+                                       result_cache=result_cache,
+                                       dedup=dedup,
+                                       near_duplicates=near_duplicates,
+                                       image_executor=image_executor,
+                                       image_cache=image_cache,
+                                       fetch_policy=fetch_policy,
+                                       copy_article=copy_article)
+
+        self.result = None  # ArticleResult of the last performed document
 
         self.url = None  # source web-page url
         self.canonical_url = None  # canonical web-page url if present, otherwise same as url
@@ -70,16 +85,13 @@ class Wanish(object):
         self.description = None  # summarized description (text only)
 
         self.error_msg = None  # error message
+        self.degraded = ()  # stages skipped because of the time budget or performed on a truncated document
+        self.stats = None  # stats.DocumentStats of the document if the stats are enabled
+        self.duplicate_of = None  # normalized url the document was performed by before, if it is a duplicate
+        self.simhash = None  # SimHash signature of the text of the article
+        self.near_duplicate_of = None  # key of the near-duplicate article performed before, if there is one
 
-        self._source_html = None  # source html of the document (lxml doc)
         self._charset = None  # source html encoding
-        self._headers = headers if type(headers) == dict else {}  # custom headers for GET request
-
-        # summarized text sentences quantity
-        try:
-            self._summary_sentences_qty = summary_sentences_qty
-        except (TypeError, ValueError):
-            self._summary_sentences_qty = 5
 
         # perform the url if defined
         if url:
@@ -91,95 +103,31 @@ class Wanish(object):
 
         :param url: web-page url of the document
         """
-        self.url = url
-        self.title = self.image_url = self.language = self.description = \
-            self.clean_html = self.error_msg = self._charset = None
-
-        if not self.url:
-            self.error_msg = 'Empty or null URL to perform'
-            return
-
-        # get the page (bytecode)
-        try:
-            web_page = requests.get(self.url, headers=self._headers)
-
-            # perform http status codes
-            if web_page.status_code not in [200, 301, 302]:
-                self.error_msg = str('HTTP error. Status: %s' % web_page.status_code)
-                return
-
-            self.url = web_page.url
-
-            raw_html = web_page.content
-
-            # getting content_type from headers to obtain encoding, will use it if it is not specified on page
-            page_encodings = get_encodings(raw_html)
-
-            if len(page_encodings) > 0:
-                self._charset = page_encodings[0]
-            elif web_page.encoding is not None:
-                self._charset = web_page.encoding
-            else:
-                res = chardet.detect(raw_html)
-                self._charset = res['encoding']
-
-            string_source = raw_html.decode(self._charset, "ignore")
-            self._source_html = fromstring(string_source)
-
-            # searching for canonical url
-            link_canonicals = self._source_html.xpath("//link[normalize-space(@rel)='canonical']/@href")
-            self.canonical_url = link_canonicals[0] if len(link_canonicals) > 0 else self.url
-
-            self._source_html = html_cleaner.clean_html(self._source_html)
-
-            # making links absolute
-            self._source_html.make_links_absolute(self.url, resolve_base_href=True)
-
-            strip_elements(self._source_html, 'blockquote', 'code', 'table', 'ol', 'ul',
-                           'embedded', 'input', 'address', 'iframe', 'textarea', 'dl')
-
-        except (ConnectionError, Timeout, TypeError, Exception) as e:
-            self.error_msg = str(e)
-        finally:
-            if self.error_msg:
-                return
-
-        if self._source_html is not None:
-
-            # clean html of the article and its starting node
-            self.clean_html, starting_node = self._article_extractor.get_clean_html(source_html=self._source_html)
-
-            # obtaining title
-            short_title, title_node = shorten_title(self._source_html, starting_node)
-            self.title = clean_entities(short_title)
-
-            # obtaining image url
-            self.image_url = get_image_url(self._source_html, self.url, self._headers, starting_node, title_node)
-            if self.image_url is not None:
-                image_url_node = "<meta itemprop=\"image\" content=\"%s\">" % self.image_url
-                image_url_img = "<img src=\"%s\" />" % self.image_url
-            else:
-                image_url_node = image_url_img = ""
-
-            # summarized description, requires clean_html
-            if self.clean_html:
-                self.description, self.language = get_plain_text(etree.XML(self.clean_html),
-                                                                 self._summary_sentences_qty)
-
-                description_node = ""
-                if self.description:
-                    # Replacing \xc2\xa0 and \xa0 in result with space
-                    self.description = self.description.replace(u'\xc2\xa0', u' ').replace(u'\xa0', u' ')
-                    self.description = clean_entities(self.description)
-                    self.description = ' '.join(self.description.split())
-                    description_node = "<meta name=\"description\" content=\"%s\">" if self.description else ""
-
-                # filling the template
-                self.clean_html = ARTICLE_TEMPLATE % {
-                    'language': self.language,
-                    'title': self.title,
-                    'image_url_node': image_url_node,
-                    'image_url_img': image_url_img,
-                    'description_node': description_node,
-                    'clean_html': self.clean_html
-                }
+        self.result = extract_url(url, self._config)
+
+        self.url = self.result.url
+        self.canonical_url = self.result.canonical_url
+        self.title = self.result.title
+        self.image_url = self.result.image_url
+        self.language = self.result.language
+        self.clean_html = self.result.clean_html
+        self.description = self.result.description
+        self.error_msg = self.result.error_msg
+        self.degraded = self.result.degraded
+        self.stats = self.result.stats
+        self.duplicate_of = self.result.duplicate_of
+        self.simhash = self.result.simhash
+        self.near_duplicate_of = self.result.near_duplicate_of
+        self._charset = self.result.charset
+
+    def summary(self, sentences_qty):
+        """
+        Summarized description of the performed document of another length. The sentences are ranked only once
+        per document, so descriptions of several lengths cost almost nothing.
+
+        :param sentences_qty: maximum quantity of summary sentences
+        :return: summarized description (text only), None if no document was performed
+        """
+        if self.result is None or self.description is None:
+            return None
+        return self.result.summary(sentences_qty)
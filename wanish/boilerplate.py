@@ -0,0 +1,167 @@
+"""
+Boilerplate blocks learned across the pages of a site.
+
+Navigation, footers, related stories and banners repeat on every page of a site. Each block of a page is
+fingerprinted bottom-up by its tag, normalized text and the fingerprints of its children, so a block matches
+only an identical block. Blocks seen on enough pages of a domain are dropped before the article is searched.
+"""
+from collections import OrderedDict
+from hashlib import blake2b
+
+from lxml import etree
+
+from wanish.stores import DomainStore
+
+# tags of blocks, which are fingerprinted
+BLOCK_TAGS = frozenset(('div', 'section', 'aside', 'nav', 'header', 'footer', 'form', 'center'))
+
+MIN_BLOCK_TEXT = 20  # minimal length of text in a block to fingerprint it
+MIN_PAGES = 3  # quantity of pages of a domain a block should be seen on to be dropped
+MAX_BLOCK_SHARE = 0.5  # maximum share of the page text in a dropped block
+MAX_FINGERPRINTS = 2000  # quantity of block fingerprints kept per domain
+MAX_PAGES = 200  # quantity of page fingerprints kept per domain to count every page once
+MAX_DOMAINS = 1000  # quantity of domains kept by default
+
+FINGERPRINT_SIZE = 8  # bytes
+
+DIGITS_TABLE = str.maketrans('123456789', '000000000')
+
+
+def normalize_text(text):
+    """
+    :param text: text of a node
+    :return: lowercase text with single spaces and digits replaced with zero
+    """
+    if not text:
+        return ''
+    return ' '.join(text.translate(DIGITS_TABLE).lower().split())
+
+
+def block_fingerprints(root):
+    """
+    Fingerprints the blocks of a document in one pass
+
+    :param root: root element of a document
+    :return: list of (element, fingerprint, text length) of the blocks, descendants go before their ancestors,
+             fingerprint of the whole document, its text length
+    """
+    blocks = []
+    stack = []  # [parts of the node, text length of the node] of the current branch
+    digest = ''
+    length = 0
+
+    for event, elem in etree.iterwalk(root, events=('start', 'end')):
+        if event == 'start':
+            text = normalize_text(elem.text)
+            stack.append([[elem.tag if isinstance(elem.tag, str) else '', text], len(text)])
+            continue
+
+        parts, length = stack.pop()
+        digest = blake2b('\x00'.join(parts).encode('utf-8'), digest_size=FINGERPRINT_SIZE).hexdigest()
+        if length >= MIN_BLOCK_TEXT and elem.tag in BLOCK_TAGS:
+            blocks.append((elem, digest, length))
+
+        if stack and elem is not root:
+            tail = normalize_text(elem.tail)
+            parent = stack[-1]
+            parent[0].append(digest)
+            parent[0].append(tail)
+            parent[1] += length + len(tail)
+
+    return blocks, digest, length
+
+
+class SiteBoilerplate(object):
+    """
+    Fingerprints of blocks of one domain with the quantities of pages they were seen on
+    """
+    __slots__ = ('blocks', 'pages')
+
+    def __init__(self, blocks=None, pages=None):
+        self.blocks = OrderedDict(blocks or ())  # quantity of pages by fingerprint, least recently seen go first
+        self.pages = OrderedDict(pages or ())  # fingerprints of the counted pages
+
+    def record(self, fingerprints, page, max_fingerprints=MAX_FINGERPRINTS, max_pages=MAX_PAGES):
+        """
+        Counts the blocks of a page, a page is counted only once
+
+        :param fingerprints: set of fingerprints of the blocks of the page
+        :param page: fingerprint of the page
+        :param max_fingerprints: quantity of fingerprints to keep
+        :param max_pages: quantity of page fingerprints to keep
+        """
+        if page in self.pages:
+            self.pages.move_to_end(page)
+            return
+        self.pages[page] = True
+        while len(self.pages) > max_pages:
+            self.pages.popitem(last=False)
+
+        for fingerprint in fingerprints:
+            self.blocks[fingerprint] = self.blocks.get(fingerprint, 0) + 1
+            self.blocks.move_to_end(fingerprint)
+        while len(self.blocks) > max_fingerprints:
+            self.blocks.popitem(last=False)
+
+
+class BoilerplateStore(DomainStore):
+    """
+    Fingerprints of the blocks of pages by domain. Every performed page is counted in, blocks seen on min_pages
+    previous pages of the domain are dropped from the next ones.
+    """
+
+    def __init__(self, max_domains=MAX_DOMAINS, min_pages=MIN_PAGES, max_fingerprints=MAX_FINGERPRINTS):
+        """
+        :param max_domains: maximum quantity of domains to keep
+        :param min_pages: quantity of pages a block should be seen on to be dropped
+        :param max_fingerprints: maximum quantity of block fingerprints per domain
+        """
+        super(BoilerplateStore, self).__init__(max_domains)
+        self.min_pages = min_pages
+        self.max_fingerprints = max_fingerprints
+
+    def strip(self, domain, root):
+        """
+        Drops the boilerplate blocks of the domain from a document and counts the blocks of the document
+
+        :param domain: domain of the document
+        :param root: root element of the document
+        :return: quantity of dropped blocks
+        """
+        if domain is None:
+            return 0
+
+        blocks, page, page_length = block_fingerprints(root)
+
+        with self._lock:
+            site = self._entries.get(domain)
+            if site is None:
+                site = SiteBoilerplate()
+            known = frozenset(fingerprint for elem, fingerprint, length in blocks
+                              if site.blocks.get(fingerprint, 0) >= self.min_pages)
+            site.record(set(fingerprint for elem, fingerprint, length in blocks), page, self.max_fingerprints)
+            self._put(domain, site)
+
+        if not known:
+            return 0
+
+        max_length = page_length * MAX_BLOCK_SHARE
+        boilerplate = set(elem for elem, fingerprint, length in blocks
+                          if fingerprint in known and length <= max_length)
+
+        dropped = 0
+        for elem in [elem for elem, fingerprint, length in blocks if elem in boilerplate]:
+            # the outermost boilerplate blocks are dropped with their descendants
+            if not any(ancestor in boilerplate for ancestor in elem.iterancestors()):
+                elem.drop_tree()
+                dropped += 1
+        return dropped
+
+    def encode(self, entry):
+        return {
+            'blocks': [[fingerprint, qty] for fingerprint, qty in entry.blocks.items()],
+            'pages': list(entry.pages),
+        }
+
+    def decode(self, data):
+        return SiteBoilerplate(data.get('blocks', ()), ((page, True) for page in data.get('pages', ())))
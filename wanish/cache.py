@@ -0,0 +1,283 @@
+"""
+Caches of extraction results.
+
+The HTTP cache keeps validators of fetched pages with their results for re-crawls: a page is requested
+conditionally, and its result is taken from the cache if the server answers it is not modified.
+
+Result caches keep results by the hash of the decoded document and of the config, so byte-identical copies of
+a page (mirrors, syndicated articles, urls differing by tracking parameters) are performed once.
+"""
+from collections import namedtuple, OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # total size of the cached entries
+DEFAULT_MAX_AGE = 7 * 24 * 3600  # sec, entries not used or validated for longer are dropped
+DEFAULT_MAX_ENTRIES = 10000  # quantity of results kept in memory
+
+DOCUMENT_KEY_SIZE = 16  # bytes of the hash of a document
+
+ENTRY_SUFFIX = '.json'
+
+# cached page
+CacheEntry = namedtuple('CacheEntry', [
+    'url',  # requested url of the page
+    'etag',  # ETag of the response, None if it had none
+    'last_modified',  # Last-Modified of the response, None if it had none
+    'result',  # dict of the ArticleResult, see ArticleResult.to_dict()
+])
+
+
+def document_key(document, fingerprint):
+    """
+    :param document: decoded html of the document
+    :param fingerprint: string identifying everything else the result depends on
+    :return: hex key of the result
+    """
+    digest = hashlib.blake2b(fingerprint.encode('utf-8'), digest_size=DOCUMENT_KEY_SIZE)
+    digest.update(b'\x00')
+    digest.update(document.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+class DiskStore(object):
+    """
+    Thread-safe store of JSON entries by key in a directory, one file per entry. Files are replaced atomically, so
+    several processes may share the directory. The time of a file is the time the entry was last used: entries
+    unused for longer than max_age are dropped, and the least recently used ones are evicted beyond max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        """
+        :param directory: directory of the store, created if it is missing
+        :param max_bytes: maximum total size of the entries
+        :param max_age: seconds an entry is kept without being used, None for no limit
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+        # sizes of the entries by key, the least recently used first
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(ENTRY_SUFFIX):
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name[:-len(ENTRY_SUFFIX)], stat.st_size))
+        entries.sort()
+        self._sizes = OrderedDict((key, size) for mtime, key, size in entries)
+        self._total = sum(self._sizes.values())
+
+        with self._lock:
+            self._evict()
+
+    def __len__(self):
+        return len(self._sizes)
+
+    @property
+    def size(self):
+        """
+        :return: total size of the entries in bytes
+        """
+        return self._total
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def _forget(self, key):
+        self._total -= self._sizes.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._sizes and self._total > self.max_bytes:
+            self._forget(next(iter(self._sizes)))
+
+    def _read(self, key):
+        """
+        :param key: key of the entry
+        :return: entry, None if it is missing or has expired
+        """
+        path = self._path(key)
+        try:
+            if self.max_age is not None and os.path.getmtime(path) + self.max_age < time.time():
+                with self._lock:
+                    self._forget(key)
+                return None
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _touch(self, key):
+        """
+        Marks the entry as used now
+
+        :param key: key of the entry
+        """
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            return
+        with self._lock:
+            if key in self._sizes:
+                self._sizes.move_to_end(key)
+
+    def _write(self, key, entry):
+        """
+        :param key: key of the entry
+        :param entry: JSON-serializable entry
+        """
+        path = self._path(key)
+        data = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+
+        tmp_path = '%s.%s.%s.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total += len(data) - self._sizes.pop(key, 0)
+            self._sizes[key] = len(data)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._sizes):
+                self._forget(key)
+
+
+class HttpCache(DiskStore):
+    """
+    Cache of fetched pages by their requested url: validators of the response and the extraction result
+    """
+
+    @staticmethod
+    def key_of(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def get(self, url):
+        """
+        :param url: requested url of the page
+        :return: CacheEntry of the page, None if it is not cached or has expired
+        """
+        data = self._read(self.key_of(url))
+        if data is None or data.get('url') != url:
+            # a missing page or another url with the same hash
+            return None
+        return CacheEntry(url, data.get('etag'), data.get('last_modified'), data.get('result'))
+
+    def touch(self, url):
+        """
+        Marks the page as used and validated now
+
+        :param url: requested url of the page
+        """
+        self._touch(self.key_of(url))
+
+    def put(self, url, etag, last_modified, result):
+        """
+        :param url: requested url of the page
+        :param etag: ETag of the response
+        :param last_modified: Last-Modified of the response
+        :param result: dict of the ArticleResult, see ArticleResult.to_dict()
+        """
+        self._write(self.key_of(url), {'url': url, 'etag': etag, 'last_modified': last_modified, 'result': result})
+
+    def discard(self, url):
+        """
+        :param url: requested url of the page
+        """
+        with self._lock:
+            self._forget(self.key_of(url))
+
+
+def conditional_headers(entry):
+    """
+    :param entry: CacheEntry of the page
+    :return: dict of the headers to request the page if it was modified
+    """
+    headers = {}
+    if entry.etag:
+        headers['If-None-Match'] = entry.etag
+    if entry.last_modified:
+        headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+
+class MemoryResultCache(object):
+    """
+    Thread-safe LRU cache of results by document key in memory
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        :param max_entries: maximum quantity of results
+        """
+        if max_entries < 1:
+            raise ValueError("A cache should keep at least one result")
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        :param key: key of the document, see document_key()
+        :return: dict of the ArticleResult, None if it is not cached
+        """
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        """
+        :param key: key of the document, see document_key()
+        :param result: dict of the ArticleResult, see ArticleResult.to_dict()
+        """
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskResultCache(DiskStore):
+    """
+    LRU cache of results by document key on disk, it may be shared by processes
+    """
+
+    def get(self, key):
+        """
+        :param key: key of the document, see document_key()
+        :return: dict of the ArticleResult, None if it is not cached or has expired
+        """
+        result = self._read(key)
+        if result is not None:
+            self._touch(key)
+        return result
+
+    def put(self, key, result):
+        """
+        :param key: key of the document, see document_key()
+        :param result: dict of the ArticleResult, see ArticleResult.to_dict()
+        """
+        self._write(key, result)
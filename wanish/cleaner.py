@@ -7,6 +7,10 @@ from lxml.html.clean import Cleaner
 
 from copy import deepcopy
 
+from wanish.entities import Replacer
+from wanish.layout import find_by_path
+from wanish.stats import NULL_RECORDER, COUNTER_CANDIDATES, COUNTER_RETRY
+
 REGEXES = {
     'unlikelyCandidatesRe': re.compile(
             'combx|comment|community|disqus|extra|foot|header|menu|remark|rss|shoutbox'
@@ -58,23 +62,43 @@ ESCAPED_ENTITIES = {
 
 class ArticleExtractor(object):
     """
-    Class for article extraction from web page by given URL
+    Class for article extraction from web page by given URL.
+
+    The extractor keeps only its configuration, the performed tree is passed between the methods,
+    so one instance may be shared by several threads.
     """
 
     TEXT_LENGTH_THRESHOLD = 25  # threshold
     RETRY_LENGTH = 250
+    LAYOUT_LINK_DENSITY = 0.33  # maximum link density of an article found by a learned layout
 
-    def __init__(self, positive_keywords=None, negative_keywords=None):
-        self._html = None
+    def __init__(self, positive_keywords=None, negative_keywords=None, copy_article=True):
+        """
+        :param positive_keywords: list of keywords, which are likely to be seen in classes or ids of tags
+        :param negative_keywords: list of keywords, which are unlikely to be seen in classes or ids of tags
+        :param copy_article: if True, the article is assembled of deep copies of the source nodes and the source tree
+                             stays intact. If False, the chosen nodes are moved into the article while it is cleaned,
+                             and they are put back afterwards with the nodes dropped while sanitizing.
+        """
         self._positive_keywords = compile_pattern(positive_keywords)
         self._negative_keywords = compile_pattern(negative_keywords)
+        self._copy_article = copy_article
 
-    def get_clean_html(self, source_html=None, html_partial=False):
+    def fingerprint(self):
+        """
+        :return: string identifying the keywords of the extractor
+        """
+        return repr(tuple(getattr(pattern, 'pattern', None)
+                          for pattern in (self._positive_keywords, self._negative_keywords)))
+
+    def get_clean_html(self, source_html=None, html_partial=False, containers=None, recorder=NULL_RECORDER):
         """
         Getting cleaned summary of the html article and its node.
 
         :param source_html: source HTML object
         :param html_partial: return only the div of the document, don't wrap in html and body tags.
+        :param containers: list to put the node containing the article in, for learning the layout of the site
+        :param recorder: stats recorder of the document, counts candidates and retries
         """
         if source_html is None:
             return None, None
@@ -83,25 +107,42 @@ class ArticleExtractor(object):
             ruthless = True  # flag to remove unworthy candidates
 
             while True:
-                self._html = source_html  # reinitialization of current performing html
+                html = source_html  # reinitialization of current performing html
 
-                self.clean_definitely_useless_nodes()  # cleaning unneeded data
+                self.clean_definitely_useless_nodes(html)  # cleaning unneeded data
 
                 # narrowing the scope to articleBody, article or body tags.
-                html_partial = self.narrow_scope(html_partial)
+                html, html_partial = self.narrow_scope(html, html_partial)
 
                 # get initial candidates
-                candidates = self.find_candidates(ruthless)
-
-                # raw possible article
-                article, ruthless, should_continue, first_node = self.get_possible_article(
-                    candidates, html_partial, ruthless
-                )
-
-                if should_continue is True:
-                    continue
-
-                cleaned_article = self.sanitize(article, candidates)
+                candidates = self.find_candidates(html, ruthless)
+                recorder.set(COUNTER_CANDIDATES, len(candidates))
+                recorder.set(COUNTER_RETRY, int(not ruthless))
+
+                # nodes moved out of the source tree to be put back after sanitizing (zero-copy mode only)
+                moved = None if self._copy_article else []
+                dropped = None
+
+                if containers is not None:
+                    del containers[:]
+
+                try:
+                    # raw possible article
+                    article, ruthless, should_continue, first_node = self.get_possible_article(
+                        html, candidates, html_partial, ruthless, moved=moved, containers=containers
+                    )
+
+                    if should_continue is True:
+                        continue
+
+                    # nodes dropped from the moved siblings are put back too
+                    dropped = [] if moved else None
+                    cleaned_article = self.sanitize(article, candidates, dropped=dropped)
+                finally:
+                    if dropped:
+                        self.restore_dropped(dropped)
+                    if moved:
+                        self.restore_siblings(moved)
 
                 article_length = len(cleaned_article or '')
                 retry_length = self.RETRY_LENGTH
@@ -120,54 +161,111 @@ class ArticleExtractor(object):
         # not found
         return None, None
 
-    def find_candidates(self, ruthless):
+    def get_clean_html_by_layout(self, source_html, article_path, html_partial=False, recorder=NULL_RECORDER):
+        """
+        Getting cleaned summary of the html article from the node found by the layout learned on another page
+        of the site. Only the paragraphs of that node are scored.
+
+        The layout holds if the best candidate of the node is its child, its link density is low and the article
+        is not too short. Otherwise the tree may be performed by get_clean_html() as usual.
+
+        :param source_html: source HTML object
+        :param article_path: signature path of the node containing the article, see layout.signature_path()
+        :param html_partial: return only the div of the document, don't wrap in html and body tags.
+        :param recorder: stats recorder of the document, counts candidates
+        :return: cleaned article and its starting node, (None, None) if the layout does not hold
+        """
+        container = find_by_path(source_html, article_path)
+        if container is None:
+            return None, None
+
+        try:
+            self.clean_definitely_useless_nodes(source_html)
+            html_partial = self.narrow_scope(source_html, html_partial)[1]
+
+            candidates = self.find_candidates(container, ruthless=True)
+            recorder.set(COUNTER_CANDIDATES, len(candidates))
+            best_candidate = self.select_best_candidate(candidates)
+            if container.getparent() is None or best_candidate is None \
+                    or best_candidate['elem'].getparent() is not container \
+                    or self.get_link_density(best_candidate['elem']) > self.LAYOUT_LINK_DENSITY:
+                return None, None
+
+            moved = None if self._copy_article else []
+            dropped = None if self._copy_article else []
+            try:
+                article, first_node = self.get_article(candidates, best_candidate, html_partial=html_partial,
+                                                       moved=moved)
+                cleaned_article = self.sanitize(article, candidates, dropped=dropped)
+            finally:
+                if dropped:
+                    self.restore_dropped(dropped)
+                if moved:
+                    self.restore_siblings(moved)
+
+        except Exception as e:
+            # unable to summarize
+            raise Unparseable(str(e))
+
+        if len(cleaned_article or '') < self.RETRY_LENGTH:
+            return None, None
+        return cleaned_article, first_node
+
+    def find_candidates(self, html, ruthless):
         """
         Finds candidate nodes containing possible text articles.
+        :param html: performed html element
         :param ruthless: flag to remove candidates which are unlikely to contain correct article
         :return: list of candidate nodes
         """
 
         # cleaning useless tag subtrees
-        for i in self.tags(self._html, 'script', 'style'):
+        for i in self.tags(html, 'script', 'style'):
             i.drop_tree()
-        for i in self.tags(self._html, 'body'):
+        for i in self.tags(html, 'body'):
             i.set('id', 'readabilityBody')
 
         if ruthless:
-            self.remove_unlikely_candidates()
+            self.remove_unlikely_candidates(html)
 
         # transforms all <div> without another block elements into <p>
-        self.transform_misused_divs_into_paragraphs()
+        self.transform_misused_divs_into_paragraphs(html)
 
         # collecting candidate nodes scoring them by density and content length
-        candidates = self.score_paragraphs()
+        candidates = self.score_paragraphs(html)
 
         return candidates
 
-    def narrow_scope(self, html_partial=False):
+    @staticmethod
+    def narrow_scope(html, html_partial=False):
         """
-        Narrows the scope of self._html to articleBody, article or body tags if present
+        Narrows the scope of html to articleBody, article or body tags if present
 
-        :return:
+        :param html: performed html element
+        :param html_partial: current html_partial flag
+        :return: narrowed html element and html_partial flag
         """
-        if self._html is not None:
-            article_body = self._html.xpath("//*[@itemprop='articleBody']")
-            articles = self._html.xpath("//article")
-            body = self._html.xpath("//body")
+        if html is not None:
+            article_body = html.xpath("//*[@itemprop='articleBody']")
+            articles = html.xpath("//article")
+            body = html.xpath("//body")
 
             for data in (article_body, articles, body):
                 if len(data) > 0:
-                    self._html = data[0]
+                    html = data[0]
                     html_partial = True
 
-        return html_partial
+        return html, html_partial
 
-    def get_possible_article(self, candidates, html_partial, ruthless):
+    def get_possible_article(self, html, candidates, html_partial, ruthless, moved=None, containers=None):
         """
         Tries to fetch an article among the given candidates
+        :param html: performed html element
         :param candidates:
         :param html_partial:
         :param ruthless:
+        :param moved: list to collect moved nodes for restoring, if None the article nodes are copied
+        :param containers: list to put the parent of the best candidate in
         :return:
         """
         should_continue = False
@@ -178,8 +276,11 @@ class ArticleExtractor(object):
         best_candidate = self.select_best_candidate(candidates)
 
         if best_candidate:
+            if containers is not None:
+                containers.append(best_candidate['elem'].getparent())
+
             # forming an article from the best candidate
-            article, first_node = self.get_article(candidates, best_candidate, html_partial=html_partial)
+            article, first_node = self.get_article(candidates, best_candidate, html_partial=html_partial, moved=moved)
         else:
             if ruthless:
                 # too much was removed - doing a new iteration of performing without removal of unlikely nodes
@@ -188,10 +289,10 @@ class ArticleExtractor(object):
 
             else:
                 # second iteration failed - working with html as it is
-                article = self._html.find('body')
+                article = html.find('body')
 
                 if article is None:
-                    article = self._html
+                    article = html
 
         return article, ruthless, should_continue, first_node
 
@@ -213,11 +314,14 @@ class ArticleExtractor(object):
             for e in reversed(node.findall('.//%s' % tag_name)):
                 yield e
 
-    def remove_unlikely_candidates(self):
+    @staticmethod
+    def remove_unlikely_candidates(html):
         """
         Removes undesired tags including subtrees from html pages.
+
+        :param html: performed html element
         """
-        for elem in self._html.iter():
+        for elem in html.iter():
             s = "%s %s" % (elem.get('class', ''), elem.get('id', ''))
             if len(s) < 2:
                 continue
@@ -226,11 +330,13 @@ class ArticleExtractor(object):
                     and elem.tag not in ['html', 'body']:
                 elem.drop_tree()
 
-    def transform_misused_divs_into_paragraphs(self):
+    def transform_misused_divs_into_paragraphs(self, html):
         """
         Transforms <div> without other block elements into <p>, merges near-standing <p> together.
+
+        :param html: performed html element
         """
-        for elem in self.tags(self._html, 'div'):
+        for elem in self.tags(html, 'div'):
             # transform <div>s that do not contain other block elements into
             # <p>s
             # FIXME: The current implementation ignores all descendants that are not direct children of elem
@@ -239,7 +345,7 @@ class ArticleExtractor(object):
             if not REGEXES['divToPElementsRe'].search(tostring(elem).decode()):
                 elem.tag = "p"
 
-        for elem in self.tags(self._html, 'div'):
+        for elem in self.tags(html, 'div'):
             if elem.text and elem.text.strip():
                 p = fragment_fromstring('<p/>')
                 p.text = elem.text
@@ -256,17 +362,18 @@ class ArticleExtractor(object):
                 if child.tag == 'br':
                     child.drop_tree()
 
-    def score_paragraphs(self):
+    def score_paragraphs(self, html):
         """
         Evaluates paragraphs, forms a list of candidate texts by paragraph length and links density.
 
+        :param html: performed html element
         :return: list of candidates
         """
 
         min_len = self.TEXT_LENGTH_THRESHOLD
         candidates = {}
         ordered = []
-        for elem in self.tags(self._html, "p", "pre", "td"):
+        for elem in self.tags(html, "p", "pre", "td"):
             parent_node = elem.getparent()
             if parent_node is None:
                 continue
@@ -401,7 +508,7 @@ class ArticleExtractor(object):
         total_length = text_length(elem)
         return float(link_length) / max(total_length, 1)
 
-    def get_article(self, candidates, best_candidate, html_partial=False):
+    def get_article(self, candidates, best_candidate, html_partial=False, moved=None):
         """
         Initial article cleansing. Siblings of the top candidate are looked through for content
         that might also be related. Things like preambles, content split by ads that we removed, etc.
@@ -409,6 +516,9 @@ class ArticleExtractor(object):
         :param candidates: list of candidate nodes
         :param best_candidate: best candidate from the list
         :param html_partial: flag to perform an article: True = full html, False = html fragment
+        :param moved: if None, appended siblings are deep copies of the source nodes. Otherwise the siblings
+                      are moved into the output without copying and their original parent and children
+                      are added to this list for restore_siblings()
         :return: calculated link density of the element
         """
         sibling_score_threshold = max([
@@ -420,7 +530,12 @@ class ArticleExtractor(object):
         best_elem = best_candidate['elem']
         first_appended_element = None
 
-        for sibling in best_elem.getparent().getchildren():
+        parent = best_elem.getparent()
+        siblings = parent.getchildren()
+        if moved is not None:
+            moved.append((parent, siblings))
+
+        for sibling in siblings:
             append = True if sibling is best_elem else self.is_appendable(sibling,
                                                                           candidates,
                                                                           sibling_score_threshold)
@@ -429,14 +544,62 @@ class ArticleExtractor(object):
                 if first_appended_element is None and sibling.text is not None and len(clean(sibling.text)) >= 5:
                     first_appended_element = sibling
 
+                if moved is None:
+                    sibling = deepcopy(sibling)
+
                 # We don't want to append directly to output, but the div in html->body->div
                 if html_partial:
-                    output.append(deepcopy(sibling))
+                    output.append(sibling)
                 else:
-                    output.getchildren()[0].getchildren()[0].append(deepcopy(sibling))
+                    output.getchildren()[0].getchildren()[0].append(sibling)
 
         return output, first_appended_element
 
+    @staticmethod
+    def restore_siblings(moved):
+        """
+        Puts nodes moved by get_article() back to their original parents in the original order.
+        Nodes dropped while sanitizing are restored by restore_dropped() beforehand.
+
+        :param moved: list of (parent, original children) pairs filled by get_article()
+        """
+        for parent, children in moved:
+            position = 0
+            for child in children:
+                if child.getparent() is None:
+                    continue
+                parent.insert(position, child)
+                position += 1
+
+    @staticmethod
+    def drop_tree(elem, dropped=None):
+        """
+        Removes the element with its subtree, the tail of the element is kept by its previous node.
+
+        :param elem: element to remove
+        :param dropped: if None, the element is dropped for good. Otherwise the element is detached and added
+                        to this list with its place, for restore_dropped()
+        """
+        if dropped is not None:
+            parent = elem.getparent()
+            previous = elem.getprevious()
+            dropped.append((elem, parent, parent.index(elem), parent.text if previous is None else previous.tail))
+        elem.drop_tree()
+
+    @staticmethod
+    def restore_dropped(dropped):
+        """
+        Puts nodes removed by drop_tree() back to their places, the latest first, with the text around them
+
+        :param dropped: list of (element, parent, index, text before the element) filled by drop_tree()
+        """
+        for elem, parent, index, text in reversed(dropped):
+            if index == 0:
+                parent.text = text
+            else:
+                parent[index - 1].tail = text
+            parent.insert(index, elem)
+
     @staticmethod
     def initial_output(html_partial=False):
         """
@@ -473,21 +636,22 @@ class ArticleExtractor(object):
 
         return append
 
-    def sanitize(self, node, candidates):
+    def sanitize(self, node, candidates, dropped=None):
         """
         Sanitizing html node by different criteria.
 
         :param node: source html-fragment
         :param candidates: list of node candidates
+        :param dropped: list to keep the dropped nodes in for restore_dropped(), None to drop them for good
         :return: cleaned html fragment, containing base tags without attributes
         """
 
         for header in self.tags(node, "h1", "h2", "h3", "h4", "h5", "h6"):
             if self.class_weight(header) < 0 or self.get_link_density(header) > 0.33:
-                header.drop_tree()
+                self.drop_tree(header, dropped)
 
         for elem in self.tags(node, "form", "iframe", "textarea"):
-            elem.drop_tree()
+            self.drop_tree(elem, dropped)
         allowed = {}
 
         # Conditionally clean <table>s, <ul>s, and <div>s
@@ -501,14 +665,12 @@ class ArticleExtractor(object):
                 content_score = 0
 
             if weight + content_score < 0:
-                el.drop_tree()
+                self.drop_tree(el, dropped)
             elif el.text_content().count(",") < 10:
-                self.remove_unnecessary_element(el, weight, allowed)
-
-        self._html = node
+                self.remove_unnecessary_element(el, weight, allowed, dropped)
 
         # # removing subtrees without text
-        # for child in self._html.getroottree().iter("*"):
+        # for child in node.getroottree().iter("*"):
         #     has_text = False
         #     for txt in child.itertext():
         #         if len(txt.strip(' \t\n')) > 0:
@@ -517,15 +679,16 @@ class ArticleExtractor(object):
         #     if not has_text:
         #         child.clear()
 
-        return clean_attributes(etree.tostring(self._html).decode())
+        return clean_attributes(etree.tostring(node).decode())
 
-    def remove_unnecessary_element(self, element, weight, allowed):
+    def remove_unnecessary_element(self, element, weight, allowed, dropped=None):
         """
         Removes insignificant element trees
 
         :param element: element to perform
         :param weight: weight of a given node
         :param allowed: list of elements which are allowed and will be not removed in future
+        :param dropped: list to keep the dropped element in for restore_dropped(), None to drop it for good
         :return:
         """
 
@@ -555,7 +718,7 @@ class ArticleExtractor(object):
         to_remove = self.check_if_allowed(element, allowed, to_remove)
 
         if to_remove:
-            element.drop_tree()
+            self.drop_tree(element, dropped)
 
     @staticmethod
     def counts_conditions(counts):
@@ -620,11 +783,14 @@ class ArticleExtractor(object):
 
         return siblings
 
-    def clean_definitely_useless_nodes(self):
+    @staticmethod
+    def clean_definitely_useless_nodes(html):
         """
         Removes nodes which do not contain useful information
+
+        :param html: performed html element
         """
-        useless_nodes = self._html.xpath(
+        useless_nodes = html.xpath(
             '//*[re:test(@class, "comment|komment|modal|adblock|bottom_info")]',
             namespaces={'re': "http://exslt.org/regular-expressions"}
         )
@@ -735,13 +901,14 @@ def compile_pattern(elements):
     return re.compile('|'.join([re.escape(x.lower()) for x in elements]), re.U)
 
 
+# all the escaped entities are replaced in one pass
+unescape_entities = Replacer.from_variants(ESCAPED_ENTITIES)
+
+
 def clean_entities(text):
     """
     Cleans text of escaped entities.
     :param text: input text
     :return: text without escaped entities
     """
-    for key, seq in ESCAPED_ENTITIES.items():
-        for val in seq:
-            text = text.replace(val, key)
-    return text
+    return unescape_entities(text)
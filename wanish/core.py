@@ -0,0 +1,813 @@
+"""
+Reentrant extraction core.
+
+The functions of this module keep no state between calls: everything they need comes with the document and
+an immutable ExtractorConfig, everything they produce is returned as an immutable ArticleResult.
+One config may be shared by any number of threads.
+"""
+from collections import namedtuple, OrderedDict
+from concurrent.futures import wait
+from types import MappingProxyType
+from urllib.parse import urljoin
+
+from lxml import etree
+from lxml.etree import strip_elements
+from lxml.html import fromstring
+from requests.exceptions import ConnectionError, Timeout
+import chardet
+
+from wanish.boilerplate import BoilerplateStore
+from wanish.cache import HttpCache, MemoryResultCache, conditional_headers, document_key
+from wanish.cleaner import html_cleaner, ArticleExtractor, Unparseable, clean_entities
+from wanish.deadline import Deadline
+from wanish.dedup import MemoryDedupIndex, SimHashIndex, normalize_url, simhash
+from wanish.encoding import get_encodings
+from wanish.fetch import DEFAULT_FETCH_POLICY
+from wanish.images import dimensions_cache as shared_dimensions_cache, get_image_url, \
+    image_executor as shared_image_executor
+from wanish.layout import LayoutStore
+from wanish.limits import DomLimits, POLICY_TRUNCATE, limit_tree
+from wanish.stats import (NULL_RECORDER, StatsRecorder, COUNTER_BOILERPLATE, COUNTER_BYTES, COUNTER_DUPLICATE,
+                          COUNTER_HTTP_CACHE_HIT, COUNTER_HTTP_STATUS, COUNTER_LAYOUT_HIT, COUNTER_NEAR_DUPLICATE,
+                          COUNTER_NODES, COUNTER_RESULT_CACHE_HIT, COUNTER_UNPARSEABLE, STAGE_BOILERPLATE,
+                          STAGE_CLEAN_HTML, STAGE_DOM_LIMITS, STAGE_ENCODING, STAGE_FETCH, STAGE_HTML_CLEANER,
+                          STAGE_IMAGE as STAGE_IMAGE_TIME, STAGE_PARSING, STAGE_SIMHASH,
+                          STAGE_TITLE as STAGE_TITLE_TIME)
+from wanish.stores import domain_of
+from wanish.summarizer import RankedSentence, get_policy, get_ranking, summarize_ranking
+from wanish.title import get_title, shorten_title
+
+# Template of the resulting article
+ARTICLE_TEMPLATE = """<!DOCTYPE html>
+<html lang="%(language)s">
+<head>
+    <meta charset="utf-8">
+    <meta http-equiv="X-UA-Compatible" content="IE=edge">
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <title>Wanish cleaner</title>
+    %(description_node)s
+</head>
+<body>
+
+<article itemscope itemtype="http://schema.org/Article">
+    <meta itemprop="inLanguage" content="%(language)s">
+    %(image_url_node)s
+    <h1 itemprop="headline">%(title)s</h1>
+    <div itemprop="articleBody">
+        %(image_url_img)s
+        %(clean_html)s
+    </div>
+</article>
+
+</body>
+</html>"""
+
+# nodes of the image in the template
+IMAGE_URL_NODE = "<meta itemprop=\"image\" content=\"%s\">"
+IMAGE_URL_IMG = "<img src=\"%s\" />"
+
+DEFAULT_SUMMARY_SENTENCES_QTY = 5
+
+# http status codes of a successfully fetched page
+GOOD_STATUS_CODES = (200, 301, 302)
+
+# http status code of a page not modified since it was cached
+NOT_MODIFIED = 304
+
+# optional stages, which are skipped when the time budget of a document is spent
+STAGE_TITLE = 'title'  # searching the title on the page, the <title> tag is used instead
+STAGE_IMAGE = 'image'  # selection of the image
+STAGE_SUMMARY = 'summary'  # summarized description and language detection
+STAGE_DOM = 'dom'  # the document was truncated to the DOM limits
+
+# stages, results degraded by which depend on time and are not cached
+TIME_DEGRADED_STAGES = (STAGE_TITLE, STAGE_IMAGE, STAGE_SUMMARY)
+
+
+class ExtractorConfig(namedtuple('ExtractorConfig', [
+    'article_extractor',  # shared stateless ArticleExtractor
+    'summary_sentences_qty',  # maximum quantity of summary sentences
+    'headers',  # read-only custom headers for GET requests
+    'time_budget',  # seconds to perform a document including its download, None for no limit
+    'dom_limits',  # DomLimits applied to the parsed document
+    'summarizer',  # summarizer.EnginePolicy choosing the engine ranking sentences
+    'layouts',  # shared layout.LayoutStore of the article and title nodes by domain, None to perform pages afresh
+    'boilerplate',  # shared boilerplate.BoilerplateStore of repeating blocks by domain, None to keep them
+    'stats',  # True to record stats.DocumentStats of every document
+    'stats_hook',  # callable receiving every ArticleResult with its stats, None for no hook
+    'http_cache',  # shared cache.HttpCache of fetched pages and their results, None to fetch pages in full
+    'result_cache',  # shared cache.MemoryResultCache or DiskResultCache of results by document, None to disable
+    'dedup',  # shared dedup index of performed pages by their normalized and canonical urls, None to disable
+    'near_duplicates',  # shared dedup.SimHashIndex of the texts of performed articles, None to disable
+    'image_executor',  # executor selecting the image while the summary is computed, None to select it before
+    'image_cache',  # shared images.DimensionsCache of fetched image dimensions by url, None to fetch them per page
+    'fetch_policy',  # shared fetch.FetchPolicy of timeouts, retries and hedging of page requests
+])):
+    """
+    Immutable extraction settings. Keyword patterns are compiled once, when the config is created.
+    """
+    __slots__ = ()
+
+    def __new__(cls, positive_keywords=None, negative_keywords=None,
+                summary_sentences_qty=DEFAULT_SUMMARY_SENTENCES_QTY, headers=None, time_budget=None,
+                max_nodes=None, max_depth=None, max_text_bytes=None, oversize_policy=POLICY_TRUNCATE,
+                summarizer=None, layouts=None, boilerplate=None, stats=False, stats_hook=None, http_cache=None,
+                result_cache=None, dedup=None, near_duplicates=None, image_executor=True, image_cache=None,
+                fetch_policy=None, copy_article=False):
+        """
+        :param positive_keywords: list of keywords, which are likely to be seen in classes or ids of tags
+        :param negative_keywords: list of keywords, which are unlikely to be seen in classes or ids of tags
+        :param summary_sentences_qty: maximum quantity of summary sentences
+        :param headers: custom headers for GET request to obtain web page of the article
+        :param time_budget: seconds to perform a document, optional stages are skipped after it is spent
+        :param max_nodes: maximum quantity of elements in the parsed document
+        :param max_depth: maximum nesting depth of elements in the parsed document
+        :param max_text_bytes: maximum size of text in the parsed document, in utf-8 bytes
+        :param oversize_policy: limits.POLICY_TRUNCATE or limits.POLICY_REJECT for documents beyond the limits
+        :param summarizer: summarizer.EnginePolicy, summarization engine or its name ('textrank', 'centroid',
+                           'lead'), TextRank by default
+        :param layouts: layout.LayoutStore to learn the layouts of sites in and to try them first, True for a new
+                        store, None (default) to find the article on every page afresh
+        :param boilerplate: boilerplate.BoilerplateStore to count the blocks of pages in and to drop the blocks
+                            repeating across the pages of a site, True for a new store, None (default) to keep them
+        :param stats: True to record timings of the stages and counters of every document in the stats field
+                      of the result, the instrumentation costs nothing when disabled (default)
+        :param stats_hook: callable to pass every ArticleResult with its stats to, enables the stats
+        :param http_cache: cache.HttpCache or its directory to keep the validators and results of fetched pages in,
+                           pages are requested conditionally and their results are taken from the cache if they
+                           are not modified, None (default) to fetch and perform pages in full every time
+        :param result_cache: cache.MemoryResultCache or cache.DiskResultCache to keep results by the hash of the
+                             decoded document and of the config, identical documents are performed once; True for
+                             a new in-memory cache, None (default) to perform every document
+        :param dedup: dedup.MemoryDedupIndex, DiskDedupIndex or BloomDedupIndex of the normalized and canonical
+                      urls of performed pages; pages known to the index are not performed again, the previous
+                      result is returned or the result is flagged by duplicate_of. True for a new in-memory index,
+                      None (default) to perform every page
+        :param near_duplicates: dedup.SimHashIndex of the SimHash signatures of performed articles; the image and
+                                summary of an article with a near-duplicate text in the index are skipped, and the
+                                result is flagged by near_duplicate_of. True for a new index, None (default) to
+                                perform every article in full
+        :param image_executor: concurrent.futures.Executor to select the image in, it is downloading images mostly,
+                               while the summary is computed in the calling thread; True (default) for the shared
+                               images.image_executor, None to select the image before the summary
+        :param image_cache: images.DimensionsCache to keep the fetched dimensions of images in, images repeating
+                            across pages are downloaded once; True for the shared images.dimensions_cache, None
+                            (default) to download them on every page
+        :param fetch_policy: fetch.FetchPolicy of the timeouts, retries and hedged requests of pages, by default
+                             pages are requested with timeouts and retried twice on temporary failures, not hedged
+        :param copy_article: True to assemble the article of deep copies of the source nodes. By default (False)
+                             the nodes are moved into the article and put back after it is cleaned, the source
+                             tree is the same in both modes and it is discarded after performing
+        """
+        try:
+            summary_sentences_qty = int(summary_sentences_qty)
+        except (TypeError, ValueError):
+            summary_sentences_qty = DEFAULT_SUMMARY_SENTENCES_QTY
+
+        article_extractor = ArticleExtractor(positive_keywords=positive_keywords,
+                                             negative_keywords=negative_keywords,
+                                             copy_article=copy_article)
+
+        return super(ExtractorConfig, cls).__new__(
+            cls,
+            article_extractor,
+            summary_sentences_qty,
+            MappingProxyType(dict(headers) if isinstance(headers, dict) else {}),
+            time_budget,
+            DomLimits(max_nodes, max_depth, max_text_bytes, oversize_policy),
+            get_policy(summarizer),
+            LayoutStore() if layouts is True else layouts,
+            BoilerplateStore() if boilerplate is True else boilerplate,
+            bool(stats) or stats_hook is not None,
+            stats_hook,
+            HttpCache(http_cache) if isinstance(http_cache, str) else http_cache,
+            MemoryResultCache() if result_cache is True else result_cache,
+            MemoryDedupIndex() if dedup is True else dedup,
+            SimHashIndex() if near_duplicates is True else near_duplicates,
+            shared_image_executor if image_executor is True else image_executor or None,
+            shared_dimensions_cache if image_cache is True else image_cache,
+            fetch_policy or DEFAULT_FETCH_POLICY,
+        )
+
+    def fingerprint(self):
+        """
+        :return: string identifying the settings the result of a document depends on
+        """
+        return repr((self.article_extractor.fingerprint(), self.summary_sentences_qty, tuple(self.dom_limits),
+                     self.summarizer.fingerprint(), self.layouts is not None, self.boilerplate is not None))
+
+
+DEFAULT_CONFIG = ExtractorConfig()
+
+
+class ArticleResult(namedtuple('ArticleResult', [
+    'url',  # source web-page url
+    'canonical_url',  # canonical web-page url if present, otherwise same as url
+    'title',  # document's title
+    'image_url',  # document's image url
+    'language',  # document's article language
+    'clean_html',  # cleaned html of the article
+    'description',  # summarized description (text only)
+    'charset',  # source html encoding
+    'error_msg',  # error message
+    'degraded',  # tuple of stages skipped because of the time budget or performed on a truncated document
+    'ranking',  # tuple of summarizer.RankedSentence of the article sorted by score
+    'stats',  # stats.DocumentStats if the config records them, otherwise None
+    'duplicate_of',  # normalized url the page was performed by before, None if it was performed now
+    'simhash',  # 64-bit SimHash signature of the text of the article, None if it has too few words
+    'near_duplicate_of',  # key of the near-duplicate article performed before, None if the text is new
+])):
+    """
+    Immutable result of the article extraction.
+    """
+    __slots__ = ()
+
+    def summary(self, sentences_qty):
+        """
+        Forms a summarized description of another length from the ranking, the text is not ranked again.
+
+        :param sentences_qty: maximum quantity of summary sentences
+        :return: summarized description (text only)
+        """
+        return clean_description(summarize_ranking(self.ranking, sentences_qty))
+
+    def to_dict(self):
+        """
+        :return: dict of the result to be serialized to JSON, without its stats
+        """
+        data = OrderedDict(zip(self._fields, self))
+        del data['stats']
+        data['degraded'] = list(self.degraded)
+        data['ranking'] = [[sentence.text, float(sentence.score), sentence.paragraph, sentence.position]
+                           for sentence in self.ranking]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        :param data: dict made by to_dict()
+        :return: ArticleResult
+        """
+        data = dict(data)
+        data['degraded'] = tuple(data.get('degraded') or ())
+        data['ranking'] = tuple(RankedSentence(*sentence) for sentence in data.get('ranking') or ())
+        return cls(**dict((field, data.get(field)) for field in cls._fields if field in data))
+
+
+ArticleResult.__new__.__defaults__ = (None,) * (len(ArticleResult._fields) - 6) + ((), (), None, None, None, None)
+
+
+def extract_url(url, config=DEFAULT_CONFIG):
+    """
+    Fetches a web page by url and extracts the article from it.
+
+    :param url: web-page url of the document
+    :param config: ExtractorConfig
+    :return: ArticleResult
+    """
+    recorder = StatsRecorder() if config.stats else NULL_RECORDER
+
+    if not url:
+        return _finish(ArticleResult(url=url, error_msg='Empty or null URL to perform'), config, recorder)
+
+    deadline = Deadline(config.time_budget)
+
+    # the page is not fetched again if its url was performed before
+    if config.dedup is not None:
+        duplicate = _find_duplicate(config.dedup, [normalize_url(url)], url, None)
+        if duplicate is not None:
+            recorder.set(COUNTER_DUPLICATE, 1)
+            return _finish(duplicate, config, recorder)
+
+    # validators of the previously fetched page
+    headers = dict(config.headers)
+    cached = config.http_cache.get(url) if config.http_cache is not None else None
+    if cached is not None:
+        headers.update(conditional_headers(cached))
+
+    # get the page (bytecode)
+    try:
+        web_page = config.fetch_policy.fetch(url, headers, deadline, recorder)
+        recorder.lap(STAGE_FETCH)
+        recorder.set(COUNTER_HTTP_STATUS, web_page.status_code)
+
+        if web_page.status_code == NOT_MODIFIED and cached is not None:
+            config.http_cache.touch(url)
+            recorder.set(COUNTER_HTTP_CACHE_HIT, 1)
+            return _finish(ArticleResult.from_dict(cached.result), config, recorder)
+
+        # perform http status codes
+        if web_page.status_code not in GOOD_STATUS_CODES:
+            return _finish(ArticleResult(url=url, error_msg=str('HTTP error. Status: %s' % web_page.status_code)),
+                           config, recorder)
+
+    except (ConnectionError, Timeout, TypeError, Exception) as e:
+        recorder.lap(STAGE_FETCH)
+        return _finish(ArticleResult(url=url, error_msg=str(e)), config, recorder)
+
+    result = extract(web_page.content, config, url=web_page.url, encoding=web_page.encoding, deadline=deadline,
+                     recorder=recorder)
+
+    # the url redirecting to the page is known too, so the page is not fetched by it again
+    if config.dedup is not None and result.error_msg is None:
+        requested_url = normalize_url(url)
+        if requested_url is not None and requested_url != normalize_url(web_page.url):
+            config.dedup.add([requested_url], result.to_dict() if config.dedup.keeps_results else None)
+
+    etag, last_modified = web_page.headers.get('ETag'), web_page.headers.get('Last-Modified')
+    if config.http_cache is not None and _is_cacheable(result) and (etag or last_modified):
+        config.http_cache.put(url, etag, last_modified, result.to_dict())
+
+    return result
+
+
+def extract(document, config=DEFAULT_CONFIG, url=None, encoding=None, deadline=None, recorder=None):
+    """
+    Extracts the article from a document.
+
+    The clean html of the article is always produced. Title search, image selection and summary are optional
+    and get skipped once the deadline expires, they are listed in the degraded field of the result then.
+    The parsed tree is released before returning, the result holds no references to it.
+
+    :param document: raw html of the document, bytes or str
+    :param config: ExtractorConfig
+    :param url: url of the document, used to make links absolute
+    :param encoding: encoding reported by the server, used if the page does not declare one
+    :param deadline: Deadline of the document, by default it starts now with the time budget of the config
+    :param recorder: stats recorder of the document, by default a new one if the config records stats
+    :return: ArticleResult
+    """
+    if deadline is None:
+        deadline = Deadline(config.time_budget)
+    if recorder is None:
+        recorder = StatsRecorder() if config.stats else NULL_RECORDER
+
+    charset = None
+    degraded = []
+
+    if recorder.enabled:
+        recorder.set(COUNTER_BYTES, len(document) if document is not None else 0)
+
+    key = relative_links = None
+    try:
+        document, charset = decode_document(document, encoding)
+        recorder.lap(STAGE_ENCODING)
+
+        # result of the same document performed before, at this or at another url
+        if config.result_cache is not None:
+            key = _result_cache_key(document, config, url)
+            cached = config.result_cache.get(key)
+            if cached is not None:
+                recorder.set(COUNTER_RESULT_CACHE_HIT, 1)
+                return _finish(_rebased_result(cached, url), config, recorder)
+            # hashing the document is not a stage of its own, it counts in the total only
+            recorder.skip()
+            relative_links = {}
+
+        source_html, canonical_url, _, truncated = parse_document(document, url, charset, config.dom_limits,
+                                                                  recorder, relative_links)
+    except (TypeError, Exception) as e:
+        return _finish(ArticleResult(url=url, charset=charset, error_msg=str(e)), config, recorder)
+
+    # the heavy stages are skipped if the url or the canonical url of the page was performed before
+    dedup_urls = None
+    if config.dedup is not None:
+        dedup_urls = [dedup_key for dedup_key in OrderedDict.fromkeys([
+            normalize_url(url), normalize_url(urljoin(url or '', canonical_url or ''))]) if dedup_key]
+        duplicate = _find_duplicate(config.dedup, dedup_urls, url, canonical_url)
+        if duplicate is not None:
+            source_html.clear()
+            recorder.set(COUNTER_DUPLICATE, 1)
+            return _finish(duplicate._replace(charset=duplicate.charset or charset), config, recorder)
+
+    if truncated:
+        degraded.append(STAGE_DOM)
+
+    try:
+        result = _perform(source_html, config, deadline, url, canonical_url, charset, degraded, recorder)
+    except Unparseable as e:
+        # the error is passed on to the caller, the hook still gets the failed document
+        recorder.set(COUNTER_UNPARSEABLE, 1)
+        _finish(ArticleResult(url=url, canonical_url=canonical_url, charset=charset, error_msg=str(e)),
+                config, recorder)
+        raise
+    finally:
+        # dropping the whole tree at once, even if a traceback keeps a reference to its root
+        source_html.clear()
+
+    if key is not None and _is_cacheable(result):
+        data = result.to_dict()
+        # the image is resolved against the url of the next copy of the document if it is relative
+        data['image_href'] = relative_links.get(result.image_url)
+        config.result_cache.put(key, data)
+    if dedup_urls and result.error_msg is None:
+        config.dedup.add(dedup_urls, result.to_dict() if config.dedup.keeps_results else None)
+
+    return _finish(result, config, recorder)
+
+
+def _find_duplicate(index, urls, url, canonical_url):
+    """
+    :param index: dedup index
+    :param urls: normalized urls of the page
+    :param url: url of the page
+    :param canonical_url: canonical url of the page, None if it is not known yet
+    :return: ArticleResult of the page performed before flagged by duplicate_of, None if the page is new
+    """
+    for normalized in urls:
+        if normalized is None:
+            continue
+        data = index.get(normalized)
+        if data is None:
+            continue
+        if data:
+            result = _cached_result(data, url)
+        else:
+            # the index keeps no results
+            result = ArticleResult(url=url, canonical_url=canonical_url)
+        return result._replace(duplicate_of=normalized)
+    return None
+
+
+def _cached_result(data, url):
+    """
+    :param data: dict of the ArticleResult of the same document at another url
+    :param url: url of the document
+    :return: ArticleResult of the document
+    """
+    result = ArticleResult.from_dict(data)
+    if result.canonical_url == result.url:
+        # the page had no canonical url of its own
+        result = result._replace(canonical_url=url)
+    return result._replace(url=url)
+
+
+def _result_cache_key(document, config, url):
+    """
+    Copies of a document at other urls share the key: the links relative to the url are resolved against the url
+    of every copy. Relative images are searched only if there is a url, and layouts and boilerplate are learned
+    by domain, so copies without url and copies on other domains with them are kept apart.
+
+    :param document: decoded html of the document
+    :param config: ExtractorConfig
+    :param url: url of the document
+    :return: key of the result of the document in the result cache
+    """
+    if config.layouts is not None or config.boilerplate is not None:
+        scope = domain_of(url)
+    else:
+        scope = bool(url)
+    return document_key(document, '%s %r' % (config.fingerprint(), scope))
+
+
+def _rebased_result(data, url):
+    """
+    :param data: dict of the ArticleResult of the same document kept by the result cache, with the image_href
+                 the image was resolved from if it is relative
+    :param url: url of the document
+    :return: ArticleResult of the document with its relative image resolved against the url
+    """
+    result = _cached_result(data, url)
+    href = data.get('image_href')
+    if href is None or result.image_url is None:
+        return result
+
+    image_url = urljoin(url, href)
+    if image_url == result.image_url:
+        return result
+    clean_html = result.clean_html.replace(IMAGE_URL_NODE % result.image_url, IMAGE_URL_NODE % image_url) \
+        .replace(IMAGE_URL_IMG % result.image_url, IMAGE_URL_IMG % image_url)
+    return result._replace(image_url=image_url, clean_html=clean_html)
+
+
+def _is_cacheable(result):
+    """
+    Results are cached only if they depend on the document alone: not on the time left for it, and not on
+    the documents performed before it
+
+    :param result: ArticleResult
+    :return: True if the result may be cached
+    """
+    return result.error_msg is None and result.duplicate_of is None and result.near_duplicate_of is None and \
+        not set(result.degraded) & set(TIME_DEGRADED_STAGES)
+
+
+def _finish(result, config, recorder):
+    """
+    Attaches the stats to the result and passes it to the hook of the config
+
+    :param result: ArticleResult
+    :param config: ExtractorConfig
+    :param recorder: stats recorder of the document
+    :return: ArticleResult with stats
+    """
+    if not recorder.enabled:
+        return result
+
+    result = result._replace(stats=recorder.freeze())
+    if config.stats_hook is not None:
+        config.stats_hook(result)
+    return result
+
+
+def _perform(source_html, config, deadline, url, canonical_url, charset, degraded, recorder=NULL_RECORDER):
+    """
+    Performs extraction stages on the parsed document.
+
+    :param source_html: parsed and cleaned document
+    :param config: ExtractorConfig
+    :param deadline: Deadline of the document
+    :param url: url of the document
+    :param canonical_url: canonical url of the document
+    :param charset: encoding of the document
+    :param degraded: list of degraded stages, gets extended
+    :param recorder: stats recorder of the document
+    :return: ArticleResult
+    """
+    domain = layout = None
+    if config.layouts is not None or config.boilerplate is not None:
+        domain = domain_of(url or canonical_url)
+
+    # blocks repeating on the previous pages of the site
+    if config.boilerplate is not None:
+        recorder.set(COUNTER_BOILERPLATE, config.boilerplate.strip(domain, source_html))
+        recorder.lap(STAGE_BOILERPLATE)
+
+    # layout learned on the previous pages of the site
+    if config.layouts is not None and domain is not None:
+        layout = config.layouts.get(domain)
+
+    # clean html of the article and its starting node
+    clean_html = starting_node = containers = None
+    if layout is not None:
+        clean_html, starting_node = config.article_extractor.get_clean_html_by_layout(source_html,
+                                                                                      layout.article_path,
+                                                                                      recorder=recorder)
+        recorder.set(COUNTER_LAYOUT_HIT, int(clean_html is not None))
+    if clean_html is None:
+        # the page is performed as a whole, and its layout is learned
+        layout = None
+        containers = [] if config.layouts is not None and domain is not None else None
+        clean_html, starting_node = config.article_extractor.get_clean_html(source_html=source_html,
+                                                                            containers=containers,
+                                                                            recorder=recorder)
+    recorder.lap(STAGE_CLEAN_HTML)
+
+    # signature of the text, the image and summary of a near-duplicate article are skipped
+    article_node = signature = near_duplicate_of = None
+    if clean_html:
+        article_node = etree.XML(clean_html)
+        signature = simhash(' '.join(article_node.itertext()))
+        if signature is not None and config.near_duplicates is not None:
+            near_duplicate_of = _find_near_duplicate(config.near_duplicates, signature, url, canonical_url)
+            recorder.set(COUNTER_NEAR_DUPLICATE, int(near_duplicate_of is not None))
+        recorder.lap(STAGE_SIMHASH)
+
+    # obtaining title
+    if deadline.expired():
+        degraded.append(STAGE_TITLE)
+        short_title, title_node = get_title(source_html), None
+    else:
+        short_title, title_node = shorten_title(source_html, starting_node,
+                                                layout.title_path if layout is not None else None)
+    title = clean_entities(short_title)
+
+    if containers:
+        config.layouts.learn(domain, containers[-1], title_node)
+    recorder.lap(STAGE_TITLE_TIME)
+
+    # obtaining image url, in the background if there is an executor: it waits for the network mostly
+    image_url = image_task = None
+    image_args = (source_html, url, dict(config.headers), starting_node, title_node, deadline, config.image_cache)
+    if near_duplicate_of is not None:
+        pass  # the near-duplicate is not performed further
+    elif deadline.expired():
+        degraded.append(STAGE_IMAGE)
+    elif config.image_executor is not None:
+        image_recorder = recorder.fork()
+        image_task = config.image_executor.submit(_select_image, *image_args, recorder=image_recorder)
+    else:
+        image_url = _select_image(*image_args, recorder=recorder)
+
+    description = language = None
+    ranking = ()
+
+    # summarized description, requires clean_html
+    try:
+        if not clean_html or near_duplicate_of is not None:
+            pass  # there is no text or the near-duplicate is not performed further
+        elif deadline.expired():
+            degraded.append(STAGE_SUMMARY)
+        else:
+            ranking, language = get_ranking(article_node, config.summarizer, deadline.remaining(),
+                                            recorder=recorder)
+            description = summarize_ranking(ranking, config.summary_sentences_qty)
+    finally:
+        # the tree is released by the caller, so the selection of the image is finished or cancelled
+        if image_task is not None and not image_task.cancel():
+            wait((image_task,))
+
+    if image_task is not None:
+        if image_task.cancelled():
+            # all threads of the executor were busy, the image is selected now
+            image_recorder.skip()
+            image_url = _select_image(*image_args, recorder=image_recorder)
+        else:
+            image_url = image_task.result()
+        # time spent waiting for the image is its own stage
+        recorder.skip()
+        recorder.merge(image_recorder)
+
+    if image_url is not None:
+        image_url_node = IMAGE_URL_NODE % image_url
+        image_url_img = IMAGE_URL_IMG % image_url
+    else:
+        image_url_node = image_url_img = ""
+
+    if clean_html:
+        description_node = ""
+        if description:
+            description = clean_description(description)
+            description_node = "<meta name=\"description\" content=\"%s\">" if description else ""
+
+        # filling the template
+        clean_html = ARTICLE_TEMPLATE % {
+            'language': language or '',
+            'title': title,
+            'image_url_node': image_url_node,
+            'image_url_img': image_url_img,
+            'description_node': description_node,
+            'clean_html': clean_html
+        }
+
+    return ArticleResult(
+        url=url,
+        canonical_url=canonical_url,
+        title=title,
+        image_url=image_url,
+        language=language,
+        clean_html=clean_html,
+        description=description,
+        charset=charset,
+        degraded=tuple(degraded),
+        ranking=ranking,
+        simhash=signature,
+        near_duplicate_of=near_duplicate_of,
+    )
+
+
+def _select_image(source_html, url, headers, starting_node, title_node, deadline, dimensions_cache,
+                  recorder=NULL_RECORDER):
+    """
+    :param source_html: parsed and cleaned document
+    :param url: url of the document
+    :param headers: headers to download images with
+    :param starting_node: article node
+    :param title_node: title node, None if it was not found
+    :param deadline: Deadline of the document
+    :param dimensions_cache: images.DimensionsCache of the fetched dimensions of images, None to fetch them
+    :param recorder: stats recorder of the stage
+    :return: url of the image, None if there is no suitable one
+    """
+    image_url = get_image_url(source_html, url, headers, starting_node, title_node, deadline=deadline,
+                              recorder=recorder, dimensions_cache=dimensions_cache)
+    recorder.lap(STAGE_IMAGE_TIME)
+    return image_url
+
+
+def _find_near_duplicate(index, signature, url, canonical_url):
+    """
+    Searches the near-duplicate of the article, the article is added to the index if there is none
+
+    :param index: dedup.SimHashIndex
+    :param signature: signature of the text of the article
+    :param url: url of the document
+    :param canonical_url: canonical url of the document
+    :return: key of the near-duplicate article performed before, None if the text is new
+    """
+    key = normalize_url(urljoin(url or '', canonical_url or ''))
+    nearest = index.nearest(signature)
+    if nearest is not None and nearest[0] != key:
+        return nearest[0]
+    if key is not None:
+        # documents without url are only checked against the index
+        index.add(key, signature)
+    return None
+
+
+def clean_description(description):
+    """
+    Normalizes text of a summarized description
+
+    :param description: summarized text
+    :return: text without escaped entities and excess spaces
+    """
+    # Replacing \xc2\xa0 and \xa0 in result with space
+    description = description.replace(u'\xc2\xa0', u' ').replace(u'\xa0', u' ')
+    description = clean_entities(description)
+    return ' '.join(description.split())
+
+
+def decode_document(document, encoding=None):
+    """
+    Decodes the document by the encoding it declares, or reported by the server, or detected by its content.
+
+    :param document: raw html of the document, bytes or str
+    :param encoding: encoding reported by the server, used if the page does not declare one
+    :return: html of the document as str, charset of the document (None if it was given as str)
+    """
+    if not isinstance(document, bytes):
+        return document, None
+
+    # getting content_type from headers to obtain encoding, will use it if it is not specified on page
+    page_encodings = get_encodings(document)
+
+    if len(page_encodings) > 0:
+        charset = page_encodings[0]
+    elif encoding is not None:
+        charset = encoding
+    else:
+        res = chardet.detect(document)
+        charset = res['encoding']
+
+    return document.decode(charset, "ignore"), charset
+
+
+def parse_document(document, url=None, encoding=None, dom_limits=None, recorder=NULL_RECORDER, relative_links=None):
+    """
+    Decodes and parses the document, prepares its tree for the extraction.
+
+    :param document: raw html of the document as bytes, or html decoded by decode_document() as str
+    :param url: url of the document, used to make links absolute
+    :param encoding: encoding reported by the server, used if the page does not declare one; the charset the
+                     document was decoded by if it is str
+    :param dom_limits: DomLimits to apply right after parsing
+    :param recorder: stats recorder of the document
+    :param relative_links: dict to put the links relative to the url in by the absolute urls they are resolved to
+    :return: cleaned lxml tree, canonical url, charset of the document, flag if the tree was truncated
+    """
+    if isinstance(document, bytes):
+        document, charset = decode_document(document, encoding)
+        recorder.lap(STAGE_ENCODING)
+    else:
+        charset = encoding
+
+    source_html = fromstring(document)
+    document = None
+    recorder.lap(STAGE_PARSING)
+
+    truncated = limit_tree(source_html, dom_limits)
+    recorder.lap(STAGE_DOM_LIMITS)
+
+    # searching for canonical url
+    link_canonicals = source_html.xpath("//link[normalize-space(@rel)='canonical']/@href")
+    canonical_url = link_canonicals[0] if len(link_canonicals) > 0 else url
+
+    # cleaning in place, clean_html() would make a deep copy of the tree
+    html_cleaner(source_html)
+
+    # making links absolute
+    if url and relative_links is None:
+        source_html.make_links_absolute(url, resolve_base_href=True)
+    elif url:
+        make_links_absolute(source_html, url, relative_links)
+
+    strip_elements(source_html, 'blockquote', 'code', 'table', 'ol', 'ul',
+                   'embedded', 'input', 'address', 'iframe', 'textarea', 'dl')
+    recorder.lap(STAGE_HTML_CLEANER)
+
+    if recorder.enabled:
+        recorder.set(COUNTER_NODES, sum(1 for _ in source_html.iter()))
+        recorder.skip()
+
+    return source_html, canonical_url, charset, truncated
+
+
+def make_links_absolute(source_html, url, relative_links):
+    """
+    Makes links of the document absolute like lxml does, and keeps the links relative to the url. Images take
+    srcset entries and data attributes relative to the url as well, see images.Image.
+
+    :param source_html: parsed document
+    :param url: url of the document
+    :param relative_links: dict to put the links relative to the url in by the absolute urls they are resolved to
+    """
+    def absolute_link(link):
+        resolved = urljoin(url, link)
+        if resolved != link:
+            relative_links[resolved] = link
+        return resolved
+
+    # links are resolved against the base of the document first, they are not relative to the url then
+    source_html.resolve_base_href()
+    source_html.rewrite_links(absolute_link)
+
+    for img in source_html.iter('img'):
+        for name, value in img.attrib.items():
+            if name == 'srcset':
+                for entry in value.split(','):
+                    parts = entry.split()
+                    if parts:
+                        absolute_link(parts[0])
+            elif name.startswith('data'):
+                absolute_link(value)
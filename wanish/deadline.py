@@ -0,0 +1,47 @@
+"""
+Time budget of a document performing
+"""
+from time import monotonic
+
+# minimal timeout for network requests, a zero timeout is not accepted by requests
+MIN_TIMEOUT = 0.001  # sec
+
+
+class Deadline(object):
+    """
+    Point in time by which a document should be performed. A deadline without a budget never expires.
+    """
+    __slots__ = ('expires_at',)
+
+    def __init__(self, budget=None):
+        """
+        :param budget: time budget in seconds, None for an unlimited one
+        """
+        self.expires_at = None if budget is None else monotonic() + budget
+
+    def remaining(self):
+        """
+        :return: seconds left, None if the deadline is unlimited
+        """
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - monotonic(), 0.0)
+
+    def expired(self):
+        """
+        :return: True if the budget is spent
+        """
+        return self.expires_at is not None and monotonic() >= self.expires_at
+
+    def timeout(self, default=None):
+        """
+        Timeout for a blocking operation, which should not outlive the deadline.
+
+        :param default: timeout to use if it is shorter than the remaining time
+        :return: timeout in seconds or None if neither is limited
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        remaining = max(remaining, MIN_TIMEOUT)
+        return remaining if default is None else min(default, remaining)
@@ -0,0 +1,402 @@
+"""
+Dedup indexes of performed pages by their normalized and canonical urls. A crawl reaching the same article by
+many links performs it once within the time-to-live of the index, the next times the previous result is returned
+or the document is flagged as a duplicate.
+"""
+from collections import OrderedDict
+from hashlib import blake2b
+import math
+import re
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+
+from wanish.cache import DEFAULT_MAX_BYTES, DiskStore
+
+DEFAULT_TTL = 24 * 3600  # sec, pages are deduplicated within it
+DEFAULT_MAX_ENTRIES = 100000  # quantity of urls kept by the in-memory index
+DEFAULT_CAPACITY = 1000000  # quantity of urls per generation of the bloom filter
+DEFAULT_ERROR_RATE = 0.001  # share of false positives of the bloom filter
+
+# query parameters of trackers and analytics, which do not change the page
+TRACKING_PARAM_PREFIXES = ('utm_',)
+TRACKING_PARAMS = frozenset([
+    'fbclid', 'gclid', 'yclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'igshid', 'ref_src',
+])
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+SIMHASH_BITS = 64  # size of a text signature
+SHINGLE_LENGTH = 3  # words in a shingle of the text
+DEFAULT_MAX_DISTANCE = 3  # bits, signatures differing in fewer bits are of near-duplicate texts
+DEFAULT_MAX_SIGNATURES = 5000000  # quantity of signatures kept by a near-duplicate index
+
+WORD_RE = re.compile(r'\w+', re.U)
+
+# multiplier combining hashes of the words of a shingle (64-bit FNV prime) and constants of the splitmix64 finalizer
+SHINGLE_PRIME = np.uint64(0x100000001b3)
+MIX_1, MIX_2 = np.uint64(0xbf58476d1ce4e5b9), np.uint64(0x94d049bb133111eb)
+SHIFT_1, SHIFT_2, SHIFT_3 = np.uint64(30), np.uint64(27), np.uint64(31)
+
+
+def normalize_url(url):
+    """
+    Normalizes the url for deduplication: lowercase scheme and host without the default port and the leading www.,
+    no fragment, no tracking parameters, other parameters sorted.
+
+    :param url: absolute url
+    :return: normalized url, None if it is not an absolute http(s) url
+    """
+    if not url:
+        return None
+    try:
+        parts = urlsplit(url.strip())
+        host = parts.hostname
+        port = parts.port
+    except ValueError:
+        return None
+
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not host:
+        return None
+    if host.startswith('www.'):
+        host = host[4:]
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        host = '%s:%d' % (host, port)
+
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if name.lower() not in TRACKING_PARAMS and not name.lower().startswith(TRACKING_PARAM_PREFIXES))
+
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+
+
+class MemoryDedupIndex(object):
+    """
+    Thread-safe index of urls with the results of their pages in memory. The least recently added urls are
+    evicted beyond max_entries.
+    """
+    keeps_results = True
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        :param ttl: seconds a url is known after its page was performed
+        :param max_entries: maximum quantity of urls
+        """
+        if max_entries < 1:
+            raise ValueError("An index should keep at least one url")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (time added, result) by url, the oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, url):
+        """
+        :param url: normalized url
+        :return: dict of the ArticleResult of the url, {} if the url is known without its result, None if the url
+                 is unknown or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            if entry[0] + self.ttl < time.time():
+                del self._entries[url]
+                return None
+            return entry[1]
+
+    def add(self, urls, result):
+        """
+        :param urls: normalized urls of the page
+        :param result: dict of the ArticleResult, see ArticleResult.to_dict()
+        """
+        now = time.time()
+        with self._lock:
+            for url in urls:
+                self._entries.pop(url, None)
+                self._entries[url] = (now, result)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskDedupIndex(DiskStore):
+    """
+    Index of urls with the results of their pages on disk, it may be shared by processes. Entries expire after
+    the ttl, the oldest ones are evicted beyond max_bytes.
+    """
+    keeps_results = True
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param directory: directory of the index, created if it is missing
+        :param ttl: seconds a url is known after its page was performed
+        :param max_bytes: maximum total size of the entries
+        """
+        DiskStore.__init__(self, directory, max_bytes=max_bytes, max_age=ttl)
+        self.ttl = ttl
+
+    @staticmethod
+    def key_of(url):
+        return blake2b(url.encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, url):
+        """
+        :param url: normalized url
+        :return: dict of the ArticleResult of the url, None if the url is unknown or has expired
+        """
+        data = self._read(self.key_of(url))
+        if data is None or data.get('url') != url:
+            return None
+        return data.get('result') or {}
+
+    def add(self, urls, result):
+        """
+        :param urls: normalized urls of the page
+        :param result: dict of the ArticleResult, see ArticleResult.to_dict()
+        """
+        for url in urls:
+            self._write(self.key_of(url), {'url': url, 'result': result})
+
+
+class BloomFilter(object):
+    """
+    Set of strings with false positives at the given rate and no false negatives
+    """
+
+    def __init__(self, capacity, error_rate):
+        """
+        :param capacity: quantity of strings kept at the error rate
+        :param error_rate: share of false positives when the filter is full
+        """
+        bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.size = max(bits, 8)
+        self.hashes = max(int(round(self.size / float(capacity) * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, value):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def add(self, value):
+        bits = self._bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class BloomDedupIndex(object):
+    """
+    Index of urls in two generations of bloom filters for large crawls: a few bytes per url, results are not kept.
+    A new generation is started when the current one is older than the ttl or full, the one before is dropped,
+    so a url is known for one to two ttl, or for less if the generations fill up faster. Urls may be known falsely
+    at the error rate.
+    """
+    keeps_results = False
+
+    def __init__(self, ttl=DEFAULT_TTL, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        """
+        :param ttl: seconds a url is known at least after its page was performed
+        :param capacity: quantity of urls per generation
+        :param error_rate: share of urls falsely known
+        """
+        self.ttl = ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = None
+        self._started = time.time()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._current.count + (self._previous.count if self._previous is not None else 0)
+
+    def _rotate(self, now):
+        if now - self._started >= self.ttl * 2:
+            # both generations have expired
+            self._current, self._previous, self._started = BloomFilter(self.capacity, self.error_rate), None, now
+        elif now - self._started >= self.ttl or self._current.count >= self.capacity:
+            self._previous = self._current
+            self._current = BloomFilter(self.capacity, self.error_rate)
+            self._started = now
+
+    def get(self, url):
+        """
+        :param url: normalized url
+        :return: {} if the url is known, None otherwise
+        """
+        with self._lock:
+            self._rotate(time.time())
+            if url in self._current or (self._previous is not None and url in self._previous):
+                return {}
+            return None
+
+    def add(self, urls, result=None):
+        """
+        :param urls: normalized urls of the page
+        :param result: ignored, results are not kept
+        """
+        with self._lock:
+            self._rotate(time.time())
+            for url in urls:
+                self._current.add(url)
+
+    def clear(self):
+        with self._lock:
+            self._current, self._previous, self._started = BloomFilter(self.capacity, self.error_rate), None, \
+                time.time()
+
+
+def simhash(text, shingle_length=SHINGLE_LENGTH):
+    """
+    SimHash signature of the text over its shingles: every bit is set if it is set in most of the 64-bit hashes
+    of the shingles, so texts sharing most of their shingles differ in a few bits of their signatures.
+
+    :param text: text of the article
+    :param shingle_length: words in a shingle
+    :return: 64-bit signature as int, None if the text has fewer words than a shingle
+    """
+    words = WORD_RE.findall(text.lower())
+    qty = len(words) - shingle_length + 1
+    if qty < 1:
+        return None
+
+    # every distinct word is hashed once
+    ids = {}
+    positions = np.array([ids.setdefault(word, len(ids)) for word in words], dtype=np.intp)
+    table = np.array([int.from_bytes(blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+                      for word in ids], dtype=np.uint64)
+    hashes = table[positions]
+
+    shingles = np.zeros(qty, dtype=np.uint64)
+    for i in range(shingle_length):
+        shingles = shingles * SHINGLE_PRIME ^ hashes[i:i + qty]
+    shingles ^= shingles >> SHIFT_1
+    shingles *= MIX_1
+    shingles ^= shingles >> SHIFT_2
+    shingles *= MIX_2
+    shingles ^= shingles >> SHIFT_3
+
+    bits = np.unpackbits(shingles.view(np.uint8).reshape(qty, 8), axis=1, bitorder='little')
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > qty
+    return int(np.packbits(majority, bitorder='little').view('<u8')[0])
+
+
+def hamming_distance(first, second):
+    """
+    :param first: signature
+    :param second: signature
+    :return: quantity of differing bits
+    """
+    return bin(first ^ second).count('1')
+
+
+class SimHashIndex(object):
+    """
+    Thread-safe index of text signatures for near-duplicate search. Signatures are split into max_distance + 1
+    bands, two signatures differing in max_distance bits at most have at least one equal band, so only the
+    signatures sharing a band are compared. The oldest signatures are evicted beyond max_signatures.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, max_signatures=DEFAULT_MAX_SIGNATURES):
+        """
+        :param max_distance: bits, signatures differing in fewer or as many bits are near-duplicates
+        :param max_signatures: maximum quantity of signatures
+        """
+        if not 0 <= max_distance < SIMHASH_BITS // 2:
+            raise ValueError("Maximum distance should be from 0 to %d bits" % (SIMHASH_BITS // 2 - 1))
+        self.max_distance = max_distance
+        self.max_signatures = max_signatures
+
+        bands = max_distance + 1
+        widths = [SIMHASH_BITS // bands + (1 if i < SIMHASH_BITS % bands else 0) for i in range(bands)]
+        self._bands = []  # (shift, mask) of every band
+        shift = 0
+        for width in widths:
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+
+        self._signatures = OrderedDict()  # signature by key, the oldest first
+        self._buckets = [{} for _ in self._bands]  # keys by the value of the band
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, key):
+        return key in self._signatures
+
+    def _band_values(self, signature):
+        return [(signature >> shift) & mask for shift, mask in self._bands]
+
+    def query(self, signature):
+        """
+        :param signature: signature of a text
+        :return: list of (key, distance) of the near-duplicates, the nearest first
+        """
+        found = {}
+        with self._lock:
+            for buckets, value in zip(self._buckets, self._band_values(signature)):
+                for key in buckets.get(value, ()):
+                    if key not in found:
+                        distance = hamming_distance(signature, self._signatures[key])
+                        found[key] = distance
+        return sorted(((key, distance) for key, distance in found.items() if distance <= self.max_distance),
+                      key=lambda x: x[1])
+
+    def nearest(self, signature):
+        """
+        :param signature: signature of a text
+        :return: (key, distance) of the nearest near-duplicate, None if there is none
+        """
+        found = self.query(signature)
+        return found[0] if found else None
+
+    def add(self, key, signature):
+        """
+        :param key: key of the text, e.g. url of the document
+        :param signature: signature of the text
+        """
+        with self._lock:
+            if key in self._signatures:
+                self._remove(key)
+            self._signatures[key] = signature
+            for buckets, value in zip(self._buckets, self._band_values(signature)):
+                buckets.setdefault(value, []).append(key)
+            while len(self._signatures) > self.max_signatures:
+                self._remove(next(iter(self._signatures)))
+
+    def remove(self, key):
+        """
+        :param key: key of the text
+        """
+        with self._lock:
+            if key in self._signatures:
+                self._remove(key)
+
+    def _remove(self, key):
+        signature = self._signatures.pop(key)
+        for buckets, value in zip(self._buckets, self._band_values(signature)):
+            bucket = buckets[value]
+            bucket.remove(key)
+            if not bucket:
+                del buckets[value]
+
+    def clear(self):
+        with self._lock:
+            self._signatures.clear()
+            for buckets in self._buckets:
+                buckets.clear()
@@ -0,0 +1,45 @@
+"""
+Single pass replacement of escaped entities and characters
+"""
+import re
+
+
+class Replacer(object):
+    """
+    Replaces all occurrences of the mapping's keys in a text at once, with one compiled alternation regex.
+    Longer keys take precedence over their prefixes.
+    """
+
+    def __init__(self, mapping):
+        """
+        :param mapping: dict of replacements by replaced strings
+        """
+        self.mapping = dict(mapping)
+        keys = sorted(self.mapping, key=len, reverse=True)
+        self.pattern = re.compile('|'.join(re.escape(key) for key in keys))
+
+        # a text without the first characters of the keys is returned as it is
+        self.first_chars = frozenset(key[0] for key in keys)
+
+    @classmethod
+    def from_variants(cls, variants):
+        """
+        Creates a replacer from a dict of variants by the replacement
+
+        :param variants: dict of sequences of replaced strings by their replacement
+        :return: Replacer
+        """
+        return cls((variant, replacement) for replacement, seq in variants.items() for variant in seq)
+
+    def _lookup(self, match):
+        return self.mapping[match.group()]
+
+    def __call__(self, text):
+        """
+        :param text: text to perform
+        :return: text with all replacements made
+        """
+        if len(self.first_chars) == 1:
+            if next(iter(self.first_chars)) not in text:
+                return text
+        return self.pattern.sub(self._lookup, text)
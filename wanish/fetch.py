@@ -0,0 +1,247 @@
+"""
+Fetching of pages: connect and read timeouts, bounded retries with exponential backoff on failures worth another
+try, and optional hedged requests, a second request fired when the first one is slower than most of the previous
+ones.
+"""
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import random
+import threading
+import time
+
+import requests
+from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout
+
+from wanish.stats import NULL_RECORDER, COUNTER_FETCH_RETRIES, COUNTER_HEDGED, COUNTER_HEDGE_WON
+
+DEFAULT_CONNECT_TIMEOUT = 10  # sec
+DEFAULT_READ_TIMEOUT = 30  # sec, between two bytes of the response
+DEFAULT_RETRIES = 2  # quantity of requests after the first one
+DEFAULT_BACKOFF = 0.5  # sec, delay before the first retry, doubled for the next ones
+MAX_BACKOFF = 8  # sec
+
+# statuses of responses worth another request: too many requests and temporary failures of the server or a proxy
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+# failures worth another request, pages are fetched by GET, so repeating a request is safe
+RETRY_EXCEPTIONS = (ConnectionError, Timeout, ChunkedEncodingError)
+
+DEFAULT_HEDGE_PERCENTILE = 95  # the hedged request is fired after this percentile of the previous latencies
+DEFAULT_HEDGE_DELAY = 1.0  # sec, delay of the hedged request until enough latencies are known
+LATENCY_WINDOW = 200  # quantity of the latest latencies the percentile is taken of
+MIN_LATENCIES = 20  # quantity of latencies to take the percentile of
+
+FETCH_WORKERS = 32  # threads sending hedged requests
+
+# hedged requests are sent by these threads, the threads are started on demand
+fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='wanish-fetch')
+
+
+class LatencyWindow(object):
+    """
+    Thread-safe window of the latest latencies
+    """
+
+    def __init__(self, size=LATENCY_WINDOW):
+        """
+        :param size: quantity of latencies kept
+        """
+        self._latencies = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._latencies)
+
+    def add(self, seconds):
+        """
+        :param seconds: latency of a request
+        """
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, percent):
+        """
+        :param percent: percentile, from 0 to 100
+        :return: latency in seconds, None if there are none
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(int(len(latencies) * percent / 100.0), len(latencies) - 1)]
+
+
+class FetchPolicy(object):
+    """
+    How pages are fetched, shared by the documents and threads. Hedging is adaptive: the hedged request is fired
+    after the given percentile of the latencies of the previous requests, and the first response to arrive wins.
+    The other request is cancelled if it has not been sent yet, or closed without reading its body once its
+    headers arrive.
+    """
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, max_backoff=MAX_BACKOFF,
+                 retry_status_codes=RETRY_STATUS_CODES, hedge=False, hedge_percentile=DEFAULT_HEDGE_PERCENTILE,
+                 hedge_delay=DEFAULT_HEDGE_DELAY, executor=None):
+        """
+        :param connect_timeout: seconds to connect to the server
+        :param read_timeout: seconds to wait for the next bytes of the response
+        :param retries: maximum quantity of requests after the first one, 0 to never repeat a request
+        :param backoff: seconds before the first retry, doubled for every next one, a random half of it is jitter
+        :param max_backoff: maximum seconds before a retry, Retry-After of the server is obeyed up to it
+        :param retry_status_codes: statuses of responses worth another request
+        :param hedge: True to fire a hedged request if the response is late
+        :param hedge_percentile: percentile of the previous latencies the hedged request is fired after
+        :param hedge_delay: seconds the hedged request is fired after until enough latencies are known
+        :param executor: concurrent.futures.Executor sending hedged requests, the shared fetch_executor by default
+        """
+        if retries < 0 or backoff < 0:
+            raise ValueError("Quantity of retries and the backoff should not be negative")
+        if not 0 < hedge_percentile <= 100:
+            raise ValueError("Percentile should be from 0 to 100")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_status_codes = frozenset(retry_status_codes)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.executor = executor or fetch_executor
+        self.latencies = LatencyWindow()
+
+    def current_hedge_delay(self):
+        """
+        :return: seconds after which the hedged request is fired
+        """
+        if len(self.latencies) < MIN_LATENCIES:
+            return self.hedge_delay
+        return self.latencies.percentile(self.hedge_percentile)
+
+    def fetch(self, url, headers=None, deadline=None, recorder=NULL_RECORDER):
+        """
+        Fetches the page, a response of the last request is returned even if its status is worth a retry.
+
+        :param url: url of the page
+        :param headers: headers of the request
+        :param deadline: Deadline of the document, neither requests nor retries outlive it
+        :param recorder: stats recorder of the document, counts retries and hedged requests
+        :return: requests.Response with the body read
+        :raise requests.RequestException: if the last request failed
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self._request(url, headers, deadline, recorder)
+            except RETRY_EXCEPTIONS:
+                if attempt >= self.retries:
+                    raise
+                delay = self._backoff(attempt)
+                if deadline is not None and deadline.timeout(delay) < delay:
+                    raise
+            else:
+                if response.status_code not in self.retry_status_codes or attempt >= self.retries:
+                    return response
+                delay = self._backoff(attempt, response.headers.get('Retry-After'))
+                if deadline is not None and deadline.timeout(delay) < delay:
+                    return response
+
+            attempt += 1
+            recorder.count(COUNTER_FETCH_RETRIES)
+            time.sleep(delay)
+
+    def _backoff(self, attempt, retry_after=None):
+        """
+        :param attempt: number of the failed request, from 0
+        :param retry_after: value of the Retry-After header of the response
+        :return: seconds to wait before the next request
+        """
+        if retry_after is not None:
+            try:
+                return min(max(float(retry_after), 0.0), self.max_backoff)
+            except ValueError:
+                pass  # an HTTP date, the backoff is used instead
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _timeout(self, deadline):
+        """
+        :param deadline: Deadline of the document
+        :return: (connect, read) timeouts of a request
+        """
+        if deadline is None:
+            return self.connect_timeout, self.read_timeout
+        return deadline.timeout(self.connect_timeout), deadline.timeout(self.read_timeout)
+
+    def _request(self, url, headers, deadline, recorder):
+        """
+        :return: requests.Response of one request, hedged if the policy says so, with the body read
+        """
+        if not self.hedge:
+            response = self._send(url, headers, self._timeout(deadline))
+        else:
+            response = self._send_hedged(url, headers, deadline, recorder)
+
+        # reading the body, after the winner is known: the body is not hedged
+        response.content
+        return response
+
+    def _send(self, url, headers, timeout):
+        """
+        Sends a request, the time to its headers is added to the latencies. Latencies of the requests lost
+        the race are added too, so the percentile is not lowered by hedging itself.
+
+        :return: requests.Response, its body is not read yet
+        """
+        started = time.perf_counter()
+        response = requests.get(url, headers=headers, timeout=timeout, stream=True)
+        self.latencies.add(time.perf_counter() - started)
+        return response
+
+    def _send_hedged(self, url, headers, deadline, recorder):
+        """
+        :return: requests.Response arrived first, its body is not read yet
+        """
+        primary = self.executor.submit(self._send, url, headers, self._timeout(deadline))
+        delay = self.current_hedge_delay()
+        if deadline is not None:
+            delay = deadline.timeout(delay)
+        done, _ = wait((primary,), timeout=delay)
+        if done or (deadline is not None and deadline.expired()):
+            return primary.result()
+
+        recorder.set(COUNTER_HEDGED, 1)
+        hedged = self.executor.submit(self._send, url, headers, self._timeout(deadline))
+        pending = (primary, hedged)
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is None and pending:
+                continue  # an error counts only if both requests failed
+
+            # the first response wins, the other request is dropped
+            for loser in pending:
+                if not loser.cancel():
+                    loser.add_done_callback(_close_response)
+            if winner is None:
+                return primary.result()
+            for future in done:
+                if future is not winner:
+                    _close_response(future)
+            recorder.set(COUNTER_HEDGE_WON, int(winner is hedged))
+            return winner.result()
+
+
+def _close_response(future):
+    """
+    Closes the response of a request lost the race, its body is never read
+
+    :param future: future of the request
+    """
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+# policy of the pages fetched without their own one
+DEFAULT_FETCH_POLICY = FetchPolicy()
@@ -1,9 +1,14 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import re
 from urllib.parse import urlparse, urljoin
 import requests
-from requests.exceptions import Timeout
+from requests.exceptions import ConnectionError, Timeout
 import struct
 from io import BytesIO
+import threading
+
+from wanish.stats import NULL_RECORDER, COUNTER_IMAGE_CACHE_HITS, COUNTER_IMAGE_TIMEOUTS, COUNTER_IMAGES_PROBED
 
 MIN_IMAGE_WIDTH = 580  # px
 MIN_IMAGE_HEIGHT = 250  # px
@@ -26,6 +31,65 @@ IMAGE_URL_FROM_STRING_REGULAR = re.compile(
 
 IMG_DOWNLOAD_TIMEOUT = 5  # sec
 
+IMAGE_CACHE_SIZE = 4096  # quantity of image urls to keep the fetched dimensions of
+
+IMAGE_WORKERS = 16  # threads selecting images of documents in the background
+
+
+class DimensionsCache(object):
+    """
+    Thread-safe LRU cache of the fetched dimensions of images by url. Only found dimensions are kept, so an image
+    failed to download is tried again on the next page.
+    """
+
+    def __init__(self, max_size=IMAGE_CACHE_SIZE):
+        """
+        :param max_size: quantity of image urls to keep
+        """
+        self.max_size = max_size
+        self._dimensions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, img_url):
+        """
+        :param img_url: url of the image
+        :return: width and height of the image, None if they are not cached
+        """
+        with self._lock:
+            dimensions = self._dimensions.get(img_url)
+            if dimensions is not None:
+                self._dimensions.move_to_end(img_url)
+            return dimensions
+
+    def put(self, img_url, dimensions):
+        """
+        :param img_url: url of the image
+        :param dimensions: width and height of the image
+        """
+        if dimensions[0] <= 0 or dimensions[1] <= 0:
+            return
+        with self._lock:
+            self._dimensions[img_url] = dimensions
+            self._dimensions.move_to_end(img_url)
+            while len(self._dimensions) > self.max_size:
+                self._dimensions.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._dimensions.clear()
+
+    def __len__(self):
+        return len(self._dimensions)
+
+
+# dimensions of images shared by the configs enabling it, images like logos and banners repeat across the pages
+# of a site
+dimensions_cache = DimensionsCache()
+
+# images of documents are selected by these threads while their summaries are computed, the threads are started
+# on demand
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='wanish-image')
+
 
 class Image(object):
     """
@@ -37,12 +101,16 @@ class Image(object):
     area = 0  # area of an image, width * height
     is_good = False  # if it is a good candidate to be an image
 
-    def __init__(self, img_node=None, html_url=None, headers=None):
+    def __init__(self, img_node=None, html_url=None, headers=None, timeout=IMG_DOWNLOAD_TIMEOUT,
+                 recorder=NULL_RECORDER, dimensions_cache=None):
         """
         retrieving image's parameters
         :param img_node: node of the img tag
         :param html_url: url of the source page
         :param headers: extra headers to request for images' data
+        :param timeout: timeout of the image request in seconds
+        :param recorder: stats recorder of the document
+        :param dimensions_cache: DimensionsCache of the fetched dimensions, None to fetch them every time
         """
 
         # getting url of the given img node
@@ -64,7 +132,9 @@ class Image(object):
 
                 # if dimensions are not found, getting dimensions of the image itself
                 if self.width == 0 or self.height == 0:
-                    self.width, self.height = self.fetch_image_dimensions(self.url, headers=headers)
+                    self.width, self.height = self.get_image_dimensions(self.url, headers=headers, timeout=timeout,
+                                                                        recorder=recorder,
+                                                                        dimensions_cache=dimensions_cache)
 
                 self.area = self.width * self.height
 
@@ -127,19 +197,45 @@ class Image(object):
         except TypeError:
             return None
 
+    @classmethod
+    def get_image_dimensions(cls, img_url, headers=None, timeout=IMG_DOWNLOAD_TIMEOUT, recorder=NULL_RECORDER,
+                             dimensions_cache=None):
+        """
+        returns width and height of the image from the cache or fetches them
+        :param img_url: url of the image
+        :param headers: extra headers for url requests if needed
+        :param timeout: timeout of the request in seconds
+        :param recorder: stats recorder of the document
+        :param dimensions_cache: DimensionsCache of the fetched dimensions, None to fetch them every time
+        :return: image's width and height
+        """
+        if dimensions_cache is not None:
+            dimensions = dimensions_cache.get(img_url)
+            if dimensions is not None:
+                recorder.count(COUNTER_IMAGE_CACHE_HITS)
+                return dimensions
+
+        recorder.count(COUNTER_IMAGES_PROBED)
+        dimensions = cls.fetch_image_dimensions(img_url, headers=headers, timeout=timeout, recorder=recorder)
+        if dimensions_cache is not None:
+            dimensions_cache.put(img_url, dimensions)
+        return dimensions
+
     # http://stackoverflow.com/questions/8032642/how-to-obtain-image-size-using-standard-python-class-without-using-external-lib
     @staticmethod
-    def fetch_image_dimensions(img_url, headers=None):
+    def fetch_image_dimensions(img_url, headers=None, timeout=IMG_DOWNLOAD_TIMEOUT, recorder=NULL_RECORDER):
         """
         detects format of the image and returns its width and height from meta
         :param img_url: url of the image
         :param headers: extra headers for url requests if needed
+        :param timeout: timeout of the request in seconds
+        :param recorder: stats recorder of the document, counts timed out requests
         :return: image's width and height
         """
         width = -1
         height = -1
         try:
-            r = requests.get(url=img_url, timeout=IMG_DOWNLOAD_TIMEOUT, headers=headers)
+            r = requests.get(url=img_url, timeout=timeout, headers=headers)
             head = r.content[:32]
             if head.startswith(b'\211PNG\r\n\032\n'):
                 check = struct.unpack('>i', head[4:8])[0]
@@ -167,7 +263,9 @@ class Image(object):
                     height, width = struct.unpack('>HH', fhandle.read(4))
                 except Exception:  # IGNORE:W0703
                     return width, height
-        except (Timeout, TypeError, ConnectionError):
+        except Timeout:
+            recorder.count(COUNTER_IMAGE_TIMEOUTS)
+        except (TypeError, ConnectionError):
             pass
         return width, height
 
@@ -248,7 +346,8 @@ def get_image_container_node(html=None, article=None, title=None):
     return html
 
 
-def get_image_url(html, source_url=None, headers=None, article_element=None, title_element=None):
+def get_image_url(html, source_url=None, headers=None, article_element=None, title_element=None, deadline=None,
+                  recorder=NULL_RECORDER, dimensions_cache=None):
     """
     gets article picture's url
 
@@ -264,6 +363,9 @@ def get_image_url(html, source_url=None, headers=None, article_element=None, tit
     :param headers: headers to send when detecting dimensions of images
     :param article_element: detected article element to improve image detection
     :param title_element: detected title element to improve image detection
+    :param deadline: Deadline of the document, images are not probed after it expires
+    :param recorder: stats recorder of the document, counts probed images
+    :param dimensions_cache: DimensionsCache of the fetched dimensions of images, None to fetch them every time
     :return: url of the image
     """
 
@@ -277,7 +379,14 @@ def get_image_url(html, source_url=None, headers=None, article_element=None, tit
 
     # find good candidates
     for node in image_nodes:
-        image = Image(img_node=node, html_url=source_url, headers=headers)
+        timeout = IMG_DOWNLOAD_TIMEOUT
+        if deadline is not None:
+            if deadline.expired():
+                break
+            timeout = deadline.timeout(IMG_DOWNLOAD_TIMEOUT)
+
+        image = Image(img_node=node, html_url=source_url, headers=headers, timeout=timeout, recorder=recorder,
+                      dimensions_cache=dimensions_cache)
         if image.is_good is True:
             candidates_list.append(image)
 
@@ -65,7 +65,7 @@ class LanguageIdentifier(object):
         z = bz2.decompress(b)
         model = loads(z)
         nb_ptc, nb_pc, nb_classes, tk_nextmove, tk_output = model
-        nb_numfeats = len(nb_ptc) / len(nb_pc)
+        nb_numfeats = len(nb_ptc) // len(nb_pc)
 
         # reconstruct pc and ptc
         nb_pc = np.array(nb_pc)
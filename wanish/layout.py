@@ -0,0 +1,113 @@
+"""
+Layouts of sites learned on previously performed pages.
+
+Pages of one site are usually built from one template, so the node containing the article and the title node
+are found by the same structural path. The path is a sequence of node signatures (tag, id and classes) from the
+root, digits in ids and classes are ignored as they are often unique to the page.
+"""
+from collections import namedtuple
+import re
+
+from wanish.stores import DomainStore
+
+# maximum quantity of nodes matched at one level of a path, ambiguous paths are given up
+MAX_PATH_MATCHES = 50
+
+DIGITS_RE = re.compile(r'\d+')
+
+# minimum length of a learned article path: html, body and a child of body, the body itself matches every page
+MIN_ARTICLE_PATH_LENGTH = 3
+
+
+class Layout(namedtuple('Layout', [
+    'article_path',  # signature path of the node containing the article
+    'title_path',  # signature path of the title node, None if the title was not found on the page
+])):
+    __slots__ = ()
+
+
+def node_signature(elem):
+    """
+    :param elem: element
+    :return: signature of the element: tag, id and sorted classes
+    """
+    tag = elem.tag if isinstance(elem.tag, str) else ''
+
+    # html and body are single in a document, and their attributes are changed while performing
+    if tag in ('html', 'body'):
+        return tag
+
+    signature = tag
+    elem_id = elem.get('id')
+    if elem_id:
+        signature += '#' + DIGITS_RE.sub('0', elem_id.strip())
+    classes = elem.get('class')
+    if classes:
+        signature += ''.join('.' + c for c in sorted(set(DIGITS_RE.sub('0', classes).split())))
+    return signature
+
+
+def signature_path(elem):
+    """
+    :param elem: element of a document
+    :return: tuple of signatures of the nodes from the root to the element
+    """
+    path = []
+    while elem is not None:
+        path.append(node_signature(elem))
+        elem = elem.getparent()
+    path.reverse()
+    return tuple(path)
+
+
+def find_by_path(root, path):
+    """
+    Finds the element by its signature path
+
+    :param root: root element of a document
+    :param path: signature path made by signature_path()
+    :return: the element, None if the path matches no elements or more than one
+    """
+    if not path or node_signature(root) != path[0]:
+        return None
+
+    level = [root]
+    for signature in path[1:]:
+        level = [child for node in level for child in node if node_signature(child) == signature]
+        if not level or len(level) > MAX_PATH_MATCHES:
+            return None
+
+    return level[0] if len(level) == 1 else None
+
+
+class LayoutStore(DomainStore):
+    """
+    Layouts of the article and title nodes by domain. A layout is learned on every performed page of a domain
+    and is tried first on the next pages, a page it does not hold for replaces it with its own layout.
+    """
+
+    def learn(self, domain, article_node, title_node=None):
+        """
+        Remembers the layout of a performed page, unless the article node is the body or above it
+
+        :param domain: domain of the page
+        :param article_node: node containing the article
+        :param title_node: title node, if found
+        """
+        if domain is None or article_node is None:
+            return
+        article_path = signature_path(article_node)
+        if len(article_path) < MIN_ARTICLE_PATH_LENGTH:
+            return
+        title_path = signature_path(title_node) if title_node is not None else None
+        self.put(domain, Layout(article_path, title_path))
+
+    def encode(self, entry):
+        return {
+            'article': list(entry.article_path),
+            'title': list(entry.title_path) if entry.title_path is not None else None,
+        }
+
+    def decode(self, data):
+        title_path = data.get('title')
+        return Layout(tuple(data['article']), tuple(title_path) if title_path is not None else None)
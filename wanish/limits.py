@@ -0,0 +1,143 @@
+"""
+Size guardrails of parsed documents
+"""
+from collections import namedtuple
+
+from lxml import etree
+
+from wanish.cleaner import Unparseable
+
+POLICY_TRUNCATE = 'truncate'  # everything beyond the limits is dropped
+POLICY_REJECT = 'reject'  # a document beyond the limits is not performed at all
+
+
+class DocumentTooLarge(Unparseable):
+    pass
+
+
+class DomLimits(namedtuple('DomLimits', [
+    'max_nodes',  # maximum quantity of elements
+    'max_depth',  # maximum nesting depth of elements, the root is at depth 1
+    'max_text_bytes',  # maximum size of text in utf-8
+    'policy',  # POLICY_TRUNCATE or POLICY_REJECT
+])):
+    """
+    Limits of a parsed document. Any of the limits may be None to leave it unchecked.
+    """
+    __slots__ = ()
+
+    def __new__(cls, max_nodes=None, max_depth=None, max_text_bytes=None, policy=POLICY_TRUNCATE):
+        if policy not in (POLICY_TRUNCATE, POLICY_REJECT):
+            raise ValueError("Unknown oversize policy %s" % policy)
+        return super(DomLimits, cls).__new__(cls, max_nodes, max_depth, max_text_bytes, policy)
+
+    def is_unlimited(self):
+        return self.max_nodes is None and self.max_depth is None and self.max_text_bytes is None
+
+
+def limit_tree(root, limits):
+    """
+    Checks the tree against the limits in one pass in document order. Depending on the policy raises
+    DocumentTooLarge or truncates the tree: subtrees nested too deep are dropped, and the document is cut
+    at the point, where the quantity of nodes or the size of text runs out.
+
+    :param root: root element of the parsed document
+    :param limits: DomLimits
+    :return: True if the tree was truncated
+    """
+    if limits is None or limits.is_unlimited():
+        return False
+
+    max_nodes, max_depth, max_text_bytes = limits.max_nodes, limits.max_depth, limits.max_text_bytes
+
+    too_deep = []  # roots of subtrees nested too deep
+    cut = None  # (node, part) where the document runs out of limits
+    text_left = max_text_bytes
+
+    nodes = depth = 0
+    walker = etree.iterwalk(root, events=('start', 'end'))
+    for event, elem in walker:
+        if event == 'end':
+            depth -= 1
+            if text_left is not None and elem is not root and elem.tail:
+                text_left -= len(elem.tail.encode('utf-8'))
+                if text_left < 0:
+                    cut = (elem, 'tail')
+                    break
+            continue
+
+        depth += 1
+        if max_depth is not None and depth > max_depth:
+            if limits.policy == POLICY_REJECT:
+                raise DocumentTooLarge("Document is nested deeper than %s elements" % max_depth)
+            too_deep.append(elem)
+            # the end event of the element still comes: it leaves the depth and counts the tail, which stays
+            # with the parent once the subtree is dropped
+            walker.skip_subtree()
+            continue
+
+        nodes += 1
+        if max_nodes is not None and nodes > max_nodes:
+            cut = (elem, 'node')
+            break
+
+        if text_left is not None and isinstance(elem.text, str):
+            text_left -= len(elem.text.encode('utf-8'))
+            if text_left < 0:
+                cut = (elem, 'text')
+                break
+
+    if cut is not None and limits.policy == POLICY_REJECT:
+        if cut[1] == 'node':
+            raise DocumentTooLarge("Document has more than %s elements" % max_nodes)
+        raise DocumentTooLarge("Document has more than %s bytes of text" % max_text_bytes)
+
+    if cut is not None:
+        _cut_tree(root, cut[0], cut[1], text_left)
+
+    for elem in too_deep:
+        if elem.getparent() is not None:
+            elem.drop_tree()
+
+    return cut is not None or len(too_deep) > 0
+
+
+def _cut_tree(root, elem, part, text_left):
+    """
+    Removes everything after the given part of the element in document order.
+
+    :param root: root element of the document
+    :param elem: element to cut at
+    :param part: 'node' to remove the element, 'text' or 'tail' to shorten its text or tail
+    :param text_left: negative overrun of the text size at the cut point
+    """
+    if part == 'text':
+        elem.text = _shorten(elem.text, text_left)
+        for child in list(elem):
+            elem.remove(child)
+        elem.tail = None
+    elif part == 'tail':
+        elem.tail = _shorten(elem.tail, text_left)
+
+    node = elem
+    while node is not root:
+        parent = node.getparent()
+        for sibling in list(node.itersiblings()):
+            parent.remove(sibling)
+        if part == 'node' and node is elem:
+            parent.remove(elem)
+        if parent is not root:
+            parent.tail = None
+        node = parent
+
+
+def _shorten(text, overrun):
+    """
+    Shortens the text by the overrun of bytes
+
+    :param text: text to shorten
+    :param overrun: negative quantity of bytes to remove
+    :return: shortened text
+    """
+    data = text.encode('utf-8')
+    return data[:max(len(data) + overrun, 0)].decode('utf-8', 'ignore')
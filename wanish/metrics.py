@@ -0,0 +1,410 @@
+"""
+Process-wide metrics of the performed documents, aggregated from their stats and exported in the Prometheus
+text format to a file or by a local HTTP endpoint
+"""
+from bisect import bisect_left
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import math
+import os
+import threading
+
+from wanish.stats import (COUNTER_BYTES, COUNTER_DUPLICATE, COUNTER_FETCH_RETRIES, COUNTER_HEDGE_WON,
+                          COUNTER_HEDGED, COUNTER_HTTP_CACHE_HIT, COUNTER_HTTP_STATUS, COUNTER_IMAGE_CACHE_HITS,
+                          COUNTER_IMAGE_TIMEOUTS, COUNTER_IMAGES_PROBED, COUNTER_LAYOUT_HIT,
+                          COUNTER_NEAR_DUPLICATE, COUNTER_RESULT_CACHE_HIT, COUNTER_RETRY, COUNTER_UNPARSEABLE,
+                          STAGE_FETCH, STAGE_TOTAL)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# seconds, upper bounds of the latency buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# bytes, upper bounds of the document size buckets
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+METRICS_PREFIX = 'wanish_'
+
+
+def escape_label(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, escape_label(value)) for name, value in pairs)
+
+
+class Metric(object):
+    """
+    Metric with its values by the values of its labels
+    """
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        :param name: name of the metric
+        :param documentation: help text of the metric
+        :param labelnames: names of the labels, their values are given in the order of the names
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError("Metric %s has labels %s" % (self.name, ', '.join(self.labelnames) or 'none'))
+        return tuple(str(value) for value in labels)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """
+        :return: list of (name of the sample, its label pairs, value)
+        """
+        raise NotImplementedError
+
+    def render(self):
+        """
+        :return: metric in the Prometheus text format
+        """
+        lines = ['# HELP %s %s' % (self.name, self.documentation.replace('\\', r'\\').replace('\n', r'\n')),
+                 '# TYPE %s %s' % (self.name, self.type_name)]
+        for name, pairs, value in self.samples():
+            lines.append('%s%s %s' % (name, format_labels((), (), pairs), format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(Metric):
+    """
+    Monotonically growing total
+    """
+    type_name = 'counter'
+
+    def inc(self, value=1, labels=()):
+        """
+        :param value: non-negative value to add
+        :param labels: values of the labels
+        """
+        if value < 0:
+            raise ValueError("Counters can only grow")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, labels=()):
+        """
+        :param labels: values of the labels
+        :return: current total
+        """
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, list(zip(self.labelnames, key)), value) for key, value in values]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values over cumulative buckets, with their sum and quantity
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        :param name: name of the metric
+        :param documentation: help text of the metric
+        :param labelnames: names of the labels
+        :param buckets: sorted upper bounds of the buckets, +Inf is added
+        """
+        Metric.__init__(self, name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets if bound != math.inf)) + (math.inf,)
+
+    def observe(self, value, labels=()):
+        """
+        :param value: observed value
+        :param labels: values of the labels
+        """
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # counts by bucket, then sum of the values
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, labels=()):
+        """
+        :param labels: values of the labels
+        :return: quantity of observed values
+        """
+        counts = self._values.get(self._key(labels))
+        return sum(counts[:-1]) if counts is not None else 0
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+
+        samples = []
+        for key, counts in values:
+            pairs = list(zip(self.labelnames, key))
+            total = 0
+            for bound, quantity in zip(self.buckets, counts):
+                total += quantity
+                samples.append((self.name + '_bucket', pairs + [('le', format_value(bound))], total))
+            samples.append((self.name + '_sum', pairs, counts[-1]))
+            samples.append((self.name + '_count', pairs, total))
+        return samples
+
+
+class MetricsRegistry(object):
+    """
+    Thread-safe set of metrics by name
+    """
+
+    def __init__(self):
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError("Metric %s is already registered as a %s" % (name, metric.type_name))
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """
+        :return: Counter of the name, registered by the first call
+        """
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        :return: Histogram of the name, registered by the first call
+        """
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def clear(self):
+        """
+        Drops the values of all metrics, the metrics stay registered
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+    def render(self):
+        """
+        :return: all metrics in the Prometheus text format
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return ''.join(metric.render() for metric in metrics)
+
+    def write(self, path):
+        """
+        Writes the metrics to a file, e.g. for the textfile collector of node_exporter. The file is replaced
+        atomically, so the collector never reads it half-written.
+
+        :param path: file path
+        """
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+# registry of the process
+REGISTRY = MetricsRegistry()
+
+
+class ExtractionMetrics(object):
+    """
+    Aggregates the stats of performed documents into the metrics of a registry. An instance is a stats hook:
+    ExtractorConfig(stats_hook=ExtractionMetrics()). Instances over the same registry share the metrics.
+    """
+
+    def __init__(self, registry=REGISTRY, buckets=DEFAULT_BUCKETS, prefix=METRICS_PREFIX):
+        """
+        :param registry: MetricsRegistry to register the metrics in, the registry of the process by default
+        :param buckets: upper bounds of the latency buckets, seconds
+        :param prefix: prefix of the names of the metrics
+        """
+        self.registry = registry
+        self.documents = registry.counter(
+            prefix + 'documents_total', 'Performed documents by outcome', ('outcome',))
+        self.fetch_status = registry.counter(
+            prefix + 'fetch_status_total', 'Fetched pages by HTTP status code, "error" if no response', ('code',))
+        self.fetch_retries = registry.counter(
+            prefix + 'fetch_retries_total', 'Page requests repeated after a failure')
+        self.hedged_fetches = registry.counter(
+            prefix + 'hedged_fetches_total', 'Pages requested twice, by the request answered first', ('winner',))
+        self.http_cache_hits = registry.counter(
+            prefix + 'http_cache_hits_total', 'Pages not modified since they were cached')
+        self.result_cache_hits = registry.counter(
+            prefix + 'result_cache_hits_total', 'Documents performed before, by the hash of their html')
+        self.duplicates = registry.counter(
+            prefix + 'duplicates_total', 'Pages performed before, found by their normalized or canonical url')
+        self.near_duplicates = registry.counter(
+            prefix + 'near_duplicates_total', 'Articles with a near-duplicate text performed before')
+        self.unparseable = registry.counter(
+            prefix + 'unparseable_total', 'Documents failed to be performed by the article extractor')
+        self.retries = registry.counter(
+            prefix + 'clean_html_retries_total', 'Articles searched again keeping unlikely candidates')
+        self.layout_hits = registry.counter(
+            prefix + 'layout_hits_total', 'Articles found by the learned layout of the site, by result', ('hit',))
+        self.images_probed = registry.counter(
+            prefix + 'images_probed_total', 'Images downloaded to get their dimensions')
+        self.image_cache_hits = registry.counter(
+            prefix + 'image_cache_hits_total', 'Image dimensions taken from the cache')
+        self.image_timeouts = registry.counter(
+            prefix + 'image_probe_timeouts_total', 'Image downloads timed out')
+        self.languages = registry.counter(
+            prefix + 'languages_total', 'Performed articles by language', ('language',))
+        self.degraded = registry.counter(
+            prefix + 'degraded_total', 'Documents with a stage skipped or truncated, by stage', ('stage',))
+        self.bytes = registry.counter(
+            prefix + 'bytes_total', 'Size of performed documents')
+        self.document_seconds = registry.histogram(
+            prefix + 'document_seconds', 'Time to perform a document', buckets=buckets)
+        self.stage_seconds = registry.histogram(
+            prefix + 'stage_seconds', 'Time of the stages of a document', ('stage',), buckets=buckets)
+        self.document_bytes = registry.histogram(
+            prefix + 'document_bytes', 'Size of performed documents', buckets=SIZE_BUCKETS)
+
+    def __call__(self, result):
+        """
+        :param result: core.ArticleResult with stats
+        """
+        self.observe(result)
+
+    def observe(self, result):
+        """
+        Adds the document to the metrics
+
+        :param result: core.ArticleResult with stats, results without them are counted only by outcome
+        """
+        self.documents.inc(labels=('error' if result.error_msg is not None else 'ok',))
+        for stage in result.degraded:
+            self.degraded.inc(labels=(stage,))
+        if result.language:
+            self.languages.inc(labels=(result.language,))
+
+        if result.stats is None:
+            return
+        timings, counters = result.stats.timings, result.stats.counters
+
+        if COUNTER_HTTP_STATUS in counters:
+            self.fetch_status.inc(labels=(counters[COUNTER_HTTP_STATUS],))
+        elif STAGE_FETCH in timings:
+            self.fetch_status.inc(labels=('error',))
+
+        self.fetch_retries.inc(counters.get(COUNTER_FETCH_RETRIES, 0))
+        if counters.get(COUNTER_HEDGED):
+            winner = {0: 'primary', 1: 'hedged'}.get(counters.get(COUNTER_HEDGE_WON), 'none')
+            self.hedged_fetches.inc(labels=(winner,))
+        self.http_cache_hits.inc(counters.get(COUNTER_HTTP_CACHE_HIT, 0))
+        self.result_cache_hits.inc(counters.get(COUNTER_RESULT_CACHE_HIT, 0))
+        self.duplicates.inc(counters.get(COUNTER_DUPLICATE, 0))
+        self.near_duplicates.inc(counters.get(COUNTER_NEAR_DUPLICATE, 0))
+        self.unparseable.inc(counters.get(COUNTER_UNPARSEABLE, 0))
+        self.retries.inc(counters.get(COUNTER_RETRY, 0))
+        if COUNTER_LAYOUT_HIT in counters:
+            self.layout_hits.inc(labels=(counters[COUNTER_LAYOUT_HIT],))
+        self.images_probed.inc(counters.get(COUNTER_IMAGES_PROBED, 0))
+        self.image_cache_hits.inc(counters.get(COUNTER_IMAGE_CACHE_HITS, 0))
+        self.image_timeouts.inc(counters.get(COUNTER_IMAGE_TIMEOUTS, 0))
+
+        if COUNTER_BYTES in counters:
+            self.bytes.inc(counters[COUNTER_BYTES])
+            self.document_bytes.observe(counters[COUNTER_BYTES])
+
+        for stage, seconds in timings.items():
+            if stage == STAGE_TOTAL:
+                self.document_seconds.observe(seconds)
+            else:
+                self.stage_seconds.observe(seconds, labels=(stage,))
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(HTTPServer):
+    """
+    Endpoint serving the metrics of a registry at /metrics from a background thread. May be used as a context
+    manager.
+    """
+
+    def __init__(self, registry=REGISTRY, host='127.0.0.1', port=9464):
+        """
+        :param registry: MetricsRegistry to serve
+        :param host: host to listen on
+        :param port: port to listen on, 0 for a free one
+        """
+        HTTPServer.__init__(self, (host, port), MetricsRequestHandler)
+        self.registry = registry
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        :return: url of the metrics
+        """
+        return 'http://%s:%s/metrics' % self.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='wanish-metrics')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,262 @@
+"""
+Opt-in profiling of batch runs: every document is performed under cProfile and tracemalloc, the slowest and the
+most memory-hungry ones are kept with their raw html and profiles as ready-made cases to reproduce.
+"""
+from collections import namedtuple, OrderedDict
+import cProfile
+import heapq
+import itertools
+import json
+import marshal
+import os
+import pstats
+import re
+import time
+import tracemalloc
+
+from wanish.core import DEFAULT_CONFIG, extract
+
+# modules the hottest functions are reported of
+HOT_MODULES = ('wanish.cleaner', 'wanish.summarizer', 'wanish.title', 'wanish.images', 'wanish.langid')
+
+DEFAULT_TOP = 10  # quantity of documents kept by each criterion
+REPORT_FUNCTIONS = 25  # quantity of functions in the report
+
+WANISH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+UNSAFE_NAME_RE = re.compile(r'[^\w.-]+')
+
+# document performed under the profiler
+ProfiledDocument = namedtuple('ProfiledDocument', [
+    'name',  # name of the document: the given one, its url or its number
+    'seconds',  # wall time of the document under the profiler
+    'peak_bytes',  # peak of memory allocated while the document was performed, 0 if memory is not traced
+    'html',  # raw html of the document, bytes or str
+    'url',  # url of the document
+    'encoding',  # encoding reported by the server
+    'profile_stats',  # raw cProfile stats of the document, as dumped by pstats
+    'error_msg',  # error message of the result or of the raised exception
+])
+
+# function of the wanish modules by its time over all profiled documents
+HotFunction = namedtuple('HotFunction', [
+    'module',  # dotted module name
+    'function',  # function name
+    'line',  # line of the definition
+    'calls',  # quantity of calls
+    'total_seconds',  # time spent in the function itself
+    'cumulative_seconds',  # time spent in the function and the functions it called
+])
+
+
+def module_of(filename):
+    """
+    :param filename: file name of a code object
+    :return: dotted name of the wanish module defined in the file, None for other files
+    """
+    path = os.path.abspath(filename)
+    if os.path.dirname(path) != WANISH_DIR or not path.endswith('.py'):
+        return None
+    return 'wanish.' + os.path.basename(path)[:-3]
+
+
+class DocumentProfiler(object):
+    """
+    Profiles documents one by one and keeps the top of them. Documents are profiled in the calling thread, so the
+    profiler is meant for batch runs performing documents sequentially.
+    """
+
+    def __init__(self, top=DEFAULT_TOP, memory=True, sample_every=1, modules=HOT_MODULES):
+        """
+        :param top: quantity of the slowest and of the most memory-hungry documents to keep
+        :param memory: True to trace memory allocations, it slows the documents down a few times
+        :param sample_every: profile every n-th document, others are performed without the profiler
+        :param modules: modules to report the hottest functions of
+        """
+        if top < 1 or sample_every < 1:
+            raise ValueError("Quantities of documents to keep and to sample should be positive")
+        self.top = top
+        self.memory = memory
+        self.sample_every = sample_every
+        self.modules = tuple(modules)
+        self.documents_seen = 0
+        self.documents_profiled = 0
+        self._slowest = []  # min-heap of (seconds, order, document)
+        self._hungriest = []  # min-heap of (peak bytes, order, document)
+        self._order = itertools.count()
+        self._totals = None  # pstats.Stats of all profiled documents
+
+    @property
+    def slowest(self):
+        """
+        :return: list of ProfiledDocument, the slowest first
+        """
+        return [entry[2] for entry in sorted(self._slowest, reverse=True)]
+
+    @property
+    def hungriest(self):
+        """
+        :return: list of ProfiledDocument, the most memory-hungry first
+        """
+        return [entry[2] for entry in sorted(self._hungriest, reverse=True)]
+
+    def extract(self, document, config=DEFAULT_CONFIG, url=None, encoding=None, name=None):
+        """
+        Performs the document by core.extract(), under the profiler if it is sampled. Exceptions are passed on
+        after the document is recorded. Sampled documents are performed in the calling thread only, the profiler
+        does not see other threads, so the image is selected before the summary.
+
+        :param document: raw html of the document, bytes or str
+        :param config: ExtractorConfig
+        :param url: url of the document
+        :param encoding: encoding reported by the server
+        :param name: name of the document in the report, the url by default
+        :return: ArticleResult
+        """
+        self.documents_seen += 1
+        if (self.documents_seen - 1) % self.sample_every:
+            return extract(document, config, url=url, encoding=encoding)
+
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.memory:
+            self._reset_peak()
+
+        if config.image_executor is not None:
+            config = config._replace(image_executor=None)
+
+        profile = cProfile.Profile()
+        result = error_msg = None
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            result = extract(document, config, url=url, encoding=encoding)
+            error_msg = result.error_msg
+        except Exception as e:
+            error_msg = str(e) or e.__class__.__name__
+            raise
+        finally:
+            profile.disable()
+            seconds = time.perf_counter() - started
+            peak_bytes = tracemalloc.get_traced_memory()[1] if self.memory else 0
+            if tracing:
+                tracemalloc.stop()
+            self._record(profile, ProfiledDocument(
+                name or url or 'document-%d' % self.documents_seen, seconds, peak_bytes, document, url, encoding,
+                None, error_msg))
+
+        return result
+
+    @staticmethod
+    def _reset_peak():
+        reset_peak = getattr(tracemalloc, 'reset_peak', None)
+        if reset_peak is not None:
+            reset_peak()
+        else:
+            # dropping the traces is the only way to reset the peak before python 3.9
+            tracemalloc.clear_traces()
+
+    def _record(self, profile, profiled):
+        self.documents_profiled += 1
+        stats = pstats.Stats(profile)
+        if self._totals is None:
+            self._totals = stats
+        else:
+            self._totals.add(stats)
+
+        # raw stats are kept only by documents getting into one of the tops
+        kept = None
+        order = next(self._order)
+        for heap, key in ((self._slowest, profiled.seconds), (self._hungriest, profiled.peak_bytes)):
+            if heap is self._hungriest and not self.memory:
+                continue
+            if len(heap) < self.top or key > heap[0][0]:
+                if kept is None:
+                    profile.create_stats()
+                    kept = profiled._replace(profile_stats=profile.stats)
+                if len(heap) < self.top:
+                    heapq.heappush(heap, (key, order, kept))
+                else:
+                    heapq.heapreplace(heap, (key, order, kept))
+
+    def hot_functions(self, limit=REPORT_FUNCTIONS):
+        """
+        :param limit: quantity of functions
+        :return: list of HotFunction of the reported modules over all profiled documents, the hottest first
+        """
+        if self._totals is None:
+            return []
+
+        functions = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in self._totals.stats.items():
+            module = module_of(filename)
+            if module is not None and module in self.modules:
+                functions.append(HotFunction(module, function, line, calls, total, cumulative))
+        functions.sort(key=lambda x: x.total_seconds, reverse=True)
+        return functions[:limit]
+
+    def report(self, limit=REPORT_FUNCTIONS):
+        """
+        :param limit: quantity of functions
+        :return: text report of the kept documents and of the hottest functions
+        """
+        lines = ['%d documents seen, %d profiled' % (self.documents_seen, self.documents_profiled), '']
+
+        lines.append('Slowest documents:')
+        for document in self.slowest:
+            lines.append('  %10.2f ms  %s' % (document.seconds * 1000, document.name))
+        if self.memory:
+            lines.append('')
+            lines.append('Most memory-hungry documents:')
+            for document in self.hungriest:
+                lines.append('  %10.1f KB  %s' % (document.peak_bytes / 1024.0, document.name))
+
+        lines.append('')
+        lines.append('Hottest functions of %s:' % ', '.join(self.modules))
+        lines.append('  %10s %10s %10s  %s' % ('calls', 'own, ms', 'cum, ms', 'function'))
+        for function in self.hot_functions(limit):
+            lines.append('  %10d %10.2f %10.2f  %s.%s:%d' % (
+                function.calls, function.total_seconds * 1000, function.cumulative_seconds * 1000,
+                function.module, function.function, function.line))
+        return '\n'.join(lines) + '\n'
+
+    def save(self, directory):
+        """
+        Writes the kept documents, their profiles and the report to the directory. Every document is saved as
+        a .html file, its profile as a .pstats file readable by pstats.Stats, the report as report.txt and
+        the index of the documents as index.json.
+
+        :param directory: directory path, created if it is missing
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        index = OrderedDict()
+        for criterion, documents in (('slowest', self.slowest), ('hungriest', self.hungriest)):
+            entries = index[criterion] = []
+            for rank, document in enumerate(documents, 1):
+                name = re.sub(r'\.html?$', '', document.name)
+                base = '%s_%02d_%s' % (criterion, rank, UNSAFE_NAME_RE.sub('_', name)[-80:])
+                html = document.html
+                if isinstance(html, str):
+                    html = html.encode('utf-8')
+                with open(os.path.join(directory, base + '.html'), 'wb') as f:
+                    f.write(html or b'')
+                with open(os.path.join(directory, base + '.pstats'), 'wb') as f:
+                    marshal.dump(document.profile_stats, f)
+                entries.append(OrderedDict([
+                    ('name', document.name),
+                    ('url', document.url),
+                    ('encoding', document.encoding),
+                    ('ms', document.seconds * 1000),
+                    ('peak_bytes', document.peak_bytes),
+                    ('error_msg', document.error_msg),
+                    ('html', base + '.html'),
+                    ('pstats', base + '.pstats'),
+                ]))
+
+        with open(os.path.join(directory, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+        with open(os.path.join(directory, 'report.txt'), 'w', encoding='utf-8') as f:
+            f.write(self.report())
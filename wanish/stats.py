@@ -0,0 +1,151 @@
+"""
+Per-document instrumentation: wall time of the stages and counters of what was performed
+"""
+from collections import namedtuple, OrderedDict
+from time import perf_counter
+from types import MappingProxyType
+
+# stages, time is recorded for
+STAGE_FETCH = 'fetch'  # download of the page
+STAGE_ENCODING = 'encoding'  # detection of the encoding and decoding
+STAGE_PARSING = 'parsing'  # parsing into a tree
+STAGE_DOM_LIMITS = 'dom_limits'  # checking the tree against the DOM limits
+STAGE_HTML_CLEANER = 'html_cleaner'  # cleaning the tree, making links absolute
+STAGE_BOILERPLATE = 'boilerplate'  # dropping blocks repeating across the pages of a site
+STAGE_CLEAN_HTML = 'get_clean_html'  # extraction of the article
+STAGE_SIMHASH = 'simhash'  # signature of the text of the article and near-duplicate search
+STAGE_TITLE = 'shorten_title'  # searching the title
+STAGE_IMAGE = 'get_image_url'  # selection of the image
+STAGE_PLAIN_TEXT = 'get_plain_text'  # segmentation and ranking of sentences
+STAGE_LANGID = 'langid'  # language detection
+STAGE_TOTAL = 'total'  # whole document, including the time between the stages
+
+# counters
+COUNTER_HTTP_STATUS = 'http_status'  # status code of the response, absent if there was none
+COUNTER_FETCH_RETRIES = 'fetch_retries'  # quantity of requests of the page repeated after a failure
+COUNTER_HEDGED = 'hedged'  # 1 if a hedged request of the page was fired
+COUNTER_HEDGE_WON = 'hedge_won'  # 1 if the response of the hedged request arrived first, 0 if the other one did
+COUNTER_HTTP_CACHE_HIT = 'http_cache_hit'  # 1 if the page was not modified and its result was taken from the cache
+COUNTER_RESULT_CACHE_HIT = 'result_cache_hit'  # 1 if the result of the same document was taken from the cache
+COUNTER_DUPLICATE = 'duplicate'  # 1 if the url of the page was performed before and the heavy stages were skipped
+COUNTER_NEAR_DUPLICATE = 'near_duplicate'  # 1 if a near-duplicate text was performed before
+COUNTER_BYTES = 'bytes'  # size of the downloaded or given document
+COUNTER_NODES = 'nodes'  # quantity of elements after cleaning
+COUNTER_CANDIDATES = 'candidates'  # quantity of scored candidates of the article
+COUNTER_RETRY = 'retry'  # 1 if the article was searched again without removing unlikely candidates
+COUNTER_UNPARSEABLE = 'unparseable'  # 1 if the article extractor failed on the document
+COUNTER_LAYOUT_HIT = 'layout_hit'  # 1 if the article was found by the learned layout of the site
+COUNTER_BOILERPLATE = 'boilerplate_blocks'  # quantity of dropped boilerplate blocks
+COUNTER_IMAGES_PROBED = 'images_probed'  # quantity of images downloaded to get their dimensions
+COUNTER_IMAGE_CACHE_HITS = 'image_cache_hits'  # quantity of image dimensions taken from the cache
+COUNTER_IMAGE_TIMEOUTS = 'image_timeouts'  # quantity of image downloads timed out
+COUNTER_SENTENCES = 'sentences'  # quantity of sentences of the article
+COUNTER_LANGID_CHARS = 'langid_chars'  # length of the text the language is detected by
+
+
+class DocumentStats(namedtuple('DocumentStats', [
+    'timings',  # read-only dict of seconds by stage
+    'counters',  # read-only dict of counters by name
+])):
+    """
+    Immutable instrumentation of one document
+    """
+    __slots__ = ()
+
+
+class StatsRecorder(object):
+    """
+    Records stages performed one after another: every lap adds the time passed since the previous one to its stage.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.timings = OrderedDict()
+        self.counters = OrderedDict()
+        self._created = self._lap_started = perf_counter()
+
+    def lap(self, stage):
+        """
+        Adds the time passed since the previous lap to the stage
+
+        :param stage: name of the stage
+        """
+        now = perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self._lap_started
+        self._lap_started = now
+
+    def skip(self):
+        """
+        Excludes the time passed since the previous lap from the stages
+        """
+        self._lap_started = perf_counter()
+
+    def count(self, name, value=1):
+        """
+        :param name: name of the counter
+        :param value: value to add to the counter
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """
+        :param name: name of the counter
+        :param value: value of the counter
+        """
+        self.counters[name] = value
+
+    def fork(self):
+        """
+        :return: recorder of stages performed in another thread, see merge()
+        """
+        return StatsRecorder()
+
+    def merge(self, other):
+        """
+        Adds the timings and the counters of a forked recorder, once its stages are finished
+
+        :param other: recorder made by fork()
+        """
+        for stage, seconds in other.timings.items():
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        for name, value in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def freeze(self):
+        """
+        :return: DocumentStats of the recorded stages and counters
+        """
+        timings = OrderedDict(self.timings)
+        timings[STAGE_TOTAL] = perf_counter() - self._created
+        return DocumentStats(MappingProxyType(timings), MappingProxyType(OrderedDict(self.counters)))
+
+
+class NullRecorder(object):
+    """
+    Recorder doing nothing, it is used when the instrumentation is disabled.
+    """
+    enabled = False
+
+    def lap(self, stage):
+        pass
+
+    def skip(self):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def fork(self):
+        return self
+
+    def merge(self, other):
+        pass
+
+    def freeze(self):
+        return None
+
+
+NULL_RECORDER = NullRecorder()
@@ -0,0 +1,131 @@
+"""
+Bounded per-domain stores of knowledge learned on previously performed pages
+"""
+from collections import OrderedDict
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+DEFAULT_MAX_DOMAINS = 10000  # quantity of domains kept by a store
+
+
+def domain_of(url):
+    """
+    Domain of the url the store entries are kept by
+
+    :param url: url of a document
+    :return: lowercase host name without the leading www., None if there is no host
+    """
+    if not url:
+        return None
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    return host[4:] if host.startswith('www.') else host
+
+
+class DomainStore(object):
+    """
+    Thread-safe store of one entry per domain. The least recently used domains are evicted beyond max_domains.
+    Subclasses define how an entry is encoded to JSON and decoded back to be saved on disk.
+    """
+
+    def __init__(self, max_domains=DEFAULT_MAX_DOMAINS):
+        """
+        :param max_domains: maximum quantity of domains to keep
+        """
+        if max_domains < 1:
+            raise ValueError("A store should keep at least one domain")
+        self.max_domains = max_domains
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, domain):
+        return domain in self._entries
+
+    def get(self, domain):
+        """
+        :param domain: domain of a document
+        :return: entry of the domain or None
+        """
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is not None:
+                self._entries.move_to_end(domain)
+            return entry
+
+    def put(self, domain, entry):
+        """
+        Stores the entry of the domain, evicting the least recently used domains if needed
+
+        :param domain: domain of a document
+        :param entry: entry to store
+        """
+        with self._lock:
+            self._put(domain, entry)
+
+    def discard(self, domain):
+        """
+        :param domain: domain to forget
+        """
+        with self._lock:
+            self._entries.pop(domain, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _put(self, domain, entry):
+        self._entries[domain] = entry
+        self._entries.move_to_end(domain)
+        while len(self._entries) > self.max_domains:
+            self._entries.popitem(last=False)
+
+    def encode(self, entry):
+        """
+        :param entry: stored entry
+        :return: JSON serializable representation of the entry
+        """
+        return entry
+
+    def decode(self, data):
+        """
+        :param data: representation of an entry made by encode()
+        :return: entry
+        """
+        return data
+
+    def save(self, path):
+        """
+        Writes the store to a JSON file. The file is replaced atomically, so readers never see it half-written.
+
+        :param path: file path
+        """
+        with self._lock:
+            data = [[domain, self.encode(entry)] for domain, entry in self._entries.items()]
+
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'domains': data}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """
+        Reads entries saved by save(), they take place of the current entries of the same domains.
+
+        :param path: file path
+        """
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+
+        entries = [(domain, self.decode(entry)) for domain, entry in data.get('domains', [])]
+        with self._lock:
+            for domain, entry in entries:
+                self._put(domain, entry)
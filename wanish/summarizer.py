@@ -1,13 +1,16 @@
 """
 Extraction of raw text from lxml tree and text summarization
 """
-from itertools import combinations
+from collections import namedtuple
+from functools import lru_cache
+import threading
 
+import numpy as np
 import snowballstemmer
-import networkx as nx
 import re
 
 from wanish import lang_identifier
+from wanish.stats import NULL_RECORDER, COUNTER_LANGID_CHARS, COUNTER_SENTENCES, STAGE_LANGID, STAGE_PLAIN_TEXT
 
 from segtok.segmenter import split_multi
 from segtok.tokenizer import word_tokenizer
@@ -32,6 +35,36 @@ LANG_CODES = {
 # regexp to strip off dialog sentences
 dialog_re = re.compile("^\s*[-—]\s*", re.U)
 
+# sentence of the text with its place
+Sentence = namedtuple('Sentence', [
+    'text',  # text of the sentence
+    'paragraph',  # index of the paragraph containing the sentence
+    'position',  # index of the sentence in the text
+])
+
+# sentence of the text with its TextRank score
+RankedSentence = namedtuple('RankedSentence', [
+    'text',  # text of the sentence
+    'score',  # TextRank score
+    'paragraph',  # index of the paragraph containing the sentence
+    'position',  # index of the sentence in the text
+])
+
+# maximum quantity of memorized stems per language
+STEM_CACHE_SIZE = 100000
+
+# PageRank parameters
+PAGERANK_ALPHA = 0.85  # damping factor
+PAGERANK_MAX_ITER = 100  # maximum quantity of power iterations
+PAGERANK_TOL = 1.0e-6  # convergence tolerance per node
+
+SCORE_DIGITS = 12  # decimal digits of scores compared when sentences are sorted by them
+
+# texts with more sentences are ranked in interleaved chunks instead of all pairs at once
+LONG_TEXT_SENTENCES = 1000
+CHUNK_SENTENCES = 400  # approximate quantity of sentences in a chunk of a long text
+FINALIST_SENTENCES = 50  # top sentences of the chunks ranked again against the whole text
+
 
 def get_plain_text(cleaned_html_node, summary_sentences_qty):
     """
@@ -41,55 +74,461 @@ def get_plain_text(cleaned_html_node, summary_sentences_qty):
     :param summary_sentences_qty: quantity of sentences of summarized text
     :return: summarized text, two-digit language code
     """
-    clean_text = ""
+    ranking, lang_code = get_ranking(cleaned_html_node)
+
+    return summarize_ranking(ranking, summary_sentences_qty), lang_code
+
+
+def get_ranking(cleaned_html_node, policy=None, time_left=None, recorder=NULL_RECORDER):
+    """
+    Ranks sentences of text from html element. Summaries of any length may be formed of the ranking
+    by summarize_ranking() without ranking the text again.
+
+    :param cleaned_html_node: html node to extract text sentences
+    :param policy: EnginePolicy choosing the ranking engine, TextRank is used by default
+    :param time_left: seconds left to perform the document, None if unlimited
+    :param recorder: stats recorder of the document
+    :return: tuple of RankedSentence sorted by score, two-digit language code
+    """
+    sentences = get_sentences(cleaned_html_node)
+
+    # language is detected on the same text, which was formed of the sentences before
+    clean_text = ''.join(' ' + sentence.text for sentence in sentences)
+    recorder.set(COUNTER_SENTENCES, len(sentences))
+    recorder.set(COUNTER_LANGID_CHARS, len(clean_text) + 1)
+    recorder.lap(STAGE_PLAIN_TEXT)
 
-    # assembling text only with complete sentences, ended with respective punctuations.
-    for node in cleaned_html_node.iter('p'):
+    engine = (policy or DEFAULT_POLICY).choose(len(sentences), time_left)
+    tr, lang_code = rank(sentences, ' '.join(['', clean_text]), engine, recorder)
+
+    ranking = tuple(RankedSentence(text, score, sentences[i].paragraph, sentences[i].position)
+                    for i, score, text in tr)
+    return ranking, lang_code
+
+
+def summarize_ranking(ranking, n=5):
+    """
+    Forms a summary of the top ranked sentences in their original order.
+
+    :param ranking: sequence of RankedSentence sorted by score
+    :param n: maximum quantity of sentences
+    :return: summary text
+    """
+    top_n = sorted(ranking[:max(n, 0)], key=lambda x: x.position)
+    return ' '.join(x.text for x in top_n)
+
+
+def get_sentences(cleaned_html_node):
+    """
+    Segments text of paragraphs of html element into sentences.
+    Only complete sentences, ended with respective punctuations, are taken.
+
+    :param cleaned_html_node: html node to extract text sentences
+    :return: list of Sentence
+    """
+    sentences = []
+
+    for paragraph, node in enumerate(cleaned_html_node.iter('p')):
         if node.text is not None:
             for sentence in split_multi(node.text):
                 if len(sentence) > 0 and sentence[-1:] in ['.', '!', '?', '…'] and \
                         not sentence.strip(' .!?…').isdigit() and not dialog_re.match(sentence):
-                    clean_text = clean_text + ' ' + sentence
+                    sentences.append(Sentence(sentence, paragraph, len(sentences)))
 
-    # creating summary, obtaining language code and total sentences quantity
-    final_result, lang_code, sent_qty = create_referat(clean_text, '', summary_sentences_qty)
+    return sentences
 
-    return final_result, lang_code
 
+def textrank(text, hdr):
+    # tokenizing for words
+    sentences = [Sentence(sentence, 0, i) for i, sentence in enumerate(split_multi(text))]
 
-def similarity(s1, s2):
-    if not len(s1) or not len(s2):
-        return 0.0
-    return len(s1.intersection(s2))/(1.0 * (len(s1) + len(s2)))
+    return rank(sentences, ' '.join([hdr, text]))
 
 
-def textrank(text, hdr):
+def rank(sentences, lang_text, engine=None, recorder=NULL_RECORDER):
+    """
+    Ranks already segmented sentences.
+
+    :param sentences: list of Sentence
+    :param lang_text: text to detect language by
+    :param engine: SummarizationEngine, TextRank by default
+    :param recorder: stats recorder of the document, times language detection and ranking
+    :return: list of (index, rank, sentence text) sorted by rank, two-digit language code
+    """
     # finding out the most possible language of the text
-    lang_code = lang_identifier.classify(' '.join([hdr, text]))[0]
+    lang_code = lang_identifier.classify(lang_text)[0]
+    recorder.lap(STAGE_LANGID)
+
+    pr = (engine or TEXTRANK_ENGINE).score(sentences, LANG_CODES.get(lang_code, 'english'))
+    recorder.lap(STAGE_PLAIN_TEXT)
+
+    # scores are rounded, so sentences tied up to float noise keep their order in the text
+    return sorted(((i, pr[i], s.text) for i, s in enumerate(sentences) if i in pr),
+                  key=lambda x: (-round(pr[x[0]], SCORE_DIGITS), x[0])), lang_code
+
+
+# stemmers keep the state of a performed word, so every thread gets its own ones
+_thread_stemmers = threading.local()
+
+# memoized stemming functions by language
+_stem_functions = {}
+_stem_functions_lock = threading.Lock()
+
+
+def get_stemmer(language):
+    """
+    Returns the stemmer of the language for the current thread, it is created only once.
+
+    :param language: snowball language name
+    :return: stemmer
+    """
+    stemmers = getattr(_thread_stemmers, 'stemmers', None)
+    if stemmers is None:
+        stemmers = _thread_stemmers.stemmers = {}
+
+    stemmer = stemmers.get(language)
+    if stemmer is None:
+        stemmer = stemmers[language] = snowballstemmer.stemmer(language)
+    return stemmer
+
+
+def get_stem_function(language):
+    """
+    Returns a function stemming words of the language. Its results are memorized in a bounded LRU cache,
+    shared by all threads of the process.
+
+    :param language: snowball language name
+    :return: function of a word returning its stem
+    """
+    stem = _stem_functions.get(language)
+    if stem is None:
+        with _stem_functions_lock:
+            stem = _stem_functions.get(language)
+            if stem is None:
+                @lru_cache(maxsize=STEM_CACHE_SIZE)
+                def stem(word):
+                    return get_stemmer(language).stemWord(word)
+
+                _stem_functions[language] = stem
+    return stem
+
+
+def sentence_stems(sentence, stem):
+    """
+    Tokenizes the sentence and returns the set of stems of its words
+
+    :param sentence: sentence text
+    :param stem: stemming function
+    :return: set of stems
+    """
+    return set(stem(word) for word in word_tokenizer(sentence.lower()) if word.isalpha())
+
+
+def rank_sentences(words):
+    """
+    Ranks sentences by TextRank. Long texts are split into interleaved chunks: every chunk takes each k-th
+    sentence, so it samples the whole text. Chunks are ranked exactly and their ranks are scaled to the share
+    of the chunk in the text. The top sentences, which make the summaries, are ranked again against the whole
+    text by rank_finalists(). It takes linear time in the quantity of sentences instead of quadratic.
+
+    :param words: list of sets of sentences' stems
+    :return: dict of ranks by sentence index, sentences without any similar sentence are omitted
+    """
+    if len(words) <= LONG_TEXT_SENTENCES:
+        return graph_ranks(words, range(len(words)))
+
+    chunks_qty = -(-len(words) // CHUNK_SENTENCES)
+    ranks = {}
+    out_weights = {}
+    for chunk in range(chunks_qty):
+        indexes = range(chunk, len(words), chunks_qty)
+        share = len(indexes) / float(len(words))
+        chunk_out_weights = {}
+        for i, rank in graph_ranks([words[i] for i in indexes], indexes, chunk_out_weights).items():
+            ranks[i] = rank * share
+            # the chunk samples the text, so the similarities to the whole text are about 1 / share times more
+            out_weights[i] = chunk_out_weights[i] / share
+    return rank_finalists(words, ranks, out_weights)
+
+
+def rank_finalists(words, ranks, out_weights, qty=FINALIST_SENTENCES):
+    """
+    Ranks the top sentences of the chunks again by a step of PageRank over their similarities to every sentence
+    of the text, the ranks of the other sentences are taken as they are. A rank in a chunk is summed over the
+    few similar sentences of the chunk, so it is noisy; the step sums it over all of them.
+
+    :param words: list of sets of sentences' stems
+    :param ranks: dict of ranks by sentence index made of the chunks
+    :param out_weights: dict of estimated sums of the similarities of the sentences by index
+    :param qty: quantity of the top sentences to rank again
+    :return: dict of ranks by sentence index
+    """
+    nodes = sorted(ranks)
+    x = np.array([ranks[i] for i in nodes])
+    finalists = np.argsort(-x, kind='stable')[:qty]
+
+    incidence = incidence_matrix([words[i] for i in nodes])
+    sizes = incidence.sum(axis=1).astype(np.float64)
+    intersections = np.dot(incidence[finalists], incidence.T).astype(np.float64)
+    weights = intersections / (sizes[finalists][:, None] + sizes[None, :])
+    weights[np.arange(len(finalists)), finalists] = 0.0
+
+    # sums of the similarities of the finalists are known exactly
+    totals = np.array([out_weights[i] for i in nodes])
+    totals[finalists] = weights.sum(axis=1)
+
+    finalist_ranks = PAGERANK_ALPHA * np.dot(weights, x / totals) + (1 - PAGERANK_ALPHA) / len(nodes)
+    ranks = dict(ranks)
+    for k, rank in zip(finalists.tolist(), finalist_ranks.tolist()):
+        ranks[nodes[k]] = rank
+    return ranks
 
-    # tokenizing for words
-    sentences = [sentence for sentence in split_multi(text)]
 
-    stemmer = snowballstemmer.stemmer(LANG_CODES.get(lang_code, 'english'))
+def graph_ranks(words, indexes, out_weights=None):
+    """
+    Ranks sentences by PageRank of their similarity graph.
+
+    :param words: list of sets of sentences' stems
+    :param indexes: indexes of the sentences in the text
+    :param out_weights: dict to put the sums of the similarities of the ranked sentences in by index
+    :return: dict of ranks by sentence index, sentences without any similar sentence are omitted
+    """
+    weights = similarity_matrix(words)
+
+    # sentences without any similar sentence are not in the graph
+    in_graph = np.flatnonzero(weights.any(axis=1))
+    ranks = pagerank(weights[np.ix_(in_graph, in_graph)])
+    if out_weights is not None:
+        out_weights.update(zip((indexes[i] for i in in_graph.tolist()), weights[in_graph].sum(axis=1).tolist()))
+    return dict((indexes[i], rank) for i, rank in zip(in_graph.tolist(), ranks.tolist()))
+
+
+def incidence_matrix(words):
+    """
+    Maps stems to integer ids and builds the sentence x term incidence matrix.
+
+    :param words: list of sets of sentences' stems
+    :return: matrix with 1 where the sentence contains the term
+    """
+    vocabulary = {}
+    rows = []
+    cols = []
+    for i, stems in enumerate(words):
+        for stem in stems:
+            rows.append(i)
+            cols.append(vocabulary.setdefault(stem, len(vocabulary)))
+
+    incidence = np.zeros((len(words), len(vocabulary)), dtype=np.float32)
+    incidence[rows, cols] = 1
+    return incidence
+
+
+def similarity_matrix(words):
+    """
+    Calculates similarity of every pair of sentences at once: the size of the intersection of their stems
+    divided by the sum of their sizes.
+
+    :param words: list of sets of sentences' stems
+    :return: square matrix of similarities with zero diagonal
+    """
+    incidence = incidence_matrix(words)
+
+    # sizes of intersections are exact integers in float32 for any realistic vocabulary
+    intersections = np.dot(incidence, incidence.T).astype(np.float64)
+    sizes = incidence.sum(axis=1).astype(np.float64)
+    total = sizes[:, None] + sizes[None, :]
+
+    weights = np.divide(intersections, total, out=np.zeros_like(intersections), where=total > 0)
+    np.fill_diagonal(weights, 0.0)
+    return weights
+
+
+def pagerank(weights, alpha=PAGERANK_ALPHA, max_iter=PAGERANK_MAX_ITER, tol=PAGERANK_TOL):
+    """
+    PageRank of a weighted undirected graph by power iteration, the same algorithm networkx uses.
+
+    :param weights: square symmetric matrix of edge weights
+    :param alpha: damping factor
+    :param max_iter: maximum quantity of iterations
+    :param tol: convergence tolerance per node
+    :return: vector of ranks
+    """
+    n = weights.shape[0]
+    if n == 0:
+        return np.zeros(0)
+
+    # transition matrix: every node spreads its rank proportionally to the edge weights
+    out_weights = weights.sum(axis=1)
+    dangling = out_weights == 0
+    out_weights[dangling] = 1.0
+    transition = weights / out_weights[:, None]
+
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        x_last = x
+        x = alpha * (np.dot(x, transition) + x[dangling].sum() / n) + (1 - alpha) / n
+        if np.abs(x - x_last).sum() < n * tol:
+            break
+    return x
+
+
+class SummarizationEngine(object):
+    """
+    Strategy of ranking sentences for summaries
+    """
+    name = None
+
+    def score(self, sentences, language):
+        """
+        Scores the sentences, the higher the more important
+
+        :param sentences: list of Sentence
+        :param language: snowball language name of the text
+        :return: dict of scores by sentence index, unscored sentences are omitted and never get into summaries
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '<%s>' % self.name
+
+
+class LeadEngine(SummarizationEngine):
+    """
+    Takes the leading sentences: news articles usually start with the gist. O(n), no text analysis at all.
+    """
+    name = 'lead'
 
-    words = [set(stemmer.stemWord(word) for word in word_tokenizer(sentence.lower()) if word.isalpha())
-             for sentence in sentences]
+    def score(self, sentences, language):
+        qty = float(len(sentences))
+        return dict((i, (qty - i) / qty) for i in range(len(sentences)))
 
-    pairs = combinations(range(len(sentences)), 2)
-    scores = [(i, j, similarity(words[i], words[j])) for i, j in pairs]
-    scores = filter(lambda x: x[2], scores)
 
-    g = nx.Graph()
-    g.add_weighted_edges_from(scores)
-    pr = nx.pagerank(g)
+class CentroidEngine(SummarizationEngine):
+    """
+    Scores sentences by cosine similarity of their TF-IDF vectors to the centroid of the text.
+    Linear in the quantity of sentences and terms.
+    """
+    name = 'centroid'
+
+    def score(self, sentences, language):
+        stem = get_stem_function(language)
+        words = [sentence_stems(sentence.text, stem) for sentence in sentences]
+
+        incidence = incidence_matrix(words).astype(np.float64)
+        if incidence.size == 0:
+            return {}
+
+        # terms met in every sentence carry no information
+        idf = np.log(len(words) / incidence.sum(axis=0))
+        vectors = incidence * idf
+        centroid = vectors.mean(axis=0)
+
+        norms = np.sqrt((vectors ** 2).sum(axis=1)) * np.sqrt(np.dot(centroid, centroid))
+        scores = np.divide(np.dot(vectors, centroid), norms, out=np.zeros(len(words)), where=norms > 0)
+        return dict((i, score) for i, score in enumerate(scores.tolist()) if score > 0)
+
+
+class TextRankEngine(SummarizationEngine):
+    """
+    TextRank on the graph of sentences similarity. Quadratic in the quantity of sentences up to
+    LONG_TEXT_SENTENCES, linear in chunks above it.
+    """
+    name = 'textrank'
+
+    def score(self, sentences, language):
+        stem = get_stem_function(language)
+        return rank_sentences([sentence_stems(sentence.text, stem) for sentence in sentences])
+
+
+LEAD_ENGINE = LeadEngine()
+CENTROID_ENGINE = CentroidEngine()
+TEXTRANK_ENGINE = TextRankEngine()
+
+ENGINES = dict((engine.name, engine) for engine in (LEAD_ENGINE, CENTROID_ENGINE, TEXTRANK_ENGINE))
+
+
+class EnginePolicy(object):
+    """
+    Picks a summarization engine for a text by its quantity of sentences and time left for the document
+    """
 
-    return sorted(((i, pr[i], s) for i, s in enumerate(sentences) if i in pr),
-                  key=lambda x: pr[x[0]], reverse=True), lang_code
+    def __init__(self, engine=TEXTRANK_ENGINE, long_text_sentences=None, long_text_engine=CENTROID_ENGINE,
+                 hurry_seconds=None, hurry_engine=LEAD_ENGINE):
+        """
+        :param engine: engine for regular texts, an instance or its name
+        :param long_text_sentences: texts with more sentences are ranked by long_text_engine, None to disable
+        :param long_text_engine: engine for long texts, an instance or its name
+        :param hurry_seconds: if less time is left for the document, hurry_engine is used, None to disable
+        :param hurry_engine: engine to use in a hurry, an instance or its name
+        """
+        self.engine = get_engine(engine)
+        self.long_text_sentences = long_text_sentences
+        self.long_text_engine = get_engine(long_text_engine)
+        self.hurry_seconds = hurry_seconds
+        self.hurry_engine = get_engine(hurry_engine)
+
+    def choose(self, sentences_qty, time_left=None):
+        """
+        :param sentences_qty: quantity of sentences of the text
+        :param time_left: seconds left to perform the document, None if unlimited
+        :return: SummarizationEngine
+        """
+        if self.hurry_seconds is not None and time_left is not None and time_left < self.hurry_seconds:
+            return self.hurry_engine
+        if self.long_text_sentences is not None and sentences_qty > self.long_text_sentences:
+            return self.long_text_engine
+        return self.engine
+
+    def fingerprint(self):
+        """
+        :return: string identifying the engines and the thresholds of the policy
+        """
+        return repr((self.engine.name or type(self.engine).__name__, self.long_text_sentences,
+                     self.long_text_engine.name or type(self.long_text_engine).__name__, self.hurry_seconds,
+                     self.hurry_engine.name or type(self.hurry_engine).__name__))
+
+
+def get_engine(engine):
+    """
+    :param engine: SummarizationEngine or its name
+    :return: SummarizationEngine
+    """
+    if isinstance(engine, SummarizationEngine):
+        return engine
+    try:
+        return ENGINES[engine]
+    except KeyError:
+        raise ValueError("Unknown summarization engine %s" % engine)
+
+
+def get_policy(summarizer):
+    """
+    :param summarizer: EnginePolicy, SummarizationEngine, its name or None for the default policy
+    :return: EnginePolicy
+    """
+    if summarizer is None:
+        return DEFAULT_POLICY
+    if isinstance(summarizer, EnginePolicy):
+        return summarizer
+    return EnginePolicy(engine=summarizer)
+
+
+DEFAULT_POLICY = EnginePolicy()
 
 
 def create_referat(text, hdr, n=5):
     tr, lang_code = textrank(text, hdr)
-    if n > len(tr):
-        n = len(tr)
-    top_n = sorted(tr[:n])
-    return ' '.join(x[2] for x in top_n), lang_code, len(top_n)
+    summary, qty = pick_summary(tr, n)
+    return summary, lang_code, qty
+
+
+def pick_summary(tr, n=5):
+    """
+    Forms a summary of the top ranked sentences in their original order.
+
+    :param tr: list of (index, rank, sentence text) sorted by rank
+    :param n: maximum quantity of sentences
+    :return: summary text, quantity of its sentences
+    """
+    ranking = [RankedSentence(text, score, 0, i) for i, score, text in tr]
+    return summarize_ranking(ranking, n), min(max(n, 0), len(ranking))
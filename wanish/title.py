@@ -1,27 +1,41 @@
 import binascii
+from collections import Counter
 
 
 # Searching short title from readability implementation
 import re
 
+from wanish.entities import Replacer
+from wanish.layout import find_by_path
+
+SHINGLE_LENGTH = 3  # length of a shingle in characters
+
+MIN_TITLE_SIMILARITY = 50  # minimal similarity of a candidate to the <title> text, in percents
+
+# single characters replaced while normalizing a title
+ENTITIES_TABLE = str.maketrans({
+    '—': '-',
+    '–': '-',
+    '«': '"',
+    '»': '"',
+    '\xa0': ' ',
+})
+
+# escaped entities replaced while normalizing a title
+ESCAPED_TITLE_ENTITIES = (
+    ('&mdash;', '-'),
+    ('&ndash;', '-'),
+    ('&quot;', '"'),
+)
+
+unescape_title_entities = Replacer(ESCAPED_TITLE_ENTITIES)
+
+PUNCTUATION_TABLE = str.maketrans('', '', '!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~')
+
 
 def normalize_entities(cur_title):
-    entities = {
-        '—': '-',
-        '–': '-',
-        '&mdash;': '-',
-        '&ndash;': '-',
-        ' ': ' ',
-        '«': '"',
-        '»': '"',
-        '&quot;': '"',
-        '\xa0': ' ',
-    }
-    for c in entities:
-        if c in cur_title:
-            cur_title = cur_title.replace(c, entities[c])
-
-    return cur_title
+    cur_title = cur_title.translate(ENTITIES_TABLE)
+    return unescape_title_entities(cur_title)
 
 
 def normalize_spaces(s):
@@ -36,7 +50,7 @@ def normalize_spaces(s):
 def remove_punctuation(s):
     if not s:
         return ''
-    return ''.join([l for l in s if l not in '!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'])
+    return s.translate(PUNCTUATION_TABLE)
 
 
 def norm_title(title):
@@ -81,20 +95,82 @@ def compare(initial, candidate):
     return matches * 2 / float(len(initial) + len(candidate)) * 100
 
 
-def shorten_title(doc, article_node):
+def shingle_counts(clean_text):
     """
-    Finding title
-    :param doc: full initial document
-    :param article_node: node containing article
-    :return: found title
+    Counts shingles of the text, the shingles are its substrings of SHINGLE_LENGTH characters.
+    :param clean_text: cleaned text
+    :return: Counter of shingles
+    """
+    return Counter(clean_text[idx:idx + SHINGLE_LENGTH] for idx in range(len(clean_text) - SHINGLE_LENGTH + 1))
+
+
+class TitleMatcher(object):
+    """
+    Compares candidate texts to the title the same way as compare() does with shingles sequences,
+    but looks the candidate's shingles up in a set and skips candidates, which are too short to reach
+    the minimal similarity.
     """
 
+    def __init__(self, clean_title):
+        """
+        :param clean_title: normalized title
+        """
+        self.counts = shingle_counts(clean_title)
+        self.qty = sum(self.counts.values())
+        max_count = max(self.counts.values()) if self.counts else 0
+
+        # similarity >= MIN_TITLE_SIMILARITY requires matches >= (qty + candidate_qty) * MIN_TITLE_SIMILARITY / 200,
+        # and every shingle of a candidate matches max_count title shingles at most,
+        # so a candidate needs at least this quantity of shingles
+        ratio = MIN_TITLE_SIMILARITY / 200.0
+        per_shingle = max_count - ratio
+        self.min_qty = self.qty * ratio / per_shingle if per_shingle > 0 else float('inf')
+
+    def similarity(self, candidate):
+        """
+        :param candidate: stripped text of a candidate element
+        :return: similarity in percents, 0 if the candidate can not reach the minimal similarity
+        """
+        # normalization never makes a text longer
+        if len(candidate) - SHINGLE_LENGTH + 1 < self.min_qty:
+            return 0
+
+        clean_candidate = norm_title(candidate)
+        qty = len(clean_candidate) - SHINGLE_LENGTH + 1
+        if qty < self.min_qty:
+            return 0
+
+        shingles = set(clean_candidate[idx:idx + SHINGLE_LENGTH] for idx in range(qty))
+        matches = sum(self.counts[shingle] for shingle in shingles if shingle in self.counts)
+        return matches * 2 / float(self.qty + qty) * 100
+
+
+def get_title(doc):
+    """
+    Getting text of the document's <title> tag
+    :param doc: full initial document
+    :return: stripped title text, empty if there is no title
+    """
     title = doc.find('.//title')
     if title is None or title.text is None or len(title.text) == 0:
         return ''
 
-    title = title.text.strip()
-    title_shingles = shinglify(norm_title(title))
+    return title.text.strip()
+
+
+def shorten_title(doc, article_node, title_path=None):
+    """
+    Finding title
+    :param doc: full initial document
+    :param article_node: node containing article
+    :param title_path: signature path of the title node learned on another page of the site, it is checked first
+    :return: found title
+    """
+
+    title = get_title(doc)
+    if not title:
+        return '', None
+    matcher = TitleMatcher(norm_title(title))
 
     candidates = []
     search_tree = None
@@ -103,6 +179,21 @@ def shorten_title(doc, article_node):
     if len(body) > 0:
         search_tree = body[0].iter()
 
+    if title_path is not None and search_tree is not None:
+        elem = find_by_path(doc, title_path)
+        if elem is not None and elem.text is not None:
+            candidate = elem.text.strip()
+            if 0 < len(candidate) <= len(title):
+                similarity = matcher.similarity(candidate)
+                if similarity >= MIN_TITLE_SIMILARITY:
+                    # the learned title node holds, the document is not searched
+                    candidates.append({
+                        'text': candidate,
+                        'similarity': similarity,
+                        'element': elem,
+                    })
+                    search_tree = ()
+
     if search_tree is not None:
 
         for elem in search_tree:
@@ -112,8 +203,8 @@ def shorten_title(doc, article_node):
             if elem.text is not None:
                 candidate = elem.text.strip()
                 if 0 < len(candidate) <= len(title):
-                    similarity = compare(title_shingles, shinglify(norm_title(candidate)))
-                    if similarity >= 50:
+                    similarity = matcher.similarity(candidate)
+                    if similarity >= MIN_TITLE_SIMILARITY:
                         candidates.append({
                             'text': candidate,
                             'similarity': similarity,